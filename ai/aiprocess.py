@@ -1,31 +1,174 @@
 import os
-from random import seed, randint
+import sys
 
 from twisted.internet import reactor
 from twisted.internet import stdio
-from twisted.logger import Logger
+from twisted.logger import globalLogBeginner, Logger, LogLevel
 from twisted.protocols import basic
-from twisted.python import log
-from twisted.python.logfile import DailyLogFile
+from twisted.python import log, usage
+
+# configures the python source path for this module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+
+from ai.logsink import PipeLogObserver
+from ai.mcts import MonteCarloSearch
+from ai.parallel import ParallelAlphaBeta, ParallelMonteCarlo, SearchPool
+from ai.search import AlphaBetaSearch, OPPONENT
+from ai.tablebase import Tablebase
+from ai.ttable import TranspositionTable
+from common.constants import Engine
+from common.tracing import tracer, traceOption
+from model.board import Board
+
+
+# the time budget of a move, in seconds
+DEFAULT_TIME_LIMIT = 2.0
+
+
+class AiGame(object):
+    """The state of one game played by the AI process.
+
+    Attributes:
+        uuid (str): The UUID of the game.
+        symbol (int): The symbol of the AI player.
+        depth (int): The search depth (0 deepens until the time budget
+            runs out or the game ends).
+        board (model.board.Board): The AI's copy of the board.
+        engine (ai.search.AlphaBetaSearch | ai.mcts.MonteCarloSearch):
+            The search engine (or its parallel version, see ai.parallel).
+        useTablebase (bool): True if the moves are looked up in the
+            tablebase instead of being searched.
+        nodes (int): The number of nodes (or playouts) searched for the
+            last move.
+    """
+
+    log = Logger()
+
+    def __init__(self, uuid, symbol, depth, size, winLength,
+                 tablebase=None, table=None, timeLimit=DEFAULT_TIME_LIMIT,
+                 engine=Engine.AlphaBeta, playouts=None, searchPool=None):
+        self.uuid = uuid
+        self.symbol = symbol
+        self.depth = depth
+        self.board = Board(size, winLength)
+        if searchPool is not None and engine == Engine.Mcts:
+            self.engine = ParallelMonteCarlo(searchPool, playouts=playouts,
+                                             timeLimit=timeLimit)
+        elif searchPool is not None and engine == Engine.AlphaBeta:
+            self.engine = ParallelAlphaBeta(searchPool, maxDepth=depth,
+                                            timeLimit=timeLimit)
+        elif engine == Engine.Mcts:
+            self.engine = MonteCarloSearch(playouts=playouts,
+                                           timeLimit=timeLimit)
+        elif engine == Engine.AlphaBeta:
+            self.engine = AlphaBetaSearch(maxDepth=depth,
+                                          timeLimit=timeLimit,
+                                          table=table)
+        else:
+            raise ValueError('Unknown engine: %s' % (engine))
+
+        self.useTablebase = tablebase is not None and \
+            engine == Engine.AlphaBeta and \
+            size == 3 and winLength == 3 and depth <= 0
+        self.nodes = 0
+        self._tablebase = tablebase
+
+    def reply(self, row, col):
+        """Plays the opponent's move and the AI reply on the board.
+
+        Args:
+            row (int): The row of the opponent's move (-1 if the AI
+                player moves first).
+            col (int): The column of the opponent's move.
+
+        Returns:
+            int: The cell of the AI move (``row * size + col``); -1 if
+                the game is over.
+
+        """
+        board = self.board
+        opponent = OPPONENT[self.symbol]
+
+        if (row != -1) and (col != -1):
+            board.makeMove(row * board.size + col, opponent)
+
+        if board.isFull() or board.isWinner(opponent):
+            return -1
+
+        hit = None
+        if self.useTablebase:
+            hit = self._tablebase.probe(board, self.symbol)
+
+        if hit is not None:
+            m, value = hit
+            self.nodes = 0
+            self.log.debug('tablebase move: {m} (value {value})',
+                           m=m, value=value)
+        else:
+            m, score = self.engine.bestMove(board, self.symbol)
+            self.nodes = self.engine.nodes
+            self.log.debug('selected position: {m} (score {score}, '
+                           'depth {depth}, {nodes} nodes)',
+                           m=m, score=score, depth=self.engine.depthReached,
+                           nodes=self.nodes)
+
+        board.makeMove(m, self.symbol)
+        return m
+
+    def undo(self, count):
+        """Takes back the last moves of the game.
+
+        Args:
+            count (int): The number of moves (both sides' moves count).
+
+        Raises:
+            IndexError: If the game has less moves.
+
+        """
+        for _ in xrange(count):
+            self.board.unmakeMove()
 
 
 class AiPlayerProtocol(basic.LineReceiver):
     """
     The AI process Standard IO protocol.
+
+    Every command carries the UUID of its game, so one process can play
+    many games at once (see the --pool option); otherwise the process
+    stops when its game quits.
     """
 
     delimiter = '\n'
     log = Logger()
 
-    def __init__(self):
-        self.uuid = None
-        self.symbol = None
-        self.depth = None
-        self._moves = list(xrange(9))
+    def __init__(self, tablebase=None, table=None, persistent=False,
+                 searchPool=None):
+        """
+        Args:
+            tablebase (Optional[ai.tablebase.Tablebase]): The 3x3
+                tablebase, used instead of the search when the game asks
+                for perfect play (depth 0).
+            table (Optional[ai.ttable.TranspositionTable]): The
+                transposition table of the search, shared by the games.
+            persistent (Optional[bool]): If True the process keeps running
+                when its games quit (default is False).
+            searchPool (Optional[ai.parallel.SearchPool]): The worker
+                processes the searches are split across (default is to
+                search in this process).
+        """
+        self.games = dict()
+        self.persistent = persistent
+        self._tablebase = tablebase
+        self._table = table
+        self._searchPool = searchPool
 
     def connectionMade(self):
         self.log.info('AI Process has connected to pipes.')
 
+        # everything is loaded: the process can take a game now
+        self.sendLine('READY')
+
     def lineReceived(self, line):
         self.log.debug('line: {line:s}', line=line)
         # do not process the blank lines
@@ -48,81 +191,168 @@ class AiPlayerProtocol(basic.LineReceiver):
                 method(*args)
             except Exception, e:
                 self.log.failure('Exception caught: {e}', e=e)
-                self.sendLine('Error: ' + str(e))
+                # the game of the command, if any, is told apart
+                self.sendLine(' '.join(['Error:'] + args[:1] + [str(e)]))
 
     def connectionLost(self, reason):
         self.log.info('Connection lost from {peer:s}',
                       peer=self.transport.getPeer())
 
-    def _do_init(self, gameUuid, symbol, depth):
-        self._createLogFile(gameUuid)
+        if reactor.running:
+            # the game server has gone: nobody is left to serve
+            reactor.stop()
 
-        self.log.debug('uuid {uuid}, symbol {symbol}, depth {depth}',
-                       uuid=gameUuid, symbol=symbol, depth=depth)
+    def _do_init(self, gameUuid, symbol, depth, *options):
+        self.log.debug('uuid {uuid}, symbol {symbol}, depth {depth}, '
+                       'options {options}',
+                       uuid=gameUuid, symbol=symbol, depth=depth,
+                       options=options)
 
-        self.uuid = gameUuid
-        self.symbol = int(symbol)
-        self.depth = int(depth)
+        options = parseOptions(options)
+        size = int(options.get('size', 3))
+        winLength = int(options.get('win', size))
+        timeLimit = float(options.get('time', DEFAULT_TIME_LIMIT))
+        engine = options.get('engine', Engine.AlphaBeta)
+        playouts = options.get('playouts')
+        if playouts is not None:
+            playouts = int(playouts)
 
-    def _do_move(self, gameUuid, row, col):
-        self.log.debug('_do_move: uuid {uuid}, human move ({row}, {col})',
-                       uuid=gameUuid, row=row, col=col)
-
-        if len(self._moves) == 0:
-            self.log.error('_do_move: no more available moves')
-            return
+        self.games[gameUuid] = AiGame(gameUuid, int(symbol), int(depth),
+                                      size, winLength,
+                                      self._tablebase, self._table,
+                                      timeLimit, engine, playouts,
+                                      self._searchPool)
 
-        self.log.debug('_moves before: {moves}', moves=self._moves)
+    def _do_move(self, gameUuid, row, col, *options):
+        """Handles the human move and replies with the AI move.
 
-        i, j = int(row), int(col)
-        self._moves.remove(i * 3 + j)
+        The coordinates (-1, -1) mean that the AI player moves first.
+        The 'trace=' option, if any, is sent back with the reply.
+        """
+        self.log.debug('_do_move: uuid {uuid}, human move ({row}, {col})',
+                       uuid=gameUuid, row=row, col=col)
 
-        # choose the move randomly
-        self.log.debug('len(self._moves) = {l}', l=len(self._moves))
+        traceId = parseOptions(options).get('trace')
+        tracer.span(traceId, 'ai.received')
 
-        if len(self._moves) == 0:
+        game = self.games[gameUuid]
+        m = game.reply(int(row), int(col))
+        if m == -1:
             self.log.debug('there is no available solution')
-            self.sendLine("MOVE {uuid} {row:d} {col:d}".format(uuid=gameUuid,
-                                                               row=-1,
-                                                               col=-1))
-            return
+            row = col = -1
         else:
-            seed()
-            n = randint(0, len(self._moves) - 1)
-            m = self._moves[n]
+            row, col = divmod(m, game.board.size)
 
-        self._moves.remove(m)
-
-        self.log.debug('selected position: {m}', m=m)
-        self.log.debug('_moves after: {moves}', moves=self._moves)
+        tracer.span(traceId, 'ai.replied', nodes=game.nodes)
 
         # send back the response
-        self.sendLine("MOVE {uuid} {row:d} {col:d}".format(uuid=gameUuid,
-                                                           row=m / 3,
-                                                           col=m % 3))
+        self.sendLine("MOVE {uuid} {row:d} {col:d}{trace}".format(
+            uuid=gameUuid, row=row, col=col, trace=traceOption(traceId)))
+
+    def _do_undo(self, gameUuid, count):
+        """Takes back the last moves of a game."""
+        self.log.debug('_do_undo: uuid {uuid}, {count} moves',
+                       uuid=gameUuid, count=count)
+        self.games[gameUuid].undo(int(count))
 
     def _do_quit(self, uuid):
         self.log.debug("Quitting the game {uuid}", uuid=uuid)
-        self.transport.loseConnection()
-        reactor.stop()
+        self.games.pop(uuid, None)
+
+        if not self.persistent:
+            # connectionLost stops the reactor
+            self.transport.loseConnection()
+
+
+def parseOptions(options):
+    """Parses the 'name=value' options of a command.
+
+    Args:
+        options (list[str]): The option tokens.
+
+    Returns:
+        dict: The option values (as strings) keyed by name.
 
-    def _createLogFile(self, uuid):
-        logDirPath = '{cwd}\\..\\logs\\aiprocesses'.format(cwd=os.getcwd())
-        if not os.path.exists(logDirPath):
-            os.mkdir(logDirPath)
+    Raises:
+        ValueError: If a token is not a 'name=value' pair.
 
-        logFilePath = '{dir}\\{uuid}.log'.format(dir=logDirPath, uuid=uuid)
-        log.startLogging(DailyLogFile.fromFullPath(logFilePath))
+    """
+    result = dict()
+    for option in options:
+        name, sep, value = option.partition('=')
+        if not sep or not name:
+            raise ValueError('Malformed option: %s' % (option))
+
+        result[name.lower()] = value
+
+    return result
+
+
+class Options(usage.Options):
+    """The command line options of the AI process."""
+
+    optFlags = [
+        ['pool', None, 'Serve many games and keep running when they quit.'],
+    ]
+
+    optParameters = [
+        ['tt-size', None, TranspositionTable.DEFAULT_BYTES // (1024 * 1024),
+         'The memory budget of the transposition table, in MB.', int],
+        ['search-workers', None, 1,
+         'The processes a search is split across (1 searches in the AI '
+         'process).', int],
+        ['trace-file', None, None,
+         'The file the spans of the traced moves are appended to.'],
+        ['log-level', None, 'info',
+         'The least level of the log events written to stderr (the game '
+         'server gathers them in one file).'],
+    ]
+
+    def postOptions(self):
+        if self['search-workers'] < 1:
+            raise usage.UsageError('Bad number of search workers: %d' %
+                                   (self['search-workers']))
+
+        try:
+            self['log-level'] = LogLevel.lookupByName(self['log-level'])
+        except ValueError:
+            raise usage.UsageError('Unknown log level: %s' %
+                                   (self['log-level']))
 
 
 def main():
     """The main function.
     """
+    options = Options()
+    options.parseOptions()
+
+    tableBytes = options['tt-size'] * 1024 * 1024
+    searchPool = None
+    if options['search-workers'] > 1:
+        # the workers are forked before the reactor runs
+        searchPool = SearchPool(options['search-workers'], tableBytes)
 
-    stdio.StandardIO(AiPlayerProtocol())
+    # the log events are written in batches, between the replies
+    observer = PipeLogObserver(level=options['log-level'])
+    globalLogBeginner.beginLoggingTo([observer], redirectStandardIO=False)
+    observer.start()
+    reactor.addSystemEventTrigger('after', 'shutdown', observer.stop)
+
+    # the workers have the tables of the split searches
+    table = TranspositionTable(tableBytes) if searchPool is None else None
+    if options['trace-file']:
+        tracer.open(options['trace-file'])
+
+    stdio.StandardIO(AiPlayerProtocol(Tablebase.open(), table,
+                                      persistent=bool(options['pool']),
+                                      searchPool=searchPool))
     reactor.run()
 
+    if searchPool is not None:
+        searchPool.close()
+
     log.msg('Bye !')
+    observer.flush()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,240 @@
+# -------------------------------------
+# logsink.py
+# The logs of the AI processes, gathered in one file by the game server.
+#
+# An AI process queues its log events and writes them in batches to its
+# stderr pipe; the game server reads the pipes of all the AI processes
+# into one queue, written in batches to one rotating file by a thread.
+# -------------------------------------
+
+import errno
+import os
+from collections import deque
+
+from twisted.internet import defer, fdesc, task, threads
+from twisted.logger import formatEventAsClassicLogText, LogLevel
+from twisted.python import failure
+from twisted.python.logfile import LogFile
+
+from common import logs, metrics
+
+
+# the seconds between two batches
+FLUSH_INTERVAL = 0.5
+
+# the records queued at most; the records beyond are dropped
+MAX_QUEUE = 10000
+
+
+class PipeLogObserver(object):
+    """The log observer of an AI process: writes the events to a pipe.
+
+    The events are queued as they are; they are formatted and written
+    when the queue is flushed, between the replies of the process. The
+    pipe is not blocking: what it cannot take waits for the next flush.
+
+    Attributes:
+        dropped (int): The number of events dropped because the queue
+            was full.
+    """
+
+    def __init__(self, fd=2, level=LogLevel.info, maxQueue=MAX_QUEUE,
+                 flushInterval=FLUSH_INTERVAL):
+        """
+        Args:
+            fd (Optional[int]): The pipe (default is stderr).
+            level (Optional[twisted.logger.LogLevel]): The least level
+                written.
+            maxQueue (Optional[int]): The events queued at most.
+            flushInterval (Optional[float]): The seconds between two
+                flushes.
+        """
+        self.dropped = 0
+        self._fd = fd
+        self._level = level
+        self._maxQueue = maxQueue
+        self._events = deque()
+        self._pending = ''
+        self._reported = 0
+        self._loop = task.LoopingCall(self.flush)
+        self._flushInterval = flushInterval
+
+        fdesc.setNonBlocking(fd)
+
+    def start(self):
+        self._loop.start(self._flushInterval, now=False)
+
+    def stop(self):
+        if self._loop.running:
+            self._loop.stop()
+        self.flush()
+
+    def __call__(self, event):
+        if event.get('log_level', LogLevel.info) < self._level:
+            return
+
+        if len(self._events) >= self._maxQueue:
+            self.dropped += 1
+            return
+
+        self._events.append(event)
+
+    def flush(self):
+        """Writes the queued events to the pipe, as much as it takes."""
+        if not self._pending:
+            # an event without text is formatted as None
+            lines = [line for line in map(formatEventAsClassicLogText,
+                                          self._events)
+                     if line is not None]
+            self._events.clear()
+
+            if self.dropped != self._reported:
+                lines.append('{0:d} log events dropped\n'.format(
+                    self.dropped - self._reported))
+                self._reported = self.dropped
+
+            self._pending = ''.join(lines)
+
+        if not self._pending:
+            return
+
+        try:
+            written = os.write(self._fd, self._pending)
+        except OSError, e:
+            if e.errno not in (errno.EAGAIN, errno.EINTR):
+                # nobody reads the pipe anymore
+                written = len(self._pending)
+            else:
+                written = 0
+
+        self._pending = self._pending[written:]
+
+
+QUEUED = metrics.gauge('tictactoe_ai_log_queued',
+                       'The AI process log lines waiting to be written.')
+DROPPED = metrics.counter('tictactoe_ai_log_dropped_total',
+                          'The AI process log lines dropped because the '
+                          'queue was full.')
+
+
+class AiLogSink(object):
+    """The log file shared by the AI processes, in the game server.
+
+    The protocols of the AI processes feed it what the processes write to
+    stderr (see ``feed``). The lines are queued, and written in batches
+    to a rotating file by a thread of the reactor, so the reactor never
+    waits for the disk. The queue is bounded: the lines beyond are
+    dropped, and counted.
+
+    Attributes:
+        dropped (int): The number of lines dropped.
+    """
+
+    log = logs.Logger('ai')
+
+    def __init__(self, maxQueue=MAX_QUEUE, flushInterval=FLUSH_INTERVAL,
+                 rotateLength=10 * 1024 * 1024, maxRotatedFiles=5):
+        self.dropped = 0
+        self._maxQueue = maxQueue
+        self._flushInterval = flushInterval
+        self._rotateLength = rotateLength
+        self._maxRotatedFiles = maxRotatedFiles
+        self._lines = deque()
+        self._file = None
+        self._writing = None
+        self._loop = task.LoopingCall(self.flush)
+
+        QUEUED.function = lambda: len(self._lines)
+
+    def open(self, path):
+        """Starts writing the lines to a file.
+
+        Args:
+            path (str): The path of the file; its directory is created if
+                missing.
+
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._file = LogFile.fromFullPath(
+            path, rotateLength=self._rotateLength,
+            maxRotatedFiles=self._maxRotatedFiles)
+        self._loop.start(self._flushInterval, now=False)
+
+    def close(self):
+        """Writes the last lines and closes the file.
+
+        Returns:
+            Deferred: Fires once the file is closed.
+
+        """
+        if self._file is None:
+            return defer.succeed(None)
+
+        if self._loop.running:
+            self._loop.stop()
+
+        d = self._writing or defer.succeed(None)
+        d.addCallback(lambda _: self._closeFile())
+        return d
+
+    def feed(self, buffered, source):
+        """Queues the complete lines read from the pipe of an AI process.
+
+        Args:
+            buffered (str): The data read, after what was left from the
+                last read.
+            source (str): The label of the AI process.
+
+        Returns:
+            str: The incomplete last line, to be completed by the next
+                read.
+
+        """
+        lines = buffered.split('\n')
+        rest = lines.pop()
+        if self._file is None:
+            return rest
+
+        for line in lines:
+            if len(self._lines) >= self._maxQueue:
+                self.dropped += 1
+                DROPPED.inc()
+            else:
+                self._lines.append('[{0}] {1}\n'.format(source, line))
+
+        return rest
+
+    def flush(self):
+        """Hands the queued lines to a thread, unless a batch is written."""
+        if self._writing is not None or not self._lines:
+            return
+
+        batch = ''.join(self._lines)
+        self._lines.clear()
+
+        self._writing = threads.deferToThread(self._write, batch)
+        self._writing.addBoth(self._written)
+
+    def _write(self, batch):
+        self._file.write(batch)
+        self._file.flush()
+
+    def _written(self, result):
+        self._writing = None
+        if isinstance(result, failure.Failure):
+            self.log.failure('Failed to write the AI process logs',
+                             result)
+
+    def _closeFile(self):
+        if self._lines:
+            self._write(''.join(self._lines))
+            self._lines.clear()
+
+        self._file.close()
+        self._file = None
+
+
+sink = AiLogSink()
@@ -0,0 +1,298 @@
+# -------------------------------------
+# mcts.py
+# The Monte Carlo tree search engine of the AI player.
+# -------------------------------------
+
+import math
+import random
+import time
+
+from ai.search import OPPONENT, bits, candidates, lineWeights, rateMoves
+from common.constants import Symbol
+
+
+class Node(object):
+    """A position of the search tree.
+
+    Attributes:
+        move (int): The move which leads to the position (-1 at the root).
+        symbol (int): The side which played ``move``.
+        parent (Node): The previous position (None at the root).
+        children (list[Node]): The positions expanded so far.
+        untried (list[int]): The moves not expanded yet, the most
+            promising last.
+        visits (int): The number of playouts through the position.
+        wins (float): The playouts won by ``symbol`` (a draw counts 1/2).
+        winner (int): The side which has won in the position, Symbol.Empty
+            for a draw and None if the game goes on.
+    """
+
+    __slots__ = ('move', 'symbol', 'parent', 'children', 'untried',
+                 'visits', 'wins', 'winner')
+
+    def __init__(self, move, symbol, parent, untried, winner=None):
+        self.move = move
+        self.symbol = symbol
+        self.parent = parent
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.wins = 0.0
+        self.winner = winner
+
+
+class MonteCarloSearch(object):
+    """Monte Carlo tree search with the UCT selection.
+
+    Each playout walks down the tree, choosing the children with the UCB1
+    formula, adds one position to the tree and plays the game on to its
+    end (or for ``ROLLOUT_PLIES``) from there. The move played is the
+    most visited move of the root.
+
+    The rollout policy is 'random' (any move next to the symbols) or
+    'heuristic': the best rated move (see ai.search.rateMoves), which
+    completes or blocks the longest lines; the ties are broken at random.
+
+    The tree is kept between the moves: the next search starts from the
+    subtree of the opponent's reply, if the search had expanded it.
+
+    Like AlphaBetaSearch, the search plays the moves on the board it was
+    given and takes them back (see Board.makeMove), so the board is left
+    unchanged.
+
+    Attributes:
+        playouts (int): The number of playouts per move (None means no
+            limit).
+        timeLimit (float): The time budget per move, in seconds (None
+            means no limit).
+        policy (str): The rollout policy, 'heuristic' or 'random'.
+        exploration (float): The exploration constant of UCB1.
+        nodes (int): The number of playouts of the last search.
+        depthReached (int): The depth of the deepest playout of the last
+            search, in the tree.
+        reused (int): The playouts of the last search's root which were
+            run by the search of the previous move.
+        rootStats (list[tuple(int, int, float)]): The move, the visits
+            and the wins of every child of the last search's root.
+    """
+
+    POLICIES = ('heuristic', 'random')
+
+    # the playouts of a move when neither a limit nor a budget is given
+    DEFAULT_PLAYOUTS = 10000
+
+    # a rollout stops after as many moves; the position is then scored
+    ROLLOUT_PLIES = 20
+
+    def __init__(self, playouts=None, timeLimit=None, policy='heuristic',
+                 exploration=math.sqrt(2), seed=None):
+        if policy not in self.POLICIES:
+            raise ValueError('Unknown rollout policy: %s' % (policy))
+
+        self.playouts = playouts
+        self.timeLimit = timeLimit
+        self.policy = policy
+        self.exploration = exploration
+        self.nodes = 0
+        self.depthReached = 0
+        self.reused = 0
+        self.rootStats = []
+        self._random = random.Random(seed)
+        self._weights = None
+        # the tree after the last move: (root, hash of its position)
+        self._tree = None
+
+    def bestMove(self, board, symbol):
+        """Searches the best move for a side.
+
+        Args:
+            board (model.board.Board): The position; it must not be over.
+            symbol (int): The side to move.
+
+        Returns:
+            tuple(int, float): The index (``row * size + col``) of the
+                best move and its rate of won playouts; the index is -1
+                if there are no empty cells left.
+
+        """
+        self.nodes = 0
+        self.depthReached = 0
+        self.rootStats = []
+        self._weights = lineWeights(board.winLength)
+
+        root = self._reuse(board, symbol)
+        self.reused = root.visits if root is not None else 0
+        if root is None:
+            root = Node(-1, OPPONENT[symbol], None,
+                        self._moves(board, symbol))
+
+        if not root.untried and not root.children:
+            self._tree = None
+            return -1, 0.0
+
+        playouts = self.playouts
+        deadline = None
+        if self.timeLimit is not None:
+            deadline = time.time() + self.timeLimit
+        elif playouts is None:
+            playouts = self.DEFAULT_PLAYOUTS
+
+        while playouts is None or self.nodes < playouts:
+            self._playout(board, root)
+            self.nodes += 1
+            if deadline is not None and time.time() > deadline:
+                break
+
+        self.rootStats = [(child.move, child.visits, child.wins)
+                          for child in root.children]
+        best = max(root.children, key=lambda child: child.visits)
+
+        # keeps the subtree of the move for the next search
+        best.parent = None
+        board.makeMove(best.move, symbol)
+        self._tree = (best, board.hash)
+        board.unmakeMove()
+
+        return best.move, best.wins / best.visits
+
+    def reset(self):
+        """Drops the tree kept from the last move."""
+        self._tree = None
+
+    def _reuse(self, board, symbol):
+        """Returns the subtree of the opponent's reply, or None."""
+        if self._tree is None:
+            return None
+
+        node, key = self._tree
+        self._tree = None
+
+        opponent = OPPONENT[symbol]
+        for child in node.children:
+            if board.getCell(child.move) != opponent:
+                continue
+
+            # the position must be the one searched, plus the reply
+            board.setCell(child.move, Symbol.Empty)
+            same = board.hash == key
+            board.setCell(child.move, opponent)
+            if same:
+                child.parent = None
+                return child
+
+        return None
+
+    def _moves(self, board, symbol):
+        """Returns the moves of a position, the most promising last."""
+        rated = rateMoves(board, symbol, candidates(board), self._weights)
+        rated.sort()
+        return [move for _, move in rated]
+
+    def _playout(self, board, root):
+        """Runs one playout from the root and updates the tree."""
+        node = root
+        ply = board.ply
+        c = self.exploration
+
+        # selection: down the fully expanded positions
+        while not node.untried and node.children and node.winner is None:
+            logVisits = math.log(node.visits)
+            node = max(node.children,
+                       key=lambda child: child.wins / child.visits +
+                       c * math.sqrt(logVisits / child.visits))
+            board.makeMove(node.move, node.symbol)
+
+        # expansion: one new position
+        if node.untried and node.winner is None:
+            move = node.untried.pop()
+            symbol = OPPONENT[node.symbol]
+            board.makeMove(move, symbol)
+
+            winner = None
+            if board.isWinner(symbol):
+                winner = symbol
+            elif board.isFull():
+                winner = Symbol.Empty
+
+            child = Node(move, symbol, node,
+                         self._moves(board, OPPONENT[symbol])
+                         if winner is None else [], winner)
+            node.children.append(child)
+            node = child
+
+        self.depthReached = max(self.depthReached, board.ply - ply)
+
+        # simulation
+        winner = node.winner
+        if winner is None:
+            winner = self._rollout(board, OPPONENT[node.symbol])
+
+        while board.ply > ply:
+            board.unmakeMove()
+
+        # backpropagation
+        while node is not None:
+            node.visits += 1
+            if winner == node.symbol:
+                node.wins += 1.0
+            elif winner == Symbol.Empty:
+                node.wins += 0.5
+            node = node.parent
+
+    def _rollout(self, board, symbol):
+        """Plays a game on from the position and takes it back.
+
+        Returns:
+            int: The winner, Symbol.Empty for a draw.
+
+        """
+        ply = board.ply
+        rand = self._random
+        heuristic = self.policy == 'heuristic'
+        winner = None
+
+        try:
+            for _ in xrange(self.ROLLOUT_PLIES):
+                mask = candidates(board)
+                if not mask:
+                    winner = Symbol.Empty
+                    break
+
+                if heuristic:
+                    # the best rated move, the ties broken at random
+                    move = max((rating + rand.random(), m) for rating, m in
+                               rateMoves(board, symbol, mask,
+                                         self._weights))[1]
+                else:
+                    move = rand.choice(list(bits(mask)))
+
+                board.makeMove(move, symbol)
+                if board.isWinner(symbol):
+                    winner = symbol
+                    break
+
+                symbol = OPPONENT[symbol]
+            else:
+                winner = self._judge(board)
+        finally:
+            while board.ply > ply:
+                board.unmakeMove()
+
+        return winner
+
+    def _judge(self, board):
+        """Scores an unfinished rollout: the side with the better lines."""
+        weights = self._weights
+        score = 0
+        for x, o in zip(board.lineCounts(Symbol.X),
+                        board.lineCounts(Symbol.O)):
+            if not o:
+                score += weights[x]
+            elif not x:
+                score -= weights[o]
+
+        if score > 0:
+            return Symbol.X
+        if score < 0:
+            return Symbol.O
+        return Symbol.Empty
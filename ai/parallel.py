@@ -0,0 +1,271 @@
+# -------------------------------------
+# parallel.py
+# The search of one position split across a pool of processes.
+#
+# Alpha-beta: the moves of the root are dealt out to the workers, which
+# search them with iterative deepening; the results are merged at the
+# deepest depth completed by every worker.
+# MCTS: every worker runs its own tree from the root (root parallel); the
+# visits and the wins of the root moves are summed.
+# -------------------------------------
+
+import multiprocessing
+import random
+import signal
+
+from twisted.logger import Logger
+
+from ai.mcts import MonteCarloSearch
+from ai.search import (AlphaBetaSearch, INFINITY, WIN_THRESHOLD, bits,
+                       candidates, lineWeights, rateMoves)
+from ai.ttable import TranspositionTable
+from common.constants import Symbol
+from model.board import Board
+
+
+# the seconds a search may take beyond its budget before it is given up
+GRACE = 5.0
+
+# the transposition table of a worker (see _initWorker)
+_table = None
+
+
+class SearchPool(object):
+    """The worker processes of the parallel searches of an AI process.
+
+    The pool is created before the reactor runs (the workers are forked),
+    and shared by the games of the process. A search which does not come
+    back in time has its workers terminated, and new ones are forked.
+
+    Attributes:
+        workers (int): The number of worker processes.
+    """
+
+    log = Logger()
+
+    def __init__(self, workers, tableBytes=TranspositionTable.DEFAULT_BYTES):
+        """
+        Args:
+            workers (int): The number of worker processes.
+            tableBytes (Optional[int]): The memory budget of the
+                transposition tables, shared out to the workers.
+
+        Raises:
+            ValueError: If there are less than two workers.
+
+        """
+        if workers < 2:
+            raise ValueError('Bad number of search workers: %d' % (workers))
+
+        self.workers = workers
+        self._tableBytes = tableBytes
+        self._pool = self._newPool()
+
+    def _newPool(self):
+        return multiprocessing.Pool(self.workers, _initWorker,
+                                    (self._tableBytes // self.workers,))
+
+    def map(self, function, tasks, timeout):
+        """Runs the tasks on the workers and returns their results.
+
+        Raises:
+            multiprocessing.TimeoutError: If the results are not back
+                within ``timeout`` seconds; the workers, still busy with
+                the tasks, are replaced.
+
+        """
+        try:
+            return self._pool.map_async(function, tasks).get(timeout)
+        except multiprocessing.TimeoutError:
+            self.log.warn('The search workers timed out: restarting them')
+            self.close()
+            self._pool = self._newPool()
+            raise
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+
+class ParallelAlphaBeta(object):
+    """The alpha-beta search with the moves of the root split.
+
+    It is used like ai.search.AlphaBetaSearch. The root moves are dealt
+    out round-robin from the most promising one, so every worker gets its
+    share of the good moves. The workers do not share their bounds: each
+    one searches its moves with a full window.
+    """
+
+    def __init__(self, pool, maxDepth=0, timeLimit=None):
+        self.pool = pool
+        self.maxDepth = maxDepth
+        self.timeLimit = timeLimit
+        self.nodes = 0
+        self.depthReached = 0
+
+    def bestMove(self, board, symbol):
+        self.nodes = 0
+        self.depthReached = 0
+
+        moves = _ratedMoves(board, symbol)
+        if not moves:
+            return -1, 0
+
+        workers = min(self.pool.workers, len(moves))
+        position = _position(board)
+        tasks = [(position, symbol, self.maxDepth, self.timeLimit,
+                  moves[i::workers]) for i in xrange(workers)]
+        try:
+            results = self.pool.map(_searchAlphaBeta, tasks,
+                                    _timeout(self.timeLimit))
+        except multiprocessing.TimeoutError:
+            # the budget is spent: the most promising move is played
+            return moves[0], -INFINITY
+
+        self.nodes = sum(nodes for _, nodes in results)
+        move, score, self.depthReached = mergeIterations(
+            [iterations for iterations, _ in results])
+        if move == -1:
+            # no worker has completed an iteration
+            move, score = moves[0], -INFINITY
+
+        return move, score
+
+
+class ParallelMonteCarlo(object):
+    """The Monte Carlo tree search run by every worker from the root.
+
+    It is used like ai.mcts.MonteCarloSearch. The playouts of a move are
+    shared out to the workers; the trees are not kept between the moves.
+    """
+
+    def __init__(self, pool, playouts=None, timeLimit=None):
+        self.pool = pool
+        self.playouts = playouts
+        self.timeLimit = timeLimit
+        self.nodes = 0
+        self.depthReached = 0
+
+    def bestMove(self, board, symbol):
+        self.nodes = 0
+        self.depthReached = 0
+        if not board.empty():
+            return -1, 0.0
+
+        workers = self.pool.workers
+        playouts = self.playouts
+        if playouts is not None:
+            playouts = max(1, playouts // workers)
+
+        position = _position(board)
+        tasks = [(position, symbol, playouts, self.timeLimit,
+                  random.getrandbits(32)) for _ in xrange(workers)]
+        try:
+            results = self.pool.map(_searchMonteCarlo, tasks,
+                                    _timeout(self.timeLimit))
+        except multiprocessing.TimeoutError:
+            # the budget is spent: the most promising move is played
+            return _ratedMoves(board, symbol)[0], 0.0
+
+        stats = {}
+        for rootStats, nodes, depth in results:
+            self.nodes += nodes
+            self.depthReached = max(self.depthReached, depth)
+            for move, visits, wins in rootStats:
+                total = stats.setdefault(move, [0, 0.0])
+                total[0] += visits
+                total[1] += wins
+
+        move, (visits, wins) = max(stats.iteritems(),
+                                   key=lambda item: item[1][0])
+        return move, wins / visits
+
+
+def mergeIterations(results):
+    """Merges the iterations of the workers of a root split search.
+
+    The scores of the workers are compared at the deepest depth completed
+    by all of them; a worker which stopped early on a won or lost root
+    keeps its last result at the deeper depths. A win found deeper by one
+    worker beats them all.
+
+    Args:
+        results (list[list[tuple(int, int)]]): The iterations of every
+            worker (see AlphaBetaSearch.iterations).
+
+    Returns:
+        tuple(int, int, int): The best move, its score and the depth they
+            were compared at; the move is -1 if no iteration completed.
+
+    """
+    results = [iterations for iterations in results if iterations]
+    if not results:
+        return -1, -INFINITY, 0
+
+    unproven = [len(iterations) for iterations in results
+                if abs(iterations[-1][1]) <= WIN_THRESHOLD]
+    if unproven:
+        depth = min(unproven)
+    else:
+        depth = max(len(iterations) for iterations in results)
+
+    best = []
+    for iterations in results:
+        best.append(iterations[min(depth, len(iterations)) - 1])
+        best.extend(iteration for iteration in iterations[depth:]
+                    if iteration[1] > WIN_THRESHOLD)
+
+    move, score = max(best, key=lambda iteration: iteration[1])
+    return move, score, depth
+
+
+def _ratedMoves(board, symbol):
+    """The candidate moves, the most promising first."""
+    rated = rateMoves(board, symbol, candidates(board),
+                      lineWeights(board.winLength))
+    rated.sort(reverse=True)
+    return [move for _, move in rated]
+
+
+def _timeout(timeLimit):
+    if timeLimit is None:
+        return None
+
+    return timeLimit + GRACE
+
+
+def _position(board):
+    return (board.size, board.winLength,
+            board.mask(Symbol.X), board.mask(Symbol.O))
+
+
+def _board(position):
+    size, winLength, x, o = position
+    board = Board(size, winLength)
+    for symbol, mask in ((Symbol.X, x), (Symbol.O, o)):
+        for index in bits(mask):
+            board.setCell(index, symbol)
+
+    return board
+
+
+def _initWorker(tableBytes):
+    global _table
+
+    # the AI process handles the signals; the workers are terminated
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _table = TranspositionTable(tableBytes)
+
+
+def _searchAlphaBeta(task):
+    position, symbol, maxDepth, timeLimit, rootMoves = task
+    engine = AlphaBetaSearch(maxDepth, timeLimit, _table)
+    engine.bestMove(_board(position), symbol, frozenset(rootMoves))
+    return engine.iterations, engine.nodes
+
+
+def _searchMonteCarlo(task):
+    position, symbol, playouts, timeLimit, seed = task
+    engine = MonteCarloSearch(playouts, timeLimit, seed=seed)
+    engine.bestMove(_board(position), symbol)
+    return engine.rootStats, engine.nodes, engine.depthReached
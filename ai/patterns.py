@@ -0,0 +1,147 @@
+# -------------------------------------
+# patterns.py
+# The line patterns of many positions, scored at once with NumPy.
+#
+# NumPy is optional: the game server and the AI processes do not use
+# this module (see bench/patterns.py).
+# -------------------------------------
+
+import binascii
+
+import numpy
+
+from ai.search import lineWeights
+from common.constants import Symbol
+from model.board import Geometry
+
+
+class PatternEvaluator(object):
+    """Scores the positions of one board geometry, in batches.
+
+    A position is a pair of planes, one per side, with a 1 in the cells
+    the side owns. The symbols of the lines are counted with sliding
+    windows of ``winLength`` cells: the planes of all the positions,
+    shifted one cell at a time along a direction, are added up, so a
+    batch costs ``4 * winLength`` array additions whatever its size.
+
+    A line held by one side only, with n of its symbols (an open two, an
+    open three...), is worth ``LINE_WEIGHT ** n`` to that side: the scores
+    are the ones of AlphaBetaSearch's evaluation.
+
+    Attributes:
+        geometry (model.board.Geometry): The dimensions of the boards.
+        weights (numpy.ndarray): The worth of a line to X, indexed by
+            ``x * (winLength + 1) + o`` (the symbols of X and O on it).
+    """
+
+    def __init__(self, size, winLength):
+        self.geometry = Geometry.get(size, winLength)
+        weights = lineWeights(winLength)
+        self._base = winLength + 1
+        self.weights = numpy.array(
+            [weights[x] if not o else -weights[o] if not x else 0
+             for x in xrange(self._base) for o in xrange(self._base)],
+            dtype=numpy.int64)
+        self._nbytes = (self.geometry.cells + 7) // 8
+
+    def planes(self, boards):
+        """Converts boards to planes.
+
+        Args:
+            boards (iterable[model.board.Board]): The positions.
+
+        Returns:
+            numpy.ndarray: The planes, shape (boards, 2, size, size); the
+                first plane is X, the second one O.
+
+        """
+        size = self.geometry.size
+        masks = []
+        for board in boards:
+            masks.append(board.mask(Symbol.X))
+            masks.append(board.mask(Symbol.O))
+
+        # the masks as big-endian bytes, one row each: reversed, their
+        # bits start with the cell 0
+        digits = self._nbytes * 2
+        raw = binascii.unhexlify(''.join('%0*x' % (digits, mask)
+                                         for mask in masks))
+        cells = numpy.unpackbits(numpy.frombuffer(raw, dtype=numpy.uint8).
+                                 reshape(len(masks), -1), axis=1)
+        cells = cells[:, ::-1][:, :self.geometry.cells]
+        return cells.astype(numpy.int8).reshape(-1, 2, size, size)
+
+    def children(self, board, moves, symbol):
+        """Returns the planes of the positions after each move.
+
+        Args:
+            board (model.board.Board): The position.
+            moves (list[int]): The empty cells played.
+            symbol (int): The side which plays them.
+
+        Returns:
+            numpy.ndarray: The planes, shape (moves, 2, size, size).
+
+        """
+        rows, cols = numpy.divmod(moves, self.geometry.size)
+        planes = numpy.repeat(self.planes([board]), len(moves), axis=0)
+        planes[numpy.arange(len(moves)), symbol - Symbol.X, rows, cols] = 1
+        return planes
+
+    def lineCounts(self, planes):
+        """Counts the symbols of every line.
+
+        Returns:
+            numpy.ndarray: The counts, shape (positions, 2, lines); the
+                lines are in the order of the directions, not in the
+                order of Geometry.lines.
+
+        """
+        k = self.geometry.winLength
+        # the number of windows along a direction
+        m = self.geometry.size - k + 1
+
+        rows = sum(planes[..., :, i:i + m] for i in xrange(k))
+        cols = sum(planes[..., i:i + m, :] for i in xrange(k))
+        diagonals = sum(planes[..., i:i + m, i:i + m] for i in xrange(k))
+        antidiagonals = sum(planes[..., i:i + m, k - 1 - i:k - 1 - i + m]
+                            for i in xrange(k))
+
+        n = planes.shape[0]
+        return numpy.concatenate([rows.reshape(n, 2, -1),
+                                  cols.reshape(n, 2, -1),
+                                  diagonals.reshape(n, 2, -1),
+                                  antidiagonals.reshape(n, 2, -1)], axis=2)
+
+    def patterns(self, planes):
+        """Counts the lines held by one side only, by number of symbols.
+
+        Returns:
+            numpy.ndarray: Shape (positions, 2, winLength + 1): the number
+                of lines of each side holding n of its symbols and none of
+                the other side's (the open twos are at n = 2, the open
+                threes at n = 3...); n = 0 counts the empty lines.
+
+        """
+        counts = self.lineCounts(planes)
+        held = numpy.where(counts[:, ::-1] == 0, counts, -1)
+        sizes = numpy.arange(self.geometry.winLength + 1)
+        return (held[..., numpy.newaxis] == sizes).sum(axis=2)
+
+    def evaluate(self, planes, symbols):
+        """Scores positions for the side to move.
+
+        Args:
+            planes (numpy.ndarray): The positions (see ``planes``).
+            symbols (int | numpy.ndarray): The side every score is for,
+                one for all the positions or one per position.
+
+        Returns:
+            numpy.ndarray: The scores, shape (positions,).
+
+        """
+        counts = self.lineCounts(planes)
+        scores = self.weights.take(counts[:, 0] * self._base +
+                                   counts[:, 1]).sum(axis=1)
+        return numpy.where(numpy.asarray(symbols) == Symbol.X,
+                           scores, -scores)
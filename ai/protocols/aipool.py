@@ -0,0 +1,229 @@
+import sys
+
+from twisted.internet import defer, protocol, reactor
+
+from ai import logsink
+from ai.protocols.aiprotocol import AI_PROCESSES, initCommand, moveCommand, \
+    parseErrorUuid, parseTraceId, quitCommand, undoCommand
+from common import logs
+from common.tracing import tracer
+from model.events import Events, router
+
+
+class AiWorkerProtocol(protocol.ProcessProtocol):
+    """The connection to a long-lived AI process which plays many games.
+
+    Attributes:
+        pool (AiWorkerPool): The pool owning the worker.
+        games (set[str]): The UUIDs of the games served by the worker.
+        ready (bool): True once the worker has loaded and waits for
+            commands.
+    """
+
+    log = logs.Logger('ai')
+    delimiter = '\n'
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.games = set()
+        self.ready = False
+        self._buffer = ''
+        self._errBuffer = ''
+        self._source = None
+
+    @property
+    def load(self):
+        """The number of games served by the worker."""
+        return len(self.games)
+
+    def connectionMade(self):
+        AI_PROCESSES.inc()
+        self._source = 'ai-{0}'.format(self.transport.pid)
+        self.log.info('AI worker {pid} started', pid=self.transport.pid)
+
+    def outReceived(self, data):
+        # the replies of many games may arrive in one chunk
+        lines = (self._buffer + data).split(self.delimiter)
+        self._buffer = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if line:
+                self._lineReceived(line)
+
+    def errReceived(self, data):
+        # the logs of the AI process
+        self._errBuffer = logsink.sink.feed(self._errBuffer + data,
+                                            self._source)
+
+    def processEnded(self, reason):
+        AI_PROCESSES.dec()
+        self.log.info('AI worker ended: status {status}',
+                      status=reason.value.exitCode)
+        self.pool.workerEnded(self)
+
+    def send(self, cmd):
+        self.transport.write(cmd)
+
+    def _lineReceived(self, line):
+        if line.startswith('Error:'):
+            self.log.error('Error received from AI worker: {msg}', msg=line)
+            uuid = parseErrorUuid(line)
+            if uuid in self.games:
+                # the game's board is out of step: it is ended
+                router.send(Events.aiFailed, uuid, reason=line)
+            return
+
+        parts = line.split()
+        if parts[0].lower() == 'ready':
+            self.ready = True
+            self.pool.workerReady(self)
+            return
+
+        if parts[0].lower() != 'move' or len(parts) < 4:
+            self.log.error('Unexpected AI worker reply: {line}', line=line)
+            return
+
+        uuid, row, col = parts[1], int(parts[2]), int(parts[3])
+        if uuid not in self.games:
+            return
+
+        traceId = parseTraceId(parts[4:])
+        tracer.span(traceId, 'server.aiReplied')
+        router.send(Events.aiResponse, uuid, row=row, col=col,
+                    traceId=traceId)
+
+
+class AiWorkerPool(object):
+    """A fixed number of AI processes sharing the games of the server.
+
+    Every worker is started once with the --pool option and serves the
+    games assigned to it, told apart by the UUID carried on each command
+    line. A new game goes to the least loaded worker. A worker which
+    exits is replaced; its games are ended (Events.aiFailed).
+
+    Attributes:
+        size (int): The number of workers.
+    """
+
+    log = logs.Logger('ai')
+
+    def __init__(self, size, script, *args):
+        """
+        Args:
+            size (int): The number of AI processes.
+            script (str): The path of the AI process script.
+            *args: The extra command line arguments of the AI processes.
+        """
+        self.size = size
+        self._args = [sys.executable, script, '--pool'] + list(args)
+        self._workers = []
+        self._assigned = {}
+        self._running = False
+        self._waiting = []
+
+    def start(self):
+        """Spawns the workers."""
+        self._running = True
+        for _ in xrange(self.size):
+            self._spawn()
+
+    def stop(self):
+        """Stops the workers (closing their stdin ends them)."""
+        self._running = False
+        for worker in self._workers:
+            worker.transport.closeStdin()
+
+    def attach(self, uuid, symbol, depth, size=3, winLength=3,
+               timeLimit=None, engine=None, playouts=None):
+        """Assigns a game to the least loaded worker and sends INIT.
+
+        Args:
+            uuid (str): The UUID of the game.
+            symbol (int): The symbol of the AI player.
+            depth (int): The search depth.
+            size (Optional[int]): The board size.
+            winLength (Optional[int]): The number of symbols in a row
+                needed to win.
+            timeLimit (Optional[float]): The time budget of a move, in
+                seconds.
+            engine (Optional[str]): The search engine.
+            playouts (Optional[int]): The playouts of a move of the MCTS
+                engine.
+
+        Raises:
+            RuntimeError: If the pool has no worker.
+
+        """
+        if not self._workers:
+            raise RuntimeError('The AI worker pool is not running.')
+
+        worker = min(self._workers, key=lambda w: w.load)
+        worker.games.add(uuid)
+        self._assigned[uuid] = worker
+        worker.send(initCommand(uuid, symbol, depth, size, winLength,
+                                timeLimit, engine, playouts))
+
+        router.connect(self._onAiMoveRequest, Events.aiMove, uuid)
+        router.connect(self._onTakeback, Events.takeback, uuid)
+        router.connect(self._onQuit, Events.quit, uuid)
+
+    def detach(self, uuid):
+        """Tells the worker of a game that the game is over."""
+        worker = self._assigned.pop(uuid, None)
+        if worker is not None:
+            worker.games.discard(uuid)
+            worker.send(quitCommand(uuid))
+
+    def whenReady(self):
+        """Returns a Deferred which fires once every worker has loaded."""
+        d = defer.Deferred()
+        if self._workers and all(w.ready for w in self._workers):
+            d.callback(self)
+        else:
+            self._waiting.append(d)
+        return d
+
+    def workerReady(self, worker):
+        """Called when a worker has loaded."""
+        if self._waiting and all(w.ready for w in self._workers):
+            waiting, self._waiting = self._waiting, []
+            for d in waiting:
+                d.callback(self)
+
+    def workerEnded(self, worker):
+        """Replaces a worker which has exited and ends its games."""
+        if worker in self._workers:
+            self._workers.remove(worker)
+
+        games, worker.games = worker.games, set()
+        for uuid in games:
+            self.log.error('The AI worker of the game {uuid} has ended',
+                           uuid=uuid)
+            self._assigned.pop(uuid, None)
+            router.send(Events.aiFailed, uuid,
+                        reason='The AI process has ended')
+
+        if self._running:
+            self._spawn()
+
+    def _spawn(self):
+        worker = AiWorkerProtocol(self)
+        reactor.spawnProcess(worker, self._args[0], self._args)
+        self._workers.append(worker)
+
+    def _onAiMoveRequest(self, uuid, row, col, traceId=None):
+        """Handler for the signal Events.aiMove."""
+        worker = self._assigned.get(str(uuid))
+        if worker is not None:
+            worker.send(moveCommand(str(uuid), row, col, traceId))
+            tracer.span(traceId, 'server.dispatched')
+
+    def _onTakeback(self, uuid, count):
+        """Handler for the signal Events.takeback."""
+        worker = self._assigned.get(str(uuid))
+        if worker is not None:
+            worker.send(undoCommand(str(uuid), count))
+
+    def _onQuit(self, uuid):
+        """Handler for the signal Events.quit."""
+        self.detach(str(uuid))
@@ -1,13 +1,25 @@
-from pydispatch import dispatcher
-from twisted.internet import protocol, reactor
-from twisted.logger import Logger
+import os
+import sys
 
-from model.events import Events
+from twisted.internet import defer, protocol, reactor
+
+from ai import logsink
+from common import logs, metrics
+from common.tracing import tracer, traceOption
+from model.events import Events, router
+
+
+AI_PROCESSES = metrics.gauge('tictactoe_ai_processes',
+                             'The live AI processes.')
 
 
 class AiProcessProtocol(protocol.ProcessProtocol):
     """
 
+    The connection to an AI process playing one game. The process may be
+    started before its game exists (see AiSpareProcesses): it gets the
+    INIT command when the game is assigned to it.
+
     Attributes:
         symbol (int):
             The symbol (X or O) for the AI player.
@@ -15,53 +27,127 @@ class AiProcessProtocol(protocol.ProcessProtocol):
             The search depth.
         uuid  (bytes):
             The UUID of the game.
+        size (int):
+            The number of rows (and columns) of the board.
+        winLength (int):
+            The number of symbols in a row needed to win.
+        timeLimit (float):
+            The time budget of a move, in seconds (None for the default
+            of the AI process).
+        engine (str):
+            The search engine (common.constants.Engine; None for the
+            alpha-beta search).
+        playouts (int):
+            The playouts of a move of the MCTS engine (None for no
+            limit but the time budget).
+        ready (bool):
+            True once the AI process has started and is waiting for
+            commands.
+        ended (Deferred):
+            Fires when the AI process has ended.
 
     """
 
-    log = Logger()
+    log = logs.Logger('ai')
+    delimiter = '\n'
 
-    def __init__(self, uuid, symbol, depth):
+    def __init__(self, uuid=None, symbol=None, depth=None,
+                 size=3, winLength=3, timeLimit=None, engine=None,
+                 playouts=None):
         """
         Args:
             uuid:
-                The UUID of the game.
+                The UUID of the game (None for a spare process, see
+                ``assign``).
             symbol:
                 The symbol for the AI player.
             depth:
                 The search depth for AI player.
+            size:
+                The board size (default is 3).
+            winLength:
+                The number of symbols in a row needed to win (default is 3).
+            timeLimit:
+                The time budget of a move, in seconds (default is the
+                AI process default).
+            engine:
+                The search engine (default is the alpha-beta search).
+            playouts:
+                The playouts of a move of the MCTS engine.
 
         """
 
+        self.uuid = None
+        self.ready = False
+        self.ended = defer.Deferred()
+        self._quit = False
+        self._buffer = ''
+        self._errBuffer = ''
+        self._source = None
+
+        if uuid is not None:
+            self.assign(uuid, symbol, depth, size, winLength, timeLimit,
+                        engine, playouts)
+
+    def assign(self, uuid, symbol, depth, size=3, winLength=3,
+               timeLimit=None, engine=None, playouts=None):
+        """Assigns the game played by the AI process.
+
+        Sends the INIT command right away if the process is running.
+        """
         self.uuid = uuid
         self.symbol = symbol
         self.depth = depth
+        self.size = size
+        self.winLength = winLength
+        self.timeLimit = timeLimit
+        self.engine = engine
+        self.playouts = playouts
 
         self.log.debug('symbol {symbol}, depth {depth}, uuid {uuid}',
                        symbol=self.symbol, depth=self.depth, uuid=self.uuid)
 
-        dispatcher.connect(self._onAiMoveRequest, signal=Events.aiMove)
-        dispatcher.connect(self._onQuit, signal=Events.quit)
+        router.connect(self._onAiMoveRequest, Events.aiMove, self.uuid)
+        router.connect(self._onTakeback, Events.takeback, self.uuid)
+        router.connect(self._onQuit, Events.quit, self.uuid)
+
+        if self.transport is not None:
+            self.log.debug('Sending INIT command.')
+            self._sendInitCmd()
 
     def connectionMade(self):
-        self.log.debug('Sending INIT command.')
-        self._sendInitCmd()
+        AI_PROCESSES.inc()
+        self._source = 'ai-{0}'.format(self.transport.pid)
+        if self.uuid is not None:
+            self.log.debug('Sending INIT command.')
+            self._sendInitCmd()
 
     def outReceived(self, data):
         self.log.debug('AiProtocol.outReceived - received: {data!s}',
                        data=data)
 
-        if 'Error:' in data:
-            self.log.error('Error received from AI process: {msg}',
-                           msg=data)
-            return
-
-        data = data.strip()
-        self.log.debug('AI process response: {data}',
-                       data=data)
-        self._handleResponse(data)
+        lines = (self._buffer + data).split(self.delimiter)
+        self._buffer = lines.pop()
+        for line in lines:
+            if 'Error:' in line:
+                self.log.error('Error received from AI process: {msg}',
+                               msg=line)
+                if self.uuid is not None and \
+                        parseErrorUuid(line) == str(self.uuid):
+                    router.send(Events.aiFailed, self.uuid,
+                                reason=line.strip())
+                continue
+
+            line = line.strip()
+            self.log.debug('AI process response: {data}',
+                           data=line)
+            if line:
+                self._handleResponse(line)
 
     def errReceived(self, data):
-        pass
+        # the logs of the AI process
+        self._errBuffer = logsink.sink.feed(self._errBuffer + data,
+                                            self._source)
 
     def inConnectionLost(self):
         pass
@@ -74,46 +160,52 @@ class AiProcessProtocol(protocol.ProcessProtocol):
                       status=reason.value.exitCode)
 
     def processEnded(self, reason):
+        AI_PROCESSES.dec()
         self.log.info('Process ended: status {status:d}',
                       status=reason.value.exitCode)
         self.log.info('Quitting the AI player')
+        if self.uuid is not None and not self._quit:
+            # the game has not quit: it is left without its AI player
+            router.send(Events.aiFailed, self.uuid,
+                        reason='The AI process has ended')
+        self.ended.callback(self)
 
     def _sendInitCmd(self):
         """Sends the 'INIT' command to the AI process."""
-        cmd = 'INIT {0:s} {1:d} {2:d}\n'.format(self.uuid,
-                                                self.symbol,
-                                                self.depth)
-        self.transport.write(cmd)
+        self.transport.write(initCommand(self.uuid, self.symbol, self.depth,
+                                         self.size, self.winLength,
+                                         self.timeLimit, self.engine,
+                                         self.playouts))
 
-    def _sendMoveCmd(self, row, col):
+    def _sendMoveCmd(self, row, col, traceId=None):
         """Sends the command 'MOVE' to the AI process."""
-        cmd = 'MOVE {uuid:s} {row:d} {col:d}\n'.format(uuid=self.uuid,
-                                                       row=row,
-                                                       col=col)
-        self.transport.write(cmd)
+        self.transport.write(moveCommand(self.uuid, row, col, traceId))
+        tracer.span(traceId, 'server.dispatched')
 
     def _sendQuitCmd(self):
         """Sends the command 'QUIT' to the AI process."""
-        cmd = 'QUIT {uuid:s}\n'.format(uuid=self.uuid)
-        self.transport.write(cmd)
+        self._quit = True
+        self.transport.write(quitCommand(self.uuid))
 
-    def _onAiMoveRequest(self, uuid, row, col):
+    def _onAiMoveRequest(self, uuid, row, col, traceId=None):
         """Handler for the signal Events.aiMove."""
-        if str(self.uuid) != str(uuid):
-            return
-
         self.log.debug('Handle aiMove request for game {uuid}', uuid=uuid)
-        self._sendMoveCmd(row, col)
+        self._sendMoveCmd(row, col, traceId)
+
+    def _onTakeback(self, uuid, count):
+        """Handler for the signal Events.takeback."""
+        self.transport.write(undoCommand(self.uuid, count))
 
     def _onQuit(self, uuid):
         """Handler for the signal Events.quit."""
-        if str(self.uuid) != str(uuid):
-            return
-
         self.log.debug("Handles 'quit' command for game {uuid}", uuid=uuid)
         self._sendQuitCmd()
 
-    def _on_move(self, uuid, row, col):
+    def _on_ready(self):
+        """Handles the READY notice sent when the AI process starts."""
+        self.ready = True
+
+    def _on_move(self, uuid, row, col, *options):
         """Handles the AiMove response."""
         self.log.debug('_on_move: UUID = {uuid}, self.uuid={uuid2}',
                        uuid=uuid, uuid2=self.uuid)
@@ -138,7 +230,10 @@ class AiProcessProtocol(protocol.ProcessProtocol):
             self._sendQuitCmd()
             return
 
-        dispatcher.send(Events.aiResponse, uuid=self.uuid, row=i, col=j)
+        traceId = parseTraceId(options)
+        tracer.span(traceId, 'server.aiReplied')
+        router.send(Events.aiResponse, self.uuid, row=i, col=j,
+                    traceId=traceId)
 
     def _handleResponse(self, res):
         """Handles the AI process responses."""
@@ -168,9 +263,175 @@ class AiProcessProtocol(protocol.ProcessProtocol):
                 self.log.failure('Exception caught: {e}', e=e)
 
 
+def initCommand(uuid, symbol, depth, size, winLength, timeLimit=None,
+                engine=None, playouts=None):
+    """Formats the 'INIT' command.
+
+    The mandatory arguments are followed by 'name=value' options; the
+    time budget of a move ('time=', in seconds), the search engine
+    ('engine=') and the playouts of a move of the MCTS engine
+    ('playouts=') are left to the AI process if None.
+    """
+    command = 'INIT {0:s} {1:d} {2:d} size={3:d} win={4:d}'.format(
+        uuid, symbol, depth, size, winLength)
+    if timeLimit is not None:
+        command += ' time={0!r}'.format(float(timeLimit))
+    if engine is not None:
+        command += ' engine={0:s}'.format(engine)
+    if playouts is not None:
+        command += ' playouts={0:d}'.format(playouts)
+
+    return command + '\n'
+
+
+def moveCommand(uuid, row, col, traceId=None):
+    """Formats the 'MOVE' command.
+
+    The trace id of the move, if any, is sent as the 'trace=' option.
+    """
+    return 'MOVE {uuid:s} {row:d} {col:d}{trace}\n'.format(
+        uuid=uuid, row=row, col=col, trace=traceOption(traceId))
+
+
+def parseTraceId(options):
+    """Gets the 'trace=' option of a MOVE line (None if missing)."""
+    for option in options:
+        if option.startswith('trace='):
+            return option[len('trace='):]
+
+    return None
+
+
+def parseErrorUuid(line):
+    """Gets the UUID of the game of an 'Error:' line (None if missing).
+
+    The AI process sends 'Error: <uuid> <message>' when a command of a
+    game fails.
+    """
+    parts = line.split()
+    if len(parts) < 2 or parts[0] != 'Error:':
+        return None
+
+    return parts[1]
+
+
+def undoCommand(uuid, count):
+    """Formats the 'UNDO' command: the last moves of a game are taken back."""
+    return 'UNDO {uuid:s} {count:d}\n'.format(uuid=uuid, count=count)
+
+
+def quitCommand(uuid):
+    """Formats the 'QUIT' command."""
+    return 'QUIT {uuid:s}\n'.format(uuid=uuid)
+
+
+def scriptPath():
+    """Returns the path of the AI process script."""
+    return os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'aiprocess.py')
+
+
+class AiSpareProcesses(object):
+    """AI processes started ahead of the games which will use them.
+
+    Each game still gets an AI process of its own, but it is taken from a
+    reserve of processes which have already loaded the interpreter and
+    the AI modules, so creating a game does not wait for them. The
+    reserve is refilled in the background.
+
+    Attributes:
+        count (int): The number of spare processes kept in reserve.
+    """
+
+    log = logs.Logger('ai')
+
+    def __init__(self, count, script, *args):
+        """
+        Args:
+            count (int): The number of spare processes.
+            script (str): The path of the AI process script.
+            *args: The extra command line arguments of the AI processes.
+        """
+        self.count = count
+        self._args = [sys.executable, script] + list(args)
+        self._spares = []
+        self._running = False
+
+    def start(self):
+        """Spawns the spare processes."""
+        self._running = True
+        self._refill()
+
+    def stop(self):
+        """Stops the spare processes (closing their stdin ends them)."""
+        self._running = False
+        for spare in self._spares:
+            spare.transport.closeStdin()
+
+    def attach(self, uuid, symbol, depth, size=3, winLength=3,
+               timeLimit=None, engine=None, playouts=None):
+        """Hands a spare AI process to a game.
+
+        A process which is already waiting for commands is preferred;
+        if the reserve is empty a new process is spawned for the game.
+
+        Args:
+            uuid (str): The UUID of the game.
+            symbol (int): The symbol of the AI player.
+            depth (int): The search depth.
+            size (Optional[int]): The board size.
+            winLength (Optional[int]): The number of symbols in a row
+                needed to win.
+            timeLimit (Optional[float]): The time budget of a move, in
+                seconds.
+            engine (Optional[str]): The search engine.
+            playouts (Optional[int]): The playouts of a move of the MCTS
+                engine.
+
+        """
+        ready = [spare for spare in self._spares if spare.ready]
+        if ready:
+            spare = ready[0]
+            self._spares.remove(spare)
+        elif self._spares:
+            spare = self._spares.pop(0)
+        else:
+            self.log.warn('No spare AI process left')
+            spare = self._spawn()
+            self._spares.remove(spare)
+
+        spare.assign(uuid, symbol, depth, size, winLength, timeLimit,
+                     engine, playouts)
+
+        if self._running:
+            reactor.callLater(0, self._refill)
+
+    def _refill(self):
+        while self._running and len(self._spares) < self.count:
+            self._spawn()
+
+    def _spawn(self):
+        spare = AiProcessProtocol()
+        spare.ended.addCallback(self._onEnded)
+        reactor.spawnProcess(spare, self._args[0], self._args)
+        self._spares.append(spare)
+        return spare
+
+    def _onEnded(self, spare):
+        if spare in self._spares:
+            self.log.error('A spare AI process has ended')
+            self._spares.remove(spare)
+            if self._running:
+                reactor.callLater(1, self._refill)
+
+
 def makePipe(uuid, symbol, depth, cmd, *args, **kwargs):
-    #
-    pipe = AiProcessProtocol(uuid, symbol, depth)
+    """Spawns an AI process for a game.
+
+    The keyword arguments (size, winLength, timeLimit, engine, playouts)
+    are passed on to the AiProcessProtocol.
+    """
+    pipe = AiProcessProtocol(uuid, symbol, depth, **kwargs)
     #
     args = [cmd] + list(args)
     reactor.spawnProcess(pipe, cmd, args)
@@ -0,0 +1,364 @@
+# -------------------------------------
+# search.py
+# The AI player's search engine.
+# -------------------------------------
+
+import time
+from itertools import izip
+
+from ai.ttable import TranspositionTable
+from common.constants import Symbol
+
+
+WIN_SCORE = 1000000
+INFINITY = WIN_SCORE + 1
+
+# the scores above are wins found at a known distance from the root
+WIN_THRESHOLD = WIN_SCORE - 10000
+
+# indexed by symbol
+OPPONENT = (Symbol.Empty, Symbol.O, Symbol.X)
+
+# a line held by one side only is worth LINE_WEIGHT ** count to it
+LINE_WEIGHT = 8
+
+# large boards only consider the cells next to the existing symbols
+NEIGHBOURS_ONLY_ABOVE = 25
+
+
+class Timeout(Exception):
+    """Raised inside the search when the time budget is exhausted."""
+
+
+def bits(mask):
+    """Yields the indexes of the bits set in a mask (lowest first)."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class AlphaBetaSearch(object):
+    """Negamax search with alpha-beta pruning.
+
+    The search plays the moves directly on the board it was given and
+    takes them back on the way up (see Board.makeMove), so the board is
+    left unchanged.
+
+    The search deepens iteratively, one ply at a time up to the depth
+    limit; each iteration starts with the best move of the previous one.
+    When the time budget runs out the best move of the last completed
+    iteration is played, so the time of a move is bounded whatever the
+    size of the board.
+
+    Positions which are neither won nor drawn at the depth limit are
+    scored by counting the lines each side can still complete: a line
+    held only by one side is worth ``LINE_WEIGHT ** count`` to it.
+
+    Attributes:
+        maxDepth (int): The number of plies to look ahead
+            (0 searches until the end of the game).
+        timeLimit (float): The time budget per move, in seconds
+            (None means no limit).
+        table (ai.ttable.TranspositionTable): The results of the
+            positions already searched (None disables it).
+        nodes (int): The number of nodes visited by the last search.
+        depthReached (int): The depth of the last completed iteration
+            of the last search.
+        iterations (list[tuple(int, int)]): The best move and its score
+            of every completed iteration of the last search, from depth 1.
+    """
+
+    # the clock is read once every CHECK_EVERY nodes
+    CHECK_EVERY = 512
+
+    def __init__(self, maxDepth=0, timeLimit=None, table=None):
+        self.maxDepth = maxDepth
+        self.timeLimit = timeLimit
+        self.table = table
+        self.nodes = 0
+        self.depthReached = 0
+        self.iterations = []
+        self._deadline = None
+        self._weights = None
+        self._partial = False
+
+    def bestMove(self, board, symbol, rootMoves=None):
+        """Searches the best move for a side.
+
+        Args:
+            board (model.board.Board): The position; it must not be over.
+            symbol (int): The side to move.
+            rootMoves (Optional[collection[int]]): Searches only these
+                moves of the root (see ai.parallel); default is all the
+                candidate moves.
+
+        Returns:
+            tuple(int, int): The index (``row * size + col``) of the best
+                move and its score for ``symbol``; the index is -1 if
+                there are no empty cells left.
+
+        """
+        self.nodes = 0
+        self.depthReached = 0
+        self.iterations = []
+        self._weights = lineWeights(board.winLength)
+        self._deadline = None
+        lastStart = None
+        if self.timeLimit is not None:
+            now = time.time()
+            self._deadline = now + self.timeLimit
+            # an iteration takes longer than all the previous ones: it is
+            # not started after half of the budget
+            lastStart = now + self.timeLimit / 2.0
+
+        depth = self.maxDepth
+        if depth <= 0:
+            depth = board.geometry.cells - board.occupied
+
+        if self.table is not None:
+            self.table.newSearch()
+
+        moves = self._orderMoves(board, symbol,
+                                 self._tableMove(board, symbol))
+        self._partial = rootMoves is not None
+        if self._partial:
+            moves = [move for move in moves if move in rootMoves]
+        if not moves:
+            return -1, 0
+
+        bestMove, bestScore = moves[0], -INFINITY
+        try:
+            for iteration in xrange(1, depth + 1):
+                bestMove, bestScore = self._searchRoot(board, symbol, moves,
+                                                       iteration)
+                self.depthReached = iteration
+                self.iterations.append((bestMove, bestScore))
+
+                # a win or a loss is not changed by a deeper search
+                if abs(bestScore) > WIN_THRESHOLD:
+                    break
+
+                if lastStart is not None and time.time() > lastStart:
+                    break
+
+                moves.remove(bestMove)
+                moves.insert(0, bestMove)
+        except Timeout:
+            # the iteration is dropped: its moves were not all searched
+            pass
+
+        return bestMove, bestScore
+
+    def _searchRoot(self, board, symbol, moves, depth):
+        """Searches the moves of the root position to a given depth."""
+        bestMove, bestScore = moves[0], -INFINITY
+        alpha = -INFINITY
+
+        for move in moves:
+            score = self._scoreMove(board, symbol, move, depth,
+                                    -INFINITY, -alpha, 1)
+            if score > bestScore:
+                bestMove, bestScore = move, score
+                alpha = max(alpha, score)
+
+        # the score of a part of the moves is not the score of the root
+        if self.table is not None and not self._partial:
+            key, transform = _tableKey(board, symbol)
+            self.table.store(key, depth, TranspositionTable.EXACT,
+                             _toTable(bestScore, 1),
+                             board.toCanonical(bestMove, transform))
+
+        return bestMove, bestScore
+
+    def _scoreMove(self, board, symbol, move, depth, alpha, beta, ply):
+        """Plays a move, scores it for ``symbol`` and takes it back."""
+        self.nodes += 1
+        if self._deadline is not None and \
+                not self.nodes % self.CHECK_EVERY and \
+                time.time() > self._deadline:
+            raise Timeout()
+
+        board.makeMove(move, symbol)
+        try:
+            if board.isWinner(symbol):
+                return WIN_SCORE - ply
+
+            if board.isFull():
+                return 0
+
+            if depth <= 1:
+                return self._evaluate(board, symbol)
+
+            return -self._negamax(board, OPPONENT[symbol], depth - 1,
+                                  alpha, beta, ply + 1)
+        finally:
+            board.unmakeMove()
+
+    def _negamax(self, board, symbol, depth, alpha, beta, ply):
+        """Scores the position for ``symbol``, the side to move."""
+        table = self.table
+        tableMove = -1
+        if table is not None:
+            key, transform = _tableKey(board, symbol)
+            entry = table.probe(key)
+            if entry is not None:
+                entryDepth, flag, score, tableMove = entry
+                if tableMove >= 0:
+                    tableMove = board.fromCanonical(tableMove, transform)
+                if entryDepth >= depth:
+                    score = _fromTable(score, ply)
+                    if flag == TranspositionTable.EXACT:
+                        return score
+                    if flag == TranspositionTable.LOWER:
+                        alpha = max(alpha, score)
+                    else:
+                        beta = min(beta, score)
+                    if alpha >= beta:
+                        return score
+
+        alphaOrig = alpha
+        best, bestMove = -INFINITY, -1
+        for move in self._orderMoves(board, symbol, tableMove):
+            score = self._scoreMove(board, symbol, move, depth,
+                                    -beta, -alpha, ply)
+            if score > best:
+                best, bestMove = score, move
+                if best > alpha:
+                    alpha = best
+                    if alpha >= beta:
+                        break
+
+        if table is not None:
+            if best <= alphaOrig:
+                flag = TranspositionTable.UPPER
+            elif best >= beta:
+                flag = TranspositionTable.LOWER
+            else:
+                flag = TranspositionTable.EXACT
+            table.store(key, depth, flag, _toTable(best, ply),
+                        board.toCanonical(bestMove, transform)
+                        if bestMove >= 0 else -1)
+
+        return best
+
+    def _tableMove(self, board, symbol):
+        """Returns the best move stored for the position, or -1."""
+        if self.table is None:
+            return -1
+
+        key, transform = _tableKey(board, symbol)
+        entry = self.table.probe(key)
+        if entry is None or entry[3] < 0:
+            return -1
+
+        return board.fromCanonical(entry[3], transform)
+
+    def _evaluate(self, board, symbol):
+        """Scores a quiet position for ``symbol``."""
+        weights = self._weights
+        score = 0
+        for mine, theirs in izip(board.lineCounts(symbol),
+                                 board.lineCounts(OPPONENT[symbol])):
+            if not theirs:
+                score += weights[mine]
+            elif not mine:
+                score -= weights[theirs]
+
+        return score
+
+    def _orderMoves(self, board, symbol, firstMove=-1):
+        """Returns the candidate moves, the most promising first.
+
+        A cell is rated by the lines through it that are still open for
+        either side, so the moves which extend or block long runs come
+        first. ``firstMove`` (the best move of an earlier search of the
+        position) goes before all the others.
+        """
+        rated = rateMoves(board, symbol, candidates(board), self._weights)
+        rated.sort(reverse=True)
+        moves = [move for _, move in rated]
+        if firstMove >= 0 and firstMove in moves:
+            moves.remove(firstMove)
+            moves.insert(0, firstMove)
+
+        return moves
+
+
+def lineWeights(winLength):
+    """Returns the worth of a line, indexed by the symbols it holds."""
+    return [0] + [LINE_WEIGHT ** n for n in xrange(1, winLength + 1)]
+
+
+def candidates(board):
+    """Returns the mask of the moves worth considering.
+
+    Every empty cell on the small boards; on the large ones, the cells
+    next to the symbols already played (the center on an empty board).
+    """
+    geometry = board.geometry
+    if geometry.cells <= NEIGHBOURS_ONLY_ABOVE:
+        return board.empty()
+
+    mask = board.neighbours()
+    if not mask and board.empty():
+        # the first move goes in the center
+        mask = 1 << (geometry.cells // 2)
+
+    return mask
+
+
+def rateMoves(board, symbol, mask, weights):
+    """Rates the moves of a mask for the side to move.
+
+    A cell is rated by the lines through it that are still open for
+    either side, so the moves which extend or block long runs rate
+    higher.
+
+    Returns:
+        list[tuple(int, int)]: The (rating, move) pairs, unsorted.
+
+    """
+    mine = board.lineCounts(symbol)
+    theirs = board.lineCounts(OPPONENT[symbol])
+    cellLines = board.geometry.cellLines
+
+    rated = []
+    for move in bits(mask):
+        rating = 0
+        for line in cellLines[move]:
+            if not theirs[line]:
+                rating += weights[mine[line] + 1]
+            elif not mine[line]:
+                rating += weights[theirs[line] + 1]
+        rated.append((rating, move))
+
+    return rated
+
+
+def _tableKey(board, symbol):
+    """Returns the table key of a position and its canonical transform.
+
+    The symmetric images of a position share one entry; its best move is
+    stored in the coordinates of the canonical image.
+    """
+    key, transform = board.canonical()
+    return key ^ board.geometry.zobristTurn[symbol], transform
+
+
+def _toTable(score, ply):
+    """Makes a win score relative to the node before storing it."""
+    if score > WIN_THRESHOLD:
+        return score + ply
+    if score < -WIN_THRESHOLD:
+        return score - ply
+    return score
+
+
+def _fromTable(score, ply):
+    """Makes a stored win score relative to the root again."""
+    if score > WIN_THRESHOLD:
+        return score - ply
+    if score < -WIN_THRESHOLD:
+        return score + ply
+    return score
@@ -0,0 +1,233 @@
+# -------------------------------------
+# tablebase.py
+# The perfect-play tablebase for the 3x3 board.
+# -------------------------------------
+
+import mmap
+import os
+import struct
+import sys
+
+from twisted.logger import Logger
+
+from common.constants import Symbol
+from model.board import Board
+
+
+# the symbols of a position, relative to the side to move
+EMPTY, MINE, THEIRS = 0, 1, 2
+
+SIZE = 3
+CELLS = SIZE * SIZE
+
+MAGIC = 'TTTB\x02'
+
+# the value of an entry for the side to move
+LOSS, DRAW, WIN = -1, 0, 1
+
+NO_MOVE = 0x0F
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'tablebase3x3.bin')
+
+log = Logger()
+
+
+def positionCode(board, symbol, transform=0):
+    """Returns the code of a position (or of one of its symmetric images).
+
+    Every cell is a base-3 digit (the least significant is the cell 0)
+    holding EMPTY, MINE or THEIRS from the point of view of the side to
+    move, so one table serves both X and O.
+
+    Args:
+        board (model.board.Board): A 3x3 board.
+        symbol (int): The side to move.
+        transform (Optional[int]): The symmetry applied to the board
+            (see model.board.Board.canonical); default is the identity.
+
+    Returns:
+        int: The position code, in [0, 3 ** 9).
+
+    """
+    mine = board.mask(symbol)
+    theirs = board.mask(Symbol.O if symbol == Symbol.X else Symbol.X)
+    source = board.geometry.inverseSymmetries[transform]
+    code = 0
+    for i in xrange(CELLS - 1, -1, -1):
+        bit = 1 << source[i]
+        code = code * 3 + (MINE if mine & bit else
+                           THEIRS if theirs & bit else EMPTY)
+
+    return code
+
+
+def _packEntry(value, move):
+    return ((value + 1) << 4) | move
+
+
+def build(path=DEFAULT_PATH):
+    """Solves every reachable 3x3 position and writes the tablebase.
+
+    Only the canonical image of each position is solved and stored (see
+    model.board.Board.canonical), with its best move in the coordinates
+    of that image. Both X and O are tried as the first player, so the
+    table holds the canonical image of every position, whoever started.
+
+    The file holds MAGIC, the number of entries N (uint16), the N sorted
+    position codes (uint16) and then N entry bytes: the high nibble is
+    the value for the side to move plus one and the low nibble the best
+    move. It is written to a temporary name and renamed, so a worker
+    never maps a partial table.
+
+    Args:
+        path (Optional[str]): The file to write.
+
+    Returns:
+        int: The number of positions stored.
+
+    """
+    entries = {}
+    solved = {}
+    board = Board(SIZE, SIZE)
+
+    def solve(symbol):
+        other = Symbol.O if symbol == Symbol.X else Symbol.X
+        if board.isWinner(other):
+            return LOSS
+
+        if board.isFull():
+            return DRAW
+
+        key, transform = board.canonical()
+        key ^= board.geometry.zobristTurn[symbol]
+        if key in solved:
+            return solved[key]
+
+        value, move = LOSS - 1, NO_MOVE
+        for cell in xrange(CELLS):
+            if board.getCell(cell) != Symbol.Empty:
+                continue
+
+            board.setCell(cell, symbol)
+            score = -solve(other)
+            board.setCell(cell, Symbol.Empty)
+
+            if score > value:
+                value, move = score, cell
+
+        solved[key] = value
+        entries[positionCode(board, symbol, transform)] = \
+            _packEntry(value, board.toCanonical(move, transform))
+        return value
+
+    solve(Symbol.X)
+    solve(Symbol.O)
+
+    codes = sorted(entries)
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<H', len(codes)))
+        f.write(struct.pack('<%dH' % (len(codes)), *codes))
+        f.write(bytearray(entries[code] for code in codes))
+    os.rename(tmpPath, path)
+
+    return len(codes)
+
+
+class Tablebase(object):
+    """A read-only, memory-mapped view of the tablebase file.
+
+    The operating system shares the pages of the mapping between all the
+    AI processes which open the same file.
+
+    Attributes:
+        count (int): The number of positions in the table.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        """Maps the tablebase file.
+
+        Raises:
+            IOError: If the file cannot be read.
+            ValueError: If the file is not a tablebase.
+
+        """
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = len(MAGIC) + 2
+        valid = self._map[:len(MAGIC)] == MAGIC and len(self._map) >= header
+        if valid:
+            self.count = struct.unpack_from('<H', self._map, len(MAGIC))[0]
+            valid = len(self._map) == header + 3 * self.count
+
+        if not valid:
+            self._map.close()
+            raise ValueError('Not a tablebase file: %s' % (path))
+
+        self._codes = header
+        self._entries = header + 2 * self.count
+
+    @staticmethod
+    def open(path=DEFAULT_PATH):
+        """Returns the tablebase, or None if the file is not available."""
+        try:
+            return Tablebase(path)
+        except (IOError, ValueError), e:
+            log.warn('The tablebase is not available: {e!s}', e=e)
+            return None
+
+    def probe(self, board, symbol):
+        """Looks up the best move of a position.
+
+        Args:
+            board (model.board.Board): A 3x3 board.
+            symbol (int): The side to move.
+
+        Returns:
+            tuple(int, int): The best move (``row * 3 + col``) and its
+                value (LOSS, DRAW or WIN) for ``symbol``; None if the
+                position is not in the table or the game is over.
+
+        """
+        transform = board.canonical()[1]
+        code = positionCode(board, symbol, transform)
+
+        # binary search of the sorted codes
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if struct.unpack_from('<H', self._map,
+                                  self._codes + 2 * mid)[0] < code:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo == self.count or struct.unpack_from(
+                '<H', self._map, self._codes + 2 * lo)[0] != code:
+            return None
+
+        entry = ord(self._map[self._entries + lo])
+        return board.fromCanonical(entry & 0x0F, transform), \
+            (entry >> 4) - 1
+
+    def close(self):
+        self._map.close()
+
+
+def ensure(path=DEFAULT_PATH):
+    """Builds the tablebase unless a valid file already exists."""
+    tablebase = Tablebase.open(path)
+    if tablebase is not None:
+        tablebase.close()
+        return
+
+    log.info('Building the tablebase {path}', path=path)
+    count = build(path)
+    log.info('The tablebase holds {count} positions', count=count)
+
+
+if __name__ == '__main__':
+    print('%d positions written' % (build(*sys.argv[1:2])))
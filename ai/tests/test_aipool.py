@@ -0,0 +1,65 @@
+# -------------------------------------
+# test_aipool.py
+# -------------------------------------
+
+from twisted.trial import unittest
+
+from ai.protocols.aipool import AiWorkerPool, AiWorkerProtocol
+from model.events import Events, router
+
+
+class Transport(object):
+    """Records the commands sent to an AI worker."""
+
+    pid = 0
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+
+class WorkerEndedTest(unittest.TestCase):
+
+    def setUp(self):
+        # the pool is not started: it spawns no process
+        self.pool = AiWorkerPool(1, 'aiprocess.py')
+        self.worker = AiWorkerProtocol(self.pool)
+        self.worker.transport = Transport()
+        self.pool._workers.append(self.worker)
+        self.failed = []
+
+    def tearDown(self):
+        for uuid in ('g1', 'g2'):
+            router.release(uuid)
+
+    def _onAiFailed(self, uuid, reason):
+        self.failed.append(uuid)
+
+    def test_gamesEnded(self):
+        for uuid in ('g1', 'g2'):
+            self.pool.attach(uuid, 2, 0)
+            router.connect(self._onAiFailed, Events.aiFailed, uuid)
+
+        self.pool.workerEnded(self.worker)
+
+        self.assertEqual(sorted(self.failed), ['g1', 'g2'])
+        self.assertEqual(self.pool._workers, [])
+        self.assertEqual(self.pool._assigned, {})
+
+        # nothing is sent to the dead worker any more
+        sent = len(self.worker.transport.written)
+        router.send(Events.aiMove, 'g1', row=0, col=0)
+        self.assertEqual(len(self.worker.transport.written), sent)
+
+    def test_errorLine(self):
+        self.pool.attach('g1', 2, 0)
+        router.connect(self._onAiFailed, Events.aiFailed, 'g1')
+
+        self.worker.outReceived('Error: no such command (foo)\n')
+        self.worker.outReceived('Error: g2 list index out of range\n')
+        self.assertEqual(self.failed, [])
+
+        self.worker.outReceived('Error: g1 list index out of range\n')
+        self.assertEqual(self.failed, ['g1'])
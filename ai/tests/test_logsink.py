@@ -0,0 +1,130 @@
+# -------------------------------------
+# test_logsink.py
+# -------------------------------------
+
+import os
+
+from twisted.internet import defer, fdesc
+from twisted.logger import LogLevel
+from twisted.trial import unittest
+
+from ai import logsink
+from ai.logsink import AiLogSink, PipeLogObserver
+
+
+def event(text, level=LogLevel.info):
+    return {'log_format': text, 'log_level': level, 'log_time': 0.0,
+            'log_namespace': 'test'}
+
+
+class PipeLogObserverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.r, self.w = os.pipe()
+        fdesc.setNonBlocking(self.r)
+        self.addCleanup(os.close, self.r)
+        self.addCleanup(os.close, self.w)
+
+    def read(self):
+        data = ''
+        while True:
+            try:
+                chunk = os.read(self.r, 65536)
+            except OSError:
+                return data
+            if not chunk:
+                return data
+            data += chunk
+
+    def test_flush(self):
+        observer = PipeLogObserver(self.w, level=LogLevel.info)
+        observer(event('one'))
+        observer(event('hidden', LogLevel.debug))
+        # no text: formatted as None
+        observer({'log_level': LogLevel.info, 'log_time': 0.0})
+        observer(event('two'))
+        observer.flush()
+
+        lines = self.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].endswith('one'))
+        self.assertTrue(lines[1].endswith('two'))
+
+        # the observer goes on
+        observer(event('three'))
+        observer.flush()
+        self.assertTrue(self.read().rstrip().endswith('three'))
+
+    def test_fullPipe(self):
+        observer = PipeLogObserver(self.w)
+        for _ in xrange(2000):
+            observer(event('x' * 200))
+        observer.flush()
+
+        # the pipe has taken what it can; the rest waits
+        data = self.read()
+        self.assertTrue(observer._pending)
+        while observer._pending:
+            observer.flush()
+            data += self.read()
+
+        self.assertEqual(len(data.splitlines()), 2000)
+
+    def test_boundedQueue(self):
+        observer = PipeLogObserver(self.w, maxQueue=2)
+        for text in ('one', 'two', 'three', 'four'):
+            observer(event(text))
+        self.assertEqual(observer.dropped, 2)
+
+        observer.flush()
+        lines = self.read().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[-1], '2 log events dropped')
+
+        # a drop is reported once
+        observer(event('five'))
+        observer.flush()
+        self.assertEqual(len(self.read().splitlines()), 1)
+
+
+class AiLogSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(self.mktemp(), 'ai.log')
+        self.sink = AiLogSink(maxQueue=3, flushInterval=60)
+        # written in place: a reactor thread left running would be
+        # inherited by the processes the search pools fork
+        self.patch(logsink.threads, 'deferToThread',
+                   lambda f, *args: defer.maybeDeferred(f, *args))
+
+    def test_notOpen(self):
+        self.assertEqual(self.sink.feed('one\ntwo\nthr', 'ai-1'), 'thr')
+        self.assertEqual(len(self.sink._lines), 0)
+        self.assertEqual(self.sink.dropped, 0)
+
+    @defer.inlineCallbacks
+    def test_flush(self):
+        self.sink.open(self.path)
+        self.assertEqual(self.sink.feed('one\ntwo\nthr', 'ai-1'), 'thr')
+        self.sink.flush()
+        yield self.sink._writing
+        self.sink.feed('three\n', 'ai-2')
+        yield self.sink.close()
+
+        with open(self.path) as f:
+            self.assertEqual(f.read(), '[ai-1] one\n[ai-1] two\n'
+                                       '[ai-2] three\n')
+
+    @defer.inlineCallbacks
+    def test_boundedQueue(self):
+        dropped = logsink.DROPPED.value
+        self.sink.open(self.path)
+        self.sink.feed('1\n2\n3\n4\n5\n', 'ai-1')
+
+        self.assertEqual(self.sink.dropped, 2)
+        self.assertEqual(logsink.DROPPED.value - dropped, 2)
+        self.assertEqual(logsink.QUEUED.function(), 3)
+
+        yield self.sink.close()
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 3)
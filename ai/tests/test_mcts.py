@@ -0,0 +1,118 @@
+# -------------------------------------
+# test_mcts.py
+# -------------------------------------
+
+from twisted.trial import unittest
+
+from ai.mcts import MonteCarloSearch
+from common.constants import Symbol
+from model.board import Board
+
+
+def position(size, winLength, moves):
+    """A board with the moves played, the sides in turn from X."""
+    board = Board(size, winLength)
+    symbol = Symbol.X
+    for move in moves:
+        board.makeMove(move, symbol)
+        symbol = Symbol.O if symbol == Symbol.X else Symbol.X
+    return board
+
+
+def state(board):
+    return board.ply, board.hash, board.data
+
+
+class MonteCarloTest(unittest.TestCase):
+
+    def search(self, policy='heuristic', playouts=500):
+        return MonteCarloSearch(playouts=playouts, policy=policy, seed=1)
+
+    def test_immediateWin(self):
+        for policy in MonteCarloSearch.POLICIES:
+            # X: 0 1, O: 3 4
+            board = position(3, 3, [0, 3, 1, 4])
+            self.assertEqual(self.search(policy).bestMove(board, Symbol.X)[0],
+                             2)
+
+            # a longer line on a larger board: X completes 0..3
+            board = position(6, 4, [0, 30, 1, 31, 2, 35])
+            self.assertEqual(self.search(policy).bestMove(board, Symbol.X)[0],
+                             3)
+
+    def test_block(self):
+        for policy in MonteCarloSearch.POLICIES:
+            # X: 0 1, O: 4; O has no win of its own
+            board = position(3, 3, [0, 4, 1])
+            self.assertEqual(self.search(policy).bestMove(board, Symbol.O)[0],
+                             2)
+
+            # X: 8 9 10 on a line, open at 11 only; the other moves lose
+            # at once, which takes more playouts to see on a larger board
+            board = position(7, 4, [8, 7, 9, 40, 10])
+            self.assertEqual(
+                self.search(policy, 2000).bestMove(board, Symbol.O)[0], 11)
+
+    def test_boardUnchanged(self):
+        board = position(7, 5, [24, 25, 17])
+        before = state(board)
+        search = self.search()
+        move, _ = search.bestMove(board, Symbol.O)
+
+        self.assertEqual(state(board), before)
+        self.assertEqual(board.getCell(move), Symbol.Empty)
+        self.assertEqual(search.nodes, 500)
+
+    def test_seeded(self):
+        board = position(7, 5, [24, 25, 17])
+        one, other = self.search(), self.search()
+        self.assertEqual(one.bestMove(board, Symbol.O),
+                         other.bestMove(board, Symbol.O))
+        self.assertEqual(one.rootStats, other.rootStats)
+
+    def test_treeReuse(self):
+        board = position(5, 4, [12])
+        search = self.search()
+        move, _ = search.bestMove(board, Symbol.O)
+        self.assertEqual(search.reused, 0)
+        board.makeMove(move, Symbol.O)
+
+        # the reply the search has looked at most
+        kept, _ = search._tree
+        reply = max(kept.children, key=lambda child: child.visits)
+        visits = reply.visits
+        self.assertTrue(visits > 0)
+        board.makeMove(reply.move, Symbol.X)
+
+        search.bestMove(board, Symbol.O)
+        self.assertEqual(search.reused, visits)
+        self.assertEqual(reply.visits, visits + 500)
+
+    def test_noReuseAfterUndo(self):
+        board = position(5, 4, [12])
+        search = self.search()
+        move, _ = search.bestMove(board, Symbol.O)
+        board.makeMove(move, Symbol.O)
+
+        # the AI move and the move before it are taken back
+        board.unmakeMove()
+        board.unmakeMove()
+        board.makeMove(6, Symbol.X)
+        search.bestMove(board, Symbol.O)
+        self.assertEqual(search.reused, 0)
+
+    def test_noReuseAfterReset(self):
+        board = position(5, 4, [12])
+        search = self.search()
+        move, _ = search.bestMove(board, Symbol.O)
+        board.makeMove(move, Symbol.O)
+        kept, _ = search._tree
+        board.makeMove(kept.children[0].move, Symbol.X)
+
+        search.reset()
+        search.bestMove(board, Symbol.O)
+        self.assertEqual(search.reused, 0)
+
+    def test_fullBoard(self):
+        board = position(3, 3, [0, 1, 2, 4, 3, 5, 7, 6, 8])
+        self.assertEqual(self.search().bestMove(board, Symbol.X), (-1, 0.0))
@@ -0,0 +1,46 @@
+# -------------------------------------
+# test_parallel.py
+# -------------------------------------
+
+from twisted.trial import unittest
+
+from ai import parallel
+from ai.parallel import ParallelAlphaBeta, ParallelMonteCarlo, SearchPool
+from common.constants import Symbol
+from model.board import Board
+
+
+class TimeoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = SearchPool(2, 1 << 20)
+        self.board = Board(15, 5)
+        self.board.makeMove(112, Symbol.X)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def searchTimedOut(self, engine):
+        # the results are given up on 0.1 s into a 1 s budget
+        self.patch(parallel, 'GRACE', -0.9)
+        state = (self.board.hash, self.board.ply, self.board.data)
+        move, _ = engine.bestMove(self.board, Symbol.O)
+        self.assertEqual(self.board.getCell(move), Symbol.Empty)
+        self.assertEqual((self.board.hash, self.board.ply, self.board.data),
+                         state)
+
+    def test_alphaBeta(self):
+        self.searchTimedOut(ParallelAlphaBeta(self.pool, timeLimit=1.0))
+
+    def test_monteCarlo(self):
+        self.searchTimedOut(ParallelMonteCarlo(self.pool, timeLimit=1.0))
+
+    def test_newWorkers(self):
+        self.searchTimedOut(ParallelAlphaBeta(self.pool, timeLimit=1.0))
+        self.patch(parallel, 'GRACE', 5.0)
+
+        # the workers left with the tasks were replaced
+        engine = ParallelAlphaBeta(self.pool, maxDepth=2, timeLimit=1.0)
+        move, _ = engine.bestMove(self.board, Symbol.O)
+        self.assertEqual(engine.depthReached, 2)
+        self.assertEqual(self.board.getCell(move), Symbol.Empty)
@@ -0,0 +1,104 @@
+# -------------------------------------
+# test_ttable.py
+# -------------------------------------
+
+from twisted.trial import unittest
+
+from ai.ttable import TranspositionTable
+
+
+class TranspositionTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = TranspositionTable(4096)
+        # the keys of one bucket
+        buckets = self.table.size // 2
+        self.a, self.b, self.c, self.d = [7 + i * buckets for i in xrange(4)]
+
+    def depth(self, key):
+        entry = self.table.probe(key)
+        return entry[0] if entry is not None else None
+
+    def test_roundTrip(self):
+        table = self.table
+        for key, entry in ((1, (4, table.EXACT, 12.0, 40)),
+                           (2, (0, table.LOWER, -1e9, -1)),
+                           (3, (9, table.UPPER, 0.5, 7))):
+            depth, flag, score, move = entry
+            table.store(key, depth, flag, score, move)
+            self.assertEqual(table.probe(key), entry)
+
+        self.assertEqual(table.probe(4), None)
+        self.assertEqual((table.probes, table.hits), (4, 3))
+
+    def test_largeValues(self):
+        table = self.table
+        table.store(5, 300, table.EXACT, 1.0, 2)
+        self.assertEqual(self.depth(5), 0xFF)
+
+        # the key is cut to the width of an entry
+        key = (1 << 80) | 6
+        table.store(key, 1, table.LOWER, 2.0, 3)
+        self.assertEqual(table.probe(key & table._keyMask),
+                         (1, table.LOWER, 2.0, 3))
+
+    def test_update(self):
+        table = self.table
+        table.store(self.a, 5, table.LOWER, 1.0, 1)
+        table.store(self.a, 2, table.EXACT, 3.0, 2)
+        self.assertEqual(table.probe(self.a), (2, table.EXACT, 3.0, 2))
+
+    def test_depthPreferred(self):
+        table = self.table
+        table.store(self.a, 5, table.EXACT, 1.0, 1)
+        # shallower: the second slot
+        table.store(self.b, 3, table.EXACT, 2.0, 2)
+        self.assertEqual((self.depth(self.a), self.depth(self.b)), (5, 3))
+
+        # the second slot is always replaced
+        table.store(self.c, 4, table.EXACT, 3.0, 3)
+        self.assertEqual(
+            (self.depth(self.a), self.depth(self.b), self.depth(self.c)),
+            (5, None, 4))
+
+        # deeper: the first entry is demoted to the second slot
+        table.store(self.d, 7, table.EXACT, 4.0, 4)
+        self.assertEqual(
+            (self.depth(self.a), self.depth(self.c), self.depth(self.d)),
+            (5, None, 7))
+
+        # the entry of a key in the second slot is updated in place
+        table.store(self.a, 1, table.UPPER, 5.0, 5)
+        self.assertEqual(table.probe(self.a), (1, table.UPPER, 5.0, 5))
+        self.assertEqual(self.depth(self.d), 7)
+
+    def test_newSearch(self):
+        table = self.table
+        table.store(self.a, 9, table.EXACT, 1.0, 1)
+        table.newSearch()
+
+        # the old entries are still found
+        self.assertEqual(table.probe(self.a), (9, table.EXACT, 1.0, 1))
+
+        # but a shallower entry of the new search takes the first slot
+        table.store(self.b, 1, table.EXACT, 2.0, 2)
+        table.store(self.c, 2, table.EXACT, 3.0, 3)
+        self.assertEqual(
+            (self.depth(self.a), self.depth(self.b), self.depth(self.c)),
+            (None, 1, 2))
+
+    def test_generationWraps(self):
+        table = self.table
+        table.store(self.a, 9, table.EXACT, 1.0, 1)
+        for _ in xrange(64):
+            table.newSearch()
+
+        # the generation counter has come back to the entry's
+        table.store(self.b, 1, table.EXACT, 2.0, 2)
+        self.assertEqual((self.depth(self.a), self.depth(self.b)), (9, 1))
+
+    def test_clear(self):
+        table = self.table
+        table.store(self.a, 1, table.EXACT, 1.0, 1)
+        table.clear()
+        self.assertEqual(table.probe(self.a), None)
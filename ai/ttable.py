@@ -0,0 +1,135 @@
+# -------------------------------------
+# ttable.py
+# The transposition table of the search engine.
+# -------------------------------------
+
+from array import array
+
+
+class TranspositionTable(object):
+    """A fixed-size table of search results keyed by position hash.
+
+    The entries live in preallocated arrays sized from a memory budget,
+    so the table never grows. Each bucket holds two entries: the first
+    keeps the deepest result (depth-preferred) and the second takes
+    whatever the first refuses or evicts (always-replace). An entry left
+    over from a previous search can always be replaced, whatever its
+    depth.
+
+    Attributes:
+        size (int): The number of entries.
+        probes (int): The number of lookups.
+        hits (int): The number of lookups which found the key.
+    """
+
+    # the bound stored with a score
+    EXACT, LOWER, UPPER = 1, 2, 3
+
+    DEFAULT_BYTES = 16 * 1024 * 1024
+
+    _FLAG_MASK = 0x03
+
+    def __init__(self, maxBytes=DEFAULT_BYTES):
+        """Allocates the table.
+
+        Args:
+            maxBytes (Optional[int]): The memory budget, in bytes.
+
+        """
+        keys = array('L')
+        entryBytes = keys.itemsize + array('d').itemsize + \
+            array('h').itemsize + 2 * array('B').itemsize
+
+        # a power of two number of buckets, so the index is a mask
+        buckets = 1
+        while buckets * 4 * entryBytes <= maxBytes:
+            buckets *= 2
+
+        self.size = 2 * buckets
+        self.probes = 0
+        self.hits = 0
+
+        self._bucketMask = buckets - 1
+        self._keyMask = (1 << (8 * keys.itemsize)) - 1
+        self._generation = 0
+
+        self._keys = array('L', [0]) * self.size
+        self._scores = array('d', [0]) * self.size
+        self._moves = array('h', [-1]) * self.size
+        self._depths = array('B', [0]) * self.size
+        # the bound in the low bits, the search generation above
+        self._flags = array('B', [0]) * self.size
+
+    @property
+    def memory(self):
+        """The number of bytes held by the entries."""
+        return sum(a.itemsize * len(a) for a in (self._keys, self._scores,
+                                                 self._moves, self._depths,
+                                                 self._flags))
+
+    def newSearch(self):
+        """Marks the entries stored so far as belonging to an old search."""
+        self._generation = (self._generation + 1) & 0x3F
+
+    def clear(self):
+        """Drops all the entries."""
+        for i in xrange(self.size):
+            self._flags[i] = 0
+
+    def probe(self, key):
+        """Looks up a position.
+
+        Args:
+            key (int): The position hash.
+
+        Returns:
+            tuple(int, int, float, int): The depth, the bound, the score
+                and the best move stored for the key; None if not found.
+
+        """
+        self.probes += 1
+        key &= self._keyMask
+        slot = (key & self._bucketMask) << 1
+        for i in (slot, slot + 1):
+            if self._keys[i] == key and self._flags[i]:
+                self.hits += 1
+                return (self._depths[i], self._flags[i] & self._FLAG_MASK,
+                        self._scores[i], self._moves[i])
+
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        """Stores the result of a search.
+
+        Args:
+            key (int): The position hash.
+            depth (int): The depth searched below the position.
+            flag (int): EXACT, LOWER or UPPER.
+            score (int): The score found.
+            move (int): The best move found (-1 if none).
+
+        """
+        key &= self._keyMask
+        slot = (key & self._bucketMask) << 1
+        flags = self._flags
+        depth = min(depth, 0xFF)
+
+        if flags[slot] and self._keys[slot] != key:
+            if (flags[slot] >> 2) == self._generation and \
+                    self._depths[slot] > depth:
+                # the deeper entry of this search stays
+                slot += 1
+            else:
+                # the replaced entry is demoted to the second slot
+                self._copy(slot, slot + 1)
+
+        self._keys[slot] = key
+        self._depths[slot] = depth
+        self._scores[slot] = score
+        self._moves[slot] = move
+        flags[slot] = (self._generation << 2) | flag
+
+    def _copy(self, source, target):
+        for a in (self._keys, self._scores, self._moves, self._depths,
+                  self._flags):
+            a[target] = a[source]
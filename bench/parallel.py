@@ -0,0 +1,148 @@
+# -------------------------------------
+# parallel.py
+# The speedup of the parallel search against the number of workers.
+#
+# Run from the project root:
+#   python -m bench.parallel --workers 1,2,4 --engine alphabeta
+# -------------------------------------
+
+from __future__ import print_function
+
+import json
+import multiprocessing
+import platform
+import random
+import time
+
+from twisted.python import usage
+
+from ai.mcts import MonteCarloSearch
+from ai.parallel import ParallelAlphaBeta, ParallelMonteCarlo, SearchPool
+from ai.search import AlphaBetaSearch, OPPONENT, bits, candidates
+from ai.ttable import TranspositionTable
+from common.constants import Engine, Symbol
+from model.board import Board
+
+
+class Options(usage.Options):
+    """The command line options of the benchmark."""
+
+    optParameters = [
+        ['workers', 'w', '1,2,4',
+         'The comma separated worker counts (1 searches in this process).'],
+        ['engine', None, Engine.AlphaBeta, 'alphabeta (the time of a fixed '
+                                           'depth search) or mcts (the '
+                                           'playouts of a fixed budget).'],
+        ['positions', 'n', 8, 'The number of positions searched.', int],
+        ['plies', None, 6, 'The random moves of a position.', int],
+        ['size', None, 15, 'The board size.', int],
+        ['win', None, 5, 'The number of symbols in a row needed to win.',
+         int],
+        ['depth', None, 3, 'The alpha-beta search depth.', int],
+        ['time-limit', None, 1.0, 'The MCTS budget of a position, in '
+                                  'seconds.', float],
+        ['tt-size', None, 16, 'The transposition table budget, in MB.', int],
+        ['seed', None, 1, 'The seed of the positions.', int],
+        ['output', 'o', None, 'The JSON file written (default is stdout).'],
+    ]
+
+    def postOptions(self):
+        if self['engine'] not in (Engine.AlphaBeta, Engine.Mcts):
+            raise usage.UsageError('Unknown engine: %s' % (self['engine']))
+
+        try:
+            self['workers'] = [int(w) for w in self['workers'].split(',')]
+        except ValueError:
+            raise usage.UsageError('Bad worker counts: %s' %
+                                   (self['workers']))
+
+        if min(self['workers']) < 1:
+            raise usage.UsageError('Bad worker counts: %s' %
+                                   (self['workers']))
+
+
+def positions(options):
+    """Plays random moves next to the center: the positions searched."""
+    rand = random.Random(options['seed'])
+    result = []
+    while len(result) < options['positions']:
+        board = Board(options['size'], options['win'])
+        symbol = Symbol.X
+        for _ in xrange(options['plies']):
+            board.setCell(rand.choice(list(bits(candidates(board)))), symbol)
+            symbol = OPPONENT[symbol]
+
+        if not board.isWinner(Symbol.X) and not board.isWinner(Symbol.O):
+            result.append((board, symbol))
+
+    return result
+
+
+def newEngine(options, pool):
+    budget = options['tt-size'] * 1024 * 1024
+    if options['engine'] == Engine.Mcts:
+        if pool is None:
+            return MonteCarloSearch(timeLimit=options['time-limit'])
+        return ParallelMonteCarlo(pool, timeLimit=options['time-limit'])
+
+    if pool is None:
+        return AlphaBetaSearch(options['depth'], table=TranspositionTable(
+            budget))
+    return ParallelAlphaBeta(pool, maxDepth=options['depth'])
+
+
+def run(options, workers, boards):
+    """Searches the positions with a number of workers."""
+    budget = options['tt-size'] * 1024 * 1024
+    pool = SearchPool(workers, budget) if workers > 1 else None
+    try:
+        nodes = 0
+        t0 = time.time()
+        for board, symbol in boards:
+            # a new engine a position: no table carried over
+            engine = newEngine(options, pool)
+            engine.bestMove(board, symbol)
+            nodes += engine.nodes
+        seconds = time.time() - t0
+    finally:
+        if pool is not None:
+            pool.close()
+
+    return {'workers': workers, 'seconds': seconds, 'nodes': nodes,
+            'nodesPerSec': nodes / seconds}
+
+
+def main():
+    options = Options()
+    options.parseOptions()
+
+    boards = positions(options)
+    runs = [run(options, workers, boards) for workers in options['workers']]
+
+    base = runs[0]
+    for r in runs:
+        if options['engine'] == Engine.Mcts:
+            # the budget is fixed: the speedup is in the playouts
+            r['speedup'] = r['nodesPerSec'] / base['nodesPerSec']
+        else:
+            r['speedup'] = base['seconds'] / r['seconds']
+
+    report = {
+        'python': platform.python_version(),
+        'cpus': multiprocessing.cpu_count(),
+        'engine': options['engine'],
+        'size': options['size'],
+        'win': options['win'],
+        'positions': len(boards),
+        'runs': runs,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if options['output']:
+        with open(options['output'], 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# -------------------------------------
+# patterns.py
+# The batched NumPy evaluation against the search's own evaluation.
+#
+# Run from the project root (NumPy is needed):
+#   python -m bench.patterns --size 15 --win 5 --batch 1,32,1024
+# -------------------------------------
+
+from __future__ import print_function
+
+import json
+import platform
+import sys
+import time
+
+from twisted.python import usage
+
+try:
+    import numpy
+except ImportError:
+    sys.exit('The pattern benchmark needs NumPy.')
+
+from ai.patterns import PatternEvaluator
+from ai.search import AlphaBetaSearch, lineWeights
+from bench.parallel import positions
+
+
+class Options(usage.Options):
+    """The command line options of the benchmark."""
+
+    optParameters = [
+        ['batch', 'b', '1,32,1024',
+         'The comma separated batch sizes (positions per call).'],
+        ['positions', 'n', 1024, 'The number of positions scored.', int],
+        ['plies', None, 16, 'The random moves of a position.', int],
+        ['size', None, 15, 'The board size.', int],
+        ['win', None, 5, 'The number of symbols in a row needed to win.',
+         int],
+        ['seed', None, 1, 'The seed of the positions.', int],
+        ['output', 'o', None, 'The JSON file written (default is stdout).'],
+    ]
+
+    def postOptions(self):
+        try:
+            self['batch'] = [int(b) for b in self['batch'].split(',')]
+        except ValueError:
+            raise usage.UsageError('Bad batch sizes: %s' % (self['batch']))
+
+        if min(self['batch']) < 1:
+            raise usage.UsageError('Bad batch sizes: %s' % (self['batch']))
+
+
+def main():
+    options = Options()
+    options.parseOptions()
+
+    boards = positions(options)
+    symbols = [symbol for _, symbol in boards]
+    boards = [board for board, _ in boards]
+
+    search = AlphaBetaSearch()
+    search._weights = lineWeights(options['win'])
+    t0 = time.time()
+    expected = [search._evaluate(board, symbol)
+                for board, symbol in zip(boards, symbols)]
+    seconds = time.time() - t0
+    runs = [{'batch': 1, 'evaluator': 'search',
+             'usPerPosition': seconds / len(boards) * 1e6}]
+
+    evaluator = PatternEvaluator(options['size'], options['win'])
+    for batch in options['batch']:
+        scores = []
+        t0 = time.time()
+        for i in xrange(0, len(boards), batch):
+            planes = evaluator.planes(boards[i:i + batch])
+            scores.extend(evaluator.evaluate(
+                planes, numpy.array(symbols[i:i + batch])).tolist())
+        seconds = time.time() - t0
+
+        if scores != expected:
+            sys.exit('The scores of the batches of {0:d} differ from the '
+                     'search.'.format(batch))
+
+        runs.append({'batch': batch, 'evaluator': 'numpy',
+                     'usPerPosition': seconds / len(boards) * 1e6})
+
+    report = {
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'size': options['size'],
+        'win': options['win'],
+        'positions': len(boards),
+        'runs': runs,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if options['output']:
+        with open(options['output'], 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
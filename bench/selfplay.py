@@ -0,0 +1,383 @@
+# -------------------------------------
+# selfplay.py
+# The self-play benchmark: AI against AI, with JSON results.
+#
+# Run from the project root:
+#   python -m bench.selfplay --games 20 --mode both
+# -------------------------------------
+
+from __future__ import print_function
+
+import json
+import platform
+import sys
+import time
+
+from twisted.internet import defer, reactor
+from twisted.python import usage
+
+from ai.aiprocess import AiGame
+from ai.protocols import aiprotocol
+from ai.protocols.aipool import AiWorkerPool
+from ai.tablebase import Tablebase, ensure
+from ai.ttable import TranspositionTable
+from common.constants import Engine, PlayerType, Status, Symbol
+from common.stats import Latencies
+from model.events import Events, router
+from model.game import Game
+from model.player import Player
+
+
+RESULTS = {Status.Tie: 'tie', Status.X_Won: 'X', Status.O_Won: 'O',
+           Status.Aborted: 'aborted'}
+
+
+class Options(usage.Options):
+    """The command line options of the benchmark."""
+
+    optFlags = [
+        ['no-tablebase', None, 'Search the 3x3 moves instead of looking '
+                               'them up.'],
+    ]
+
+    optParameters = [
+        ['mode', 'm', 'inprocess',
+         'inprocess (model.game.Game, no process), server (GameServer '
+         'with AI processes) or both.'],
+        ['games', 'n', 10, 'The number of games per mode.', int],
+        ['size', None, 3, 'The board size.', int],
+        ['win', None, None, 'The number of symbols in a row needed to win '
+                            '(default is the board size, at most 5).', int],
+        ['depth', None, 0, 'The search depth (0 searches to the end).', int],
+        ['time-limit', None, 2.0, 'The time budget of a move, in seconds.',
+         float],
+        ['engine', None, Engine.AlphaBeta, 'The search engine of the AI '
+                                           'player: alphabeta or mcts.'],
+        ['opponent-engine', None, Engine.AlphaBeta,
+         'The search engine of the other side: alphabeta or mcts.'],
+        ['playouts', None, None, 'The playouts of a move of the MCTS '
+                                 'engine (default is no limit but the '
+                                 'time budget).', int],
+        ['tt-size', None, 16, 'The transposition table budget, in MB.', int],
+        ['ai-workers', None, 2, 'The AI processes of the server mode.', int],
+        ['search-workers', None, 1, 'The processes each AI process of the '
+                                    'server mode splits its searches '
+                                    'across.', int],
+        ['concurrency', None, 1, 'The games played at once in the server '
+                                 'mode.', int],
+        ['output', 'o', None, 'The JSON file written (default is stdout).'],
+    ]
+
+    def postOptions(self):
+        if self['mode'] not in ('inprocess', 'server', 'both'):
+            raise usage.UsageError('Unknown mode: %s' % (self['mode']))
+
+        for name in ('engine', 'opponent-engine'):
+            if self[name] not in (Engine.AlphaBeta, Engine.Mcts):
+                raise usage.UsageError('Unknown engine: %s' % (self[name]))
+
+
+class Run(object):
+    """The counters and the latencies of one benchmark mode."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.games = 0
+        self.moves = 0
+        self.nodes = 0
+        self.searchSeconds = 0.0
+        self.results = dict((name, 0) for name in RESULTS.itervalues())
+        self.latencies = Latencies()
+        self._start = time.time()
+        self._seconds = None
+
+    def search(self, player, row, col):
+        """Lets an in-process player reply, timing its search."""
+        t0 = time.time()
+        m = player.reply(row, col)
+        seconds = time.time() - t0
+
+        self.latencies.add('search', seconds)
+        self.searchSeconds += seconds
+        self.nodes += player.nodes
+        return m
+
+    def gameOver(self, status):
+        self.games += 1
+        self.results[RESULTS[status]] += 1
+
+    def stop(self):
+        self._seconds = time.time() - self._start
+
+    def report(self):
+        seconds = self._seconds or (time.time() - self._start)
+        return {
+            'mode': self.mode,
+            'games': self.games,
+            'moves': self.moves,
+            'nodes': self.nodes,
+            'seconds': seconds,
+            'gamesPerSec': self.games / seconds,
+            'movesPerSec': self.moves / seconds,
+            'nodesPerSec': (self.nodes / self.searchSeconds
+                            if self.searchSeconds else None),
+            'results': self.results,
+            'latency': self.latencies.summary(),
+        }
+
+
+class InProcessAi(object):
+    """Plays the AI side of the games in the benchmark process.
+
+    It takes the place of the AI processes (see Game.start): the moves
+    are asked and answered through the event router, synchronously.
+    """
+
+    def __init__(self, run, options, tablebase, table):
+        self._run = run
+        self._options = options
+        self._tablebase = tablebase
+        self._table = table
+        self._games = {}
+
+    def attach(self, uuid, symbol, depth, size=3, winLength=3,
+               timeLimit=None, engine=None, playouts=None):
+        # the engine of the game, as an AI process would take it
+        self._games[uuid] = _newPlayer(uuid, symbol, self._options,
+                                       self._tablebase, self._table,
+                                       engine or Engine.AlphaBeta)
+        router.connect(self._onAiMoveRequest, Events.aiMove, uuid)
+        router.connect(self._onTakeback, Events.takeback, uuid)
+        router.connect(self._onQuit, Events.quit, uuid)
+
+    def _onAiMoveRequest(self, uuid, row, col, traceId=None):
+        m = self._run.search(self._games[str(uuid)], row, col)
+        size = self._options['size']
+        if m == -1:
+            row = col = -1
+        else:
+            row, col = divmod(m, size)
+
+        router.send(Events.aiResponse, uuid, row=row, col=col,
+                    traceId=traceId)
+
+    def _onTakeback(self, uuid, count):
+        self._games[str(uuid)].undo(count)
+
+    def _onQuit(self, uuid):
+        self._games.pop(str(uuid), None)
+
+
+class Listener(object):
+    """Stands for the remote listener of a game in the server mode."""
+
+    def __init__(self):
+        self.aiMoved = defer.Deferred()
+
+    def callRemote(self, name, **kwargs):
+        d, self.aiMoved = self.aiMoved, defer.Deferred()
+        d.callback(kwargs)
+        return defer.succeed(None)
+
+
+def _newPlayer(uuid, symbol, options, tablebase, table, engine):
+    return AiGame(uuid, symbol, options['depth'], options['size'],
+                  options['win'] or options['size'], tablebase, table,
+                  options['time-limit'], engine, options['playouts'])
+
+
+def _players(i):
+    """The players of the i-th game: the human side alternates X and O."""
+    human = Symbol.X if i % 2 == 0 else Symbol.O
+    ai = Symbol.O if human == Symbol.X else Symbol.X
+    playerOne = Player.playerBuilder().symbol(Symbol.X).type(
+        PlayerType.Human if human == Symbol.X else PlayerType.Ai).build()
+    playerTwo = Player.playerBuilder().symbol(Symbol.O).type(
+        PlayerType.Human if human == Symbol.O else PlayerType.Ai).build()
+    return human, ai, playerOne, playerTwo
+
+
+def inProcess(options, tablebase):
+    """Plays the games against model.game.Game, in this process.
+
+    Both sides are searched here; the 'turn' stage is a makeMove call,
+    the reply of the AI side included.
+    """
+    run = Run('inprocess')
+    budget = options['tt-size'] * 1024 * 1024
+    aiPool = InProcessAi(run, options, tablebase,
+                         TranspositionTable(budget))
+    table = TranspositionTable(budget)
+
+    for i in xrange(options['games']):
+        human, ai, playerOne, playerTwo = _players(i)
+        aiPlayer = playerOne if playerOne.isAi else playerTwo
+        aiPlayer.depth = options['depth']
+        aiPlayer.engine = options['engine']
+
+        t0 = time.time()
+        game = Game.create(playerOne, playerTwo, options['size'],
+                           options['win'])
+        game.start(aiPool)
+        run.latencies.add('createGame', time.time() - t0)
+
+        player = _newPlayer(str(game.uuid), human, options, tablebase,
+                            table, options['opponent-engine'])
+        row = col = -1
+        if game.version:
+            # the AI side opened
+            row, col = divmod(game.statusSince(0).changes[0][0],
+                              options['size'])
+
+        while not game.isGameOver():
+            m = run.search(player, row, col)
+            row, col = divmod(m, options['size'])
+
+            t0 = time.time()
+            status = game.makeMove(row, col, human)
+            run.latencies.add('turn', time.time() - t0)
+
+            # the AI side replies before makeMove returns
+            if len(status.changes) > 1:
+                row, col = divmod(status.changes[-1][0], options['size'])
+
+        run.moves += game.version
+        run.gameOver(game.status)
+        game.close()
+
+    run.stop()
+    return run
+
+
+@defer.inlineCallbacks
+def throughServer(options, tablebase):
+    """Plays the games through GameServer, against the AI processes.
+
+    The human side is searched here and sends its moves with makeTurn;
+    the 'turn' stage is the time until the AI reply comes back.
+    """
+    from server.game_server import GameServer
+
+    aiPool = AiWorkerPool(options['ai-workers'], aiprotocol.scriptPath(),
+                          '--tt-size', str(options['tt-size']),
+                          '--search-workers', str(options['search-workers']))
+    aiPool.start()
+    yield aiPool.whenReady()
+    server = GameServer(aiPool)
+    table = TranspositionTable(options['tt-size'] * 1024 * 1024)
+
+    run = Run('server')
+    size = options['size']
+
+    def play(i):
+        human, ai, playerOne, playerTwo = _players(i)
+
+        t0 = time.time()
+        gameGuid = server.remote_createGame(
+            playerOne.symbol, PlayerType.Ai if playerOne.isAi else
+            PlayerType.Human, playerTwo.symbol, PlayerType.Ai
+            if playerTwo.isAi else PlayerType.Human,
+            searchDepth=options['depth'], boardSize=size,
+            winLength=options['win'], timeLimit=options['time-limit'],
+            engine=options['engine'], playouts=options['playouts'])
+        run.latencies.add('createGame', time.time() - t0)
+
+        listener = Listener()
+        opened = listener.aiMoved
+        server.remote_addListener(gameGuid, listener)
+
+        player = _newPlayer(gameGuid, human, options, tablebase, table,
+                            options['opponent-engine'])
+        return _playTurns(run, server, gameGuid, human, player, size,
+                          opened if ai == Symbol.X else None)
+
+    semaphore = defer.DeferredSemaphore(max(1, options['concurrency']))
+    yield defer.gatherResults([semaphore.run(play, i)
+                               for i in xrange(options['games'])])
+
+    run.stop()
+    aiPool.stop()
+    defer.returnValue(run)
+
+
+@defer.inlineCallbacks
+def _playTurns(run, server, gameGuid, human, player, size, opened):
+    row = col = -1
+    moves = 0
+    if opened is not None:
+        t0 = time.time()
+        reply = yield opened
+        run.latencies.add('turn', time.time() - t0)
+        row, col = reply['row'], reply['col']
+        moves += 1
+
+    while True:
+        m = run.search(player, row, col)
+        row, col = divmod(m, size)
+
+        t0 = time.time()
+        turn = yield server.remote_makeTurn(gameGuid, human, row, col)
+        run.latencies.add('turn', time.time() - t0)
+
+        moves += 1 + (turn.aiMove is not None)
+        if turn.status != Status.InProgress:
+            break
+
+        row, col = turn.aiMove
+
+    run.moves += moves
+    run.gameOver(turn.status)
+    server.remote_closeGame(gameGuid)
+
+
+def main():
+    options = Options()
+    try:
+        options.parseOptions()
+    except usage.UsageError, e:
+        print('{0}\n{1}'.format(e, options), file=sys.stderr)
+        sys.exit(1)
+
+    tablebase = None
+    if not options['no-tablebase']:
+        ensure()
+        tablebase = Tablebase.open()
+
+    report = {
+        'benchmark': 'selfplay',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'config': dict((name, options[name]) for name in (
+            'games', 'size', 'win', 'depth', 'time-limit', 'tt-size',
+            'ai-workers', 'concurrency', 'no-tablebase')),
+        'runs': [],
+    }
+
+    if options['mode'] in ('inprocess', 'both'):
+        report['runs'].append(inProcess(options, tablebase).report())
+
+    if options['mode'] in ('server', 'both'):
+        def done(run):
+            report['runs'].append(run.report())
+
+        def failed(failure):
+            report['error'] = failure.getErrorMessage()
+
+        d = throughServer(options, tablebase)
+        d.addCallbacks(done, failed)
+        d.addBoth(lambda _: reactor.callLater(0.5, reactor.stop))
+        reactor.run()
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if options['output']:
+        with open(options['output'], 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if 'error' in report:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 from __future__ import print_function
+import math
 import sys
 import os
 from twisted.spread import pb, jelly
@@ -13,6 +14,7 @@ from common.constants import Symbol, PlayerType, \
     Status, Errors
 from model.game import Board
 from common.ifaces import IGameEventsHandler
+from common.ipc import applyStatus
 
 
 class ConsoleClient(pb.Referenceable):
@@ -27,7 +29,8 @@ class ConsoleClient(pb.Referenceable):
     def __init__(self, symbol=Symbol.X):
         self._gameGuid = None
         self._symbol = symbol
-        self._data = Board()
+        self._data = [str(Symbol.Empty)] * (Board.SIZE * Board.SIZE)
+        self._version = 0
         self._turn = Symbol.X if symbol == Symbol.X else Symbol.O
 
     def connect(self):
@@ -85,6 +88,15 @@ class ConsoleClient(pb.Referenceable):
 
         d.addCallbacks(self._onMakeMove, self._onMakeMoveError)
 
+    def _takeback(self):
+        """Takes back the last move (and the AI reply).
+        """
+        d = self.server.callRemote('takeback',
+                                   self._gameGuid,
+                                   self._symbol)
+
+        d.addCallbacks(self._onMakeMove, self._onMakeMoveError)
+
     def _onNewGameCreated(self, guid):
         """Called when a new game has been successfully created.
         """
@@ -113,13 +125,14 @@ class ConsoleClient(pb.Referenceable):
         self.log.debug('received: {results}',
                        results=results)
 
-        if results.data is not None:
-            self._data = results.data
-            self._drawBoard()
+        self._updateBoard(results)
 
         if results.error == Errors.IlegalMove:
             self.log.error('Illegal move !')
 
+        if results.error == Errors.NoMoveToTakeBack:
+            self.log.error('No move to take back !')
+
         if results.status != Status.InProgress:
             #
             self.log.info('The game is over (status {status:d})',
@@ -163,11 +176,30 @@ class ConsoleClient(pb.Referenceable):
 
         self._quit()
 
+    def _updateBoard(self, results):
+        """Applies the changes carried by a status and draws the board.
+
+        If a status was missed the changes since the local version are
+        asked for.
+        """
+        version = applyStatus(self._data, self._version, results)
+        if version is None:
+            self.log.debug('missed a status: asking for version {version}',
+                           version=self._version)
+            d = self.server.callRemote('getStatus',
+                                       self._gameGuid, self._version)
+            d.addCallback(self._updateBoard)
+            return
+
+        self._version = version
+        self._drawBoard()
+
     def _drawBoard(self):
+        size = int(math.sqrt(len(self._data)))
         s = ""
-        for i in xrange(0, 3):
-            for j in xrange(0, 3):
-                symbol = int(self._data[i * 3 + j])
+        for i in xrange(0, size):
+            for j in xrange(0, size):
+                symbol = int(self._data[i * size + j])
                 if symbol == Symbol.Empty:
                     s += ' _ '
                 elif symbol == Symbol.X:
@@ -191,7 +223,8 @@ class ConsoleClient(pb.Referenceable):
             print('Waiting for the opponent move ...')
             return
 
-        print('Enter the move (symbol row count) or \'q|Q\' to exit: ')
+        print('Enter the move (symbol row count), \'u|U\' to take it '
+              'back or \'q|Q\' to exit: ')
         cmd = sys.stdin.readline().strip().lower()
 
         if cmd == 'q':
@@ -199,6 +232,10 @@ class ConsoleClient(pb.Referenceable):
             self._quit()
             return
 
+        if cmd == 'u':
+            self._takeback()
+            return
+
         tokens = cmd.split()
         if len(tokens) == 3:
             s, r, c = tokens
@@ -238,7 +275,7 @@ class ConsoleClient(pb.Referenceable):
         return Symbol.O if symbol == Symbol.X else Symbol.X
 
     #
-    def remote_onAiMoved(self, row, col, results):
+    def remote_onAiMoved(self, row, col, results, traceId=None):
         """Handles the AI player's move.
         """
         self.log.debug('onAiMoved: row {row}, col {col}'.format(row=row,
@@ -246,13 +283,14 @@ class ConsoleClient(pb.Referenceable):
 
         self.log.debug('received: {results}', results=results)
 
-        if results.data is not None:
-            self._data = results.data
-            self._drawBoard()
+        self._updateBoard(results)
 
         if results.error == Errors.IlegalMove:
             self.log.error('Illegal move !')
 
+        if results.error == Errors.AiFailed:
+            self.log.error('The AI player has failed !')
+
         if results.status != Status.InProgress:
             self.log.info('The game is over (status {status:d})',
                           status=results.status)
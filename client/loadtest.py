@@ -0,0 +1,277 @@
+"""
+    A headless load generator for the game server.
+
+    It plays many scripted games at once (random legal moves) with the
+    same PB calls as the console client, and reports the latencies of
+    createGame, makeMove and of the AI move notifications as JSON.
+
+    Usage (the game server must be running):
+        python loadtest.py --games 1000 --concurrency 10,100,500
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import random
+import sys
+import time
+
+from twisted.internet import defer, reactor
+from twisted.logger import Logger
+from twisted.python import usage
+from twisted.spread import pb
+import zope.interface
+
+# configures the python source path for this module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+
+from common.constants import PlayerType, Status, Symbol
+from common.ifaces import IGameEventsHandler
+from common.ipc import applyStatus
+from common.stats import Latencies
+from common.tracing import newTraceId, tracer
+
+
+class Options(usage.Options):
+    """The command line options of the load generator."""
+
+    optParameters = [
+        ['host', None, 'localhost', 'The game server host.'],
+        ['port', None, 8789, 'The game server port.', int],
+        ['connections', 'c', 4, 'The number of PB connections.', int],
+        ['concurrency', None, '10',
+         'The number of games in flight; a comma separated list runs one '
+         'level after the other (e.g. 10,100,500).'],
+        ['games', 'n', 100, 'The number of games played per level.', int],
+        ['size', None, 3, 'The board size.', int],
+        ['depth', None, 0, 'The search depth of the AI player.', int],
+        ['seed', None, None, 'The seed of the scripted moves.', int],
+        ['output', 'o', None, 'The JSON file written (default is stdout).'],
+        ['trace-file', None, None,
+         'Traces the moves: the client spans are appended to this file '
+         '(the game server may append its own with its --trace-file).'],
+    ]
+
+    def postOptions(self):
+        try:
+            self['levels'] = [int(level) for level in
+                              self['concurrency'].split(',')]
+        except ValueError:
+            raise usage.UsageError('Bad concurrency: %s' %
+                                   (self['concurrency']))
+
+
+class ScriptedGame(pb.Referenceable):
+    """One game played with random legal moves.
+
+    It is its own listener: the AI moves come to remote_onAiMoved.
+    """
+
+    zope.interface.implements(IGameEventsHandler)
+
+    log = Logger()
+
+    def __init__(self, server, symbol, size, latencies):
+        self.server = server
+        self.symbol = symbol
+        self.size = size
+        self.status = Status.InProgress
+        self._latencies = latencies
+        self._data = [str(Symbol.Empty)] * (size * size)
+        self._version = 0
+        self._aiMoved = defer.Deferred()
+        self._sent = None
+
+    @defer.inlineCallbacks
+    def play(self, depth):
+        """Plays the game to its end.
+
+        Returns:
+            Deferred: Fires with the status of the game.
+
+        """
+        ai = Symbol.O if self.symbol == Symbol.X else Symbol.X
+        playerOneType = PlayerType.Human if self.symbol == Symbol.X \
+            else PlayerType.Ai
+        playerTwoType = PlayerType.Ai if self.symbol == Symbol.X \
+            else PlayerType.Human
+
+        # the AI opening is timed from the creation of the game
+        self._sent = time.time()
+        self.guid = yield self.server.callRemote(
+            'createGame', playerOneSymbol=Symbol.X,
+            playerOneType=playerOneType, playerTwoSymbol=Symbol.O,
+            playerTwoType=playerTwoType, searchDepth=depth,
+            boardSize=self.size)
+        self._latencies.add('createGame', time.time() - self._sent)
+
+        aiMoved = self._aiMoved
+        yield self.server.callRemote('addListener', self.guid, self)
+        if ai == Symbol.X:
+            yield aiMoved
+
+        while self.status == Status.InProgress:
+            cells = [i for i, symbol in enumerate(self._data)
+                     if symbol == str(Symbol.Empty)]
+            row, col = divmod(random.choice(cells), self.size)
+
+            aiMoved = self._aiMoved
+            traceId = newTraceId() if tracer.enabled else None
+            tracer.span(traceId, 'client.sent', game=self.guid)
+            self._sent = time.time()
+            results = yield self.server.callRemote(
+                'makeMove', self.guid, self.symbol, row, col,
+                traceId=traceId)
+            self._latencies.add('makeMove', time.time() - self._sent)
+            tracer.span(traceId, 'client.replied')
+
+            yield self._update(results)
+            if self.status == Status.InProgress:
+                yield aiMoved
+
+        yield self.server.callRemote('closeGame', self.guid)
+        defer.returnValue(self.status)
+
+    def remote_onAiMoved(self, row, col, results, traceId=None):
+        """Handles the AI player's move.
+
+        The trace id is the one of the move the AI player answered.
+        """
+        self._latencies.add('onAiMoved', time.time() - self._sent)
+        tracer.span(traceId, 'client.aiMoved')
+
+        d, self._aiMoved = self._aiMoved, defer.Deferred()
+        self._update(results).chainDeferred(d)
+
+    @defer.inlineCallbacks
+    def _update(self, results):
+        """Applies a status; asks for the changes if one was missed."""
+        version = applyStatus(self._data, self._version, results)
+        if version is None:
+            results = yield self.server.callRemote('getStatus', self.guid,
+                                                   self._version)
+            version = applyStatus(self._data, self._version, results)
+
+        self._version = version
+        self.status = results.status
+
+
+@defer.inlineCallbacks
+def connect(host, port, count):
+    """Opens the PB connections and returns their root objects."""
+    roots = []
+    for _ in xrange(count):
+        factory = pb.PBClientFactory()
+        reactor.connectTCP(host, port, factory)
+        root = yield factory.getRootObject()
+        roots.append(root)
+
+    defer.returnValue(roots)
+
+
+@defer.inlineCallbacks
+def runLevel(roots, concurrency, options):
+    """Plays the games of one concurrency level.
+
+    Returns:
+        Deferred: Fires with the report of the level.
+
+    """
+    latencies = Latencies()
+    results = dict(games=0, errors=0)
+
+    def play(i):
+        game = ScriptedGame(roots[i % len(roots)],
+                            Symbol.X if i % 2 == 0 else Symbol.O,
+                            options['size'], latencies)
+        d = game.play(options['depth'])
+
+        def done(status):
+            results['games'] += 1
+
+        def failed(failure):
+            results['errors'] += 1
+            print('game failed: {0}'.format(failure.getErrorMessage()),
+                  file=sys.stderr)
+
+        d.addCallbacks(done, failed)
+        return d
+
+    semaphore = defer.DeferredSemaphore(concurrency)
+    start = time.time()
+    yield defer.gatherResults([semaphore.run(play, i)
+                               for i in xrange(options['games'])])
+    seconds = time.time() - start
+
+    defer.returnValue({
+        'concurrency': concurrency,
+        'games': results['games'],
+        'errors': results['errors'],
+        'seconds': seconds,
+        'gamesPerSec': results['games'] / seconds,
+        'callsPerSec': (latencies.count('makeMove') +
+                        latencies.count('createGame')) / seconds,
+        'latency': latencies.summary(),
+    })
+
+
+@defer.inlineCallbacks
+def run(options):
+    roots = yield connect(options['host'], options['port'],
+                          max(1, options['connections']))
+
+    report = {
+        'benchmark': 'loadtest',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': dict((name, options[name]) for name in (
+            'host', 'port', 'connections', 'games', 'size', 'depth')),
+        'levels': [],
+    }
+
+    for concurrency in options['levels']:
+        level = yield runLevel(roots, concurrency, options)
+        report['levels'].append(level)
+
+    defer.returnValue(report)
+
+
+def main():
+    options = Options()
+    try:
+        options.parseOptions()
+    except usage.UsageError, e:
+        print('{0}\n{1}'.format(e, options), file=sys.stderr)
+        sys.exit(1)
+
+    random.seed(options['seed'])
+    if options['trace-file']:
+        tracer.open(options['trace-file'])
+    outcome = {}
+
+    def done(report):
+        outcome['report'] = report
+
+    def failed(failure):
+        print('load test failed: {0}'.format(failure.getErrorMessage()),
+              file=sys.stderr)
+
+    d = run(options)
+    d.addCallbacks(done, failed)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+    if 'report' not in outcome:
+        sys.exit(1)
+
+    output = json.dumps(outcome['report'], indent=2, sort_keys=True)
+    if options['output']:
+        with open(options['output'], 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
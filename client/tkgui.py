@@ -26,6 +26,7 @@ from pydispatch import dispatcher
 
 from common.constants import Symbol, Status, Errors, PlayerType
 from common.ifaces import IGameEventsHandler
+from common.ipc import applyStatus
 from model.game import Board
 
 # events
@@ -60,7 +61,8 @@ class Client(pb.Referenceable):
         self.server = None
         self._symbol = symbol
         self.uuid = None
-        self.data = Board
+        self._data = None
+        self._version = 0
         self.turn = Symbol.X if symbol == Symbol.X else Symbol.O
 
         self._setupEventHandlers()
@@ -137,6 +139,8 @@ class Client(pb.Referenceable):
                        uuid=repr(guid))
 
         self.uuid = guid
+        self._data = [str(Symbol.Empty)] * (Board.SIZE * Board.SIZE)
+        self._version = 0
 
         # register for the game events/notifications
         d = self.server.callRemote('addListener',
@@ -170,8 +174,7 @@ class Client(pb.Referenceable):
         self.log.debug('received: {results}',
                        results=results)
 
-        if results.data is not None:
-            self._data = results.data
+        self._updateBoard(results)
 
         if results.error == Errors.IlegalMove:
             self.log.error('Illegal move !')
@@ -189,13 +192,15 @@ class Client(pb.Referenceable):
         self.log.error('makeMove failed')
         dispatcher.send(signal=ev_aiMovedFailure, failure=failure)
 
-    def remote_onAiMoved(self, row, col, results):
+    def remote_onAiMoved(self, row, col, results, traceId=None):
         self.log.debug('remote_onAiMoved - {row}, {col}, {symbol}',
                        row=row, col=col, symbol=results.turn)
 
         self.log.debug('remote_onAiMoved - status = {status}',
                        status=results.status)
 
+        self._updateBoard(results)
+
         if results.status != Status.InProgress:
             dispatcher.send(signal=ev_gameOver, status=results.status)
 
@@ -203,6 +208,20 @@ class Client(pb.Referenceable):
                         row=row, col=col,
                         symbol=self._getOponent())
 
+    def _updateBoard(self, results):
+        """Applies the changes carried by a status to the local board.
+
+        If a status was missed the changes since the local version are
+        asked for.
+        """
+        version = applyStatus(self._data, self._version, results)
+        if version is None:
+            d = self.server.callRemote('getStatus', self.uuid, self._version)
+            d.addCallback(self._updateBoard)
+            return
+
+        self._version = version
+
     def _getOponent(self):
         return Symbol.X if self._symbol == Symbol.O else Symbol.O
 
@@ -401,6 +420,8 @@ class App(ttk.Tk):
             s = 'X won !'
         elif status == Status.O_Won:
             s = 'O won !'
+        elif status == Status.Aborted:
+            s = 'the AI player has failed'
         else:
             s = 'WTF ???'
 
@@ -5,11 +5,13 @@ class Status:
         Tie
         Player 'X' won
         Player 'O' won
+        Aborted: the AI player has failed
     """
     Tie = 0
     X_Won = 1
     O_Won = 2
     InProgress = 3
+    Aborted = 4
 
 
 class Symbol:
@@ -35,3 +37,17 @@ class Errors:
     NoError = 0
     IlegalMove = 1
     WrongTurn = 2
+    NoSuchGame = 3
+    InvalidMove = 4
+    NoMoveToTakeBack = 5
+    AiFailed = 6
+
+
+class Engine:
+    """
+    The search engine of the AI player:
+        alpha-beta search, deepened iteratively
+        Monte Carlo tree search
+    """
+    AlphaBeta = 'alphabeta'
+    Mcts = 'mcts'
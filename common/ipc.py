@@ -4,56 +4,108 @@
 # -------------------------------------
 
 from twisted.spread import pb
+from common import wire
 from common.constants import Errors
 
 
 class GameStatus:
     """
 
+    A status carries either the whole board (``data``, a snapshot) or the
+    cells changed since the previous version (``changes``, a delta).
+    The version of a game is the number of moves made so far.
+
     Attributes:
-        data (list[str]):
+        data (list[str]): The whole board; None in a delta.
         turn (int):
         status (int): The status of the game:
             0 - tie
             1 - X won
             2 - O won
             3 - in progress
+            4 - aborted (the AI player has failed)
         error (int): The error code.
+        version (int): The version of the board.
+        changes (list[tuple(int, int)]): The (cell, symbol) pairs set
+            since the version ``version - len(changes)``; None in a
+            snapshot.
 
     """
 
     def __init__(self,
                  data=None, turn=None,
-                 status=None, error=Errors.NoError):
+                 status=None, error=Errors.NoError,
+                 version=None, changes=None):
         self.data = data
         self.turn = turn
         self.status = status
         self.error = error
+        self.version = version
+        self.changes = changes
 
     def __str__(self):
-        s = ''
-        for c in self.data:
-            s += c
+        if self.data is not None:
+            board = "data:'{0}'".format(''.join(self.data))
+        else:
+            board = 'changes:{0!r}'.format(self.changes)
 
         return \
-            "data:'{data}', turn:{turn}, status:{status}, error:{error}".format(
-                data=c, turn=self.turn,
+            "{board}, version:{version}, turn:{turn}, status:{status}, " \
+            "error:{error}".format(
+                board=board, version=self.version, turn=self.turn,
                 status=self.status, error=self.error)
 
 
+def applyStatus(data, version, status):
+    """Applies a status to the client's copy of the board.
+
+    Args:
+        data (list[str]): The copy of the board, updated in place.
+        version (int): The version of the copy.
+        status (GameStatus): A status received from the game server.
+
+    Returns:
+        int: The new version of the copy; None if the status does not
+            follow the copy (some status was missed), in which case the
+            copy is left unchanged and a snapshot should be asked for
+            (see GameServer.remote_getStatus).
+
+    """
+    if status.data is not None:
+        data[:] = status.data
+        return status.version
+
+    changes = status.changes or []
+    if status.version is None or \
+            status.version - len(changes) != version:
+        return None
+
+    for cell, symbol in changes:
+        data[cell] = str(symbol)
+
+    return status.version
+
+
 class CopyGameStatus(pb.Copyable, pb.RemoteCopy):
     """
     Server to Client only.
 
+    The status goes on the wire as a single string packed by common.wire
+    (a fixed header and 2 bits per cell), not attribute by attribute.
+
     Attributes:
-        data (list[str])
+        data (list[str]): The whole board; None in a delta.
         turn (int):
         status (int): The status of the game:
             0 - tie
             1 - X won
             2 - O won
             3 - in progress
+            4 - aborted (the AI player has failed)
         error (int): The error code.
+        version (int): The version of the board.
+        changes (list[tuple(int, int)]): The cells changed; None in a
+            snapshot.
 
     """
 
@@ -62,5 +114,48 @@ class CopyGameStatus(pb.Copyable, pb.RemoteCopy):
         self.turn = game_status.turn
         self.status = game_status.status
         self.error = game_status.error
+        self.version = game_status.version
+        self.changes = game_status.changes
+
+    def getStateToCopy(self):
+        return {'packed': wire.pack(self)}
+
+    def setCopyableState(self, state):
+        wire.unpack(state['packed'], self)
 
 pb.setUnjellyableForClass(CopyGameStatus, CopyGameStatus)
+
+
+class CopyTurnStatus(CopyGameStatus):
+    """
+    Server to Client only: the outcome of a whole turn (see
+    GameServer.remote_makeTurn).
+
+    Attributes:
+        move (tuple(int, int)): The move of the human player.
+        aiMove (tuple(int, int)): The reply of the AI player; None if the
+            AI player did not move (the move was refused or ended the
+            game).
+
+    The status of the game after the turn (the changes of both moves)
+    has the attributes of CopyGameStatus.
+
+    """
+
+    def __init__(self, game_status, move, aiMove=None):
+        CopyGameStatus.__init__(self, game_status)
+        self.move = move
+        self.aiMove = aiMove
+
+    def getStateToCopy(self):
+        state = CopyGameStatus.getStateToCopy(self)
+        state['move'] = self.move
+        state['aiMove'] = self.aiMove
+        return state
+
+    def setCopyableState(self, state):
+        CopyGameStatus.setCopyableState(self, state)
+        self.move = state['move']
+        self.aiMove = state['aiMove']
+
+pb.setUnjellyableForClass(CopyTurnStatus, CopyTurnStatus)
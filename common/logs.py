@@ -0,0 +1,184 @@
+# -------------------------------------
+# logs.py
+# The loggers of the subsystems, switched on and off at runtime.
+# -------------------------------------
+
+from twisted.logger import Logger as _Logger, LogLevel
+from twisted.web import resource
+
+
+# the levels, from the most verbose one; 'off' silences a subsystem
+LEVELS = ('debug', 'info', 'warn', 'error', 'critical', 'off')
+
+_PRIORITY = dict((LogLevel.lookupByName(name), i)
+                 for i, name in enumerate(LEVELS[:-1]))
+_DEBUG = _PRIORITY[LogLevel.debug]
+
+
+class Subsystem(object):
+    """The loggers of a part of the code, configured together.
+
+    Attributes:
+        name (str): The name of the subsystem.
+        level (str): The least level emitted (one of LEVELS).
+        sample (int): One debug event in ``sample`` is emitted.
+    """
+
+    def __init__(self, name, level='info', sample=1):
+        self.name = name
+        self.setLevel(level, sample)
+
+    def setLevel(self, level, sample=1):
+        """Sets the least level emitted and the sampling of the debug events.
+
+        Raises:
+            ValueError: If the level is unknown or the sample is not
+                positive.
+
+        """
+        if level not in LEVELS:
+            raise ValueError('Unknown log level: %s' % (level))
+
+        if sample < 1:
+            raise ValueError('Bad log sample: %d' % (sample))
+
+        self.level = level
+        self.sample = sample
+        self.priority = LEVELS.index(level)
+        self._skipped = 0
+
+    def sampled(self):
+        """Tells if the next debug event is to be emitted."""
+        if self.sample == 1:
+            return True
+
+        self._skipped += 1
+        if self._skipped < self.sample:
+            return False
+
+        self._skipped = 0
+        return True
+
+    def __str__(self):
+        if self.sample > 1:
+            return '{0}={1}/{2:d}'.format(self.name, self.level, self.sample)
+
+        return '{0}={1}'.format(self.name, self.level)
+
+
+_subsystems = {}
+
+
+def subsystem(name):
+    """Gets a subsystem (created at the 'info' level if unknown)."""
+    s = _subsystems.get(name)
+    if s is None:
+        s = _subsystems[name] = Subsystem(name)
+
+    return s
+
+
+def subsystems():
+    """Gets the subsystems, sorted by name."""
+    return [_subsystems[name] for name in sorted(_subsystems)]
+
+
+def configure(spec):
+    """Sets the levels of subsystems.
+
+    Args:
+        spec (str): A comma separated list of 'name=level' items; the
+            level of 'name=debug/N' emits one debug event in N.
+
+    Raises:
+        ValueError: If the specification is malformed.
+
+    """
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+
+        name, sep, level = item.partition('=')
+        if not sep or not name:
+            raise ValueError('Malformed log level: %s' % (item))
+
+        level, _, sample = level.partition('/')
+        subsystem(name.strip()).setLevel(level.strip(),
+                                         int(sample) if sample else 1)
+
+
+class Logger(object):
+    """A logger of a subsystem, declared as a class attribute.
+
+    It is used like twisted.logger.Logger (the format is rendered by the
+    observers, only for the events emitted), but the level of its
+    subsystem is checked first: an event which is not emitted costs a
+    method call and a comparison. Unlike twisted.logger.Logger, reading
+    the attribute does not create a new logger.
+    """
+
+    def __init__(self, name):
+        """
+        Args:
+            name (str): The name of the subsystem.
+        """
+        self.subsystem = subsystem(name)
+        self._logger = None
+
+    def __get__(self, oself, type=None):
+        if self._logger is None:
+            self._logger = _Logger('.'.join([type.__module__,
+                                             type.__name__]))
+
+        return self
+
+    def debug(self, format=None, **kwargs):
+        s = self.subsystem
+        if s.priority > _DEBUG or not s.sampled():
+            return
+
+        self._logger.emit(LogLevel.debug, format, **kwargs)
+
+    def info(self, format=None, **kwargs):
+        self.emit(LogLevel.info, format, **kwargs)
+
+    def warn(self, format=None, **kwargs):
+        self.emit(LogLevel.warn, format, **kwargs)
+
+    def error(self, format=None, **kwargs):
+        self.emit(LogLevel.error, format, **kwargs)
+
+    def critical(self, format=None, **kwargs):
+        self.emit(LogLevel.critical, format, **kwargs)
+
+    def failure(self, format, failure=None, level=LogLevel.critical,
+                **kwargs):
+        if self.subsystem.priority <= _PRIORITY[level]:
+            self._logger.failure(format, failure, level, **kwargs)
+
+    def emit(self, level, format=None, **kwargs):
+        if level is LogLevel.debug:
+            self.debug(format, **kwargs)
+        elif self.subsystem.priority <= _PRIORITY[level]:
+            self._logger.emit(level, format, **kwargs)
+
+
+class LogsResource(resource.Resource):
+    """Shows and sets the levels of the subsystems.
+
+    GET /logs lists them; GET /logs?model=debug/100&ai=off sets them.
+    """
+
+    isLeaf = True
+
+    def render_GET(self, request):
+        request.setHeader('Content-Type', 'text/plain; charset=utf-8')
+        try:
+            configure(','.join('{0}={1}'.format(name, values[-1])
+                               for name, values in request.args.iteritems()))
+        except ValueError, e:
+            request.setResponseCode(400)
+            return '{0}\n'.format(e)
+
+        return ''.join('{0}\n'.format(s) for s in subsystems())
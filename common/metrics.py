@@ -0,0 +1,157 @@
+# -------------------------------------
+# metrics.py
+# Counters, gauges and histograms, exposed as Prometheus text.
+# -------------------------------------
+
+from bisect import bisect_left
+
+from twisted.web import resource
+
+
+# the latency buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter(object):
+    """A value which only goes up."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        yield self.name, '', self.value
+
+
+class Gauge(object):
+    """A value which goes up and down.
+
+    The value may also be read from a function when the metrics are
+    collected, which costs nothing in between.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, function=None):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.function = function
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def samples(self):
+        yield self.name, '', (self.function() if self.function is not None
+                              else self.value)
+
+
+class Histogram(object):
+    """Counts the observed values in fixed buckets.
+
+    Observing a value is a binary search of the bucket bounds and two
+    additions.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # the last count is the +Inf bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield self.name + '_bucket', '{le="%r"}' % (bound), total
+
+        total += self.counts[-1]
+        yield self.name + '_bucket', '{le="+Inf"}', total
+        yield self.name + '_sum', '', self.sum
+        yield self.name + '_count', '', total
+
+
+class Registry(object):
+    """The metrics of the process."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        """Adds a metric (replacing any metric with the same name)."""
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Formats the metrics in the Prometheus text format (0.0.4)."""
+        lines = []
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            lines.append('# HELP {0} {1}'.format(name, metric.help))
+            lines.append('# TYPE {0} {1}'.format(name, metric.kind))
+            for sample, labels, value in metric.samples():
+                lines.append('{0}{1} {2}'.format(sample, labels,
+                                                 _format(value)))
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _format(value):
+    if isinstance(value, float):
+        return repr(value)
+
+    return str(int(value))
+
+
+def counter(name, help):
+    """Creates and registers a counter."""
+    return registry.register(Counter(name, help))
+
+
+def gauge(name, help, function=None):
+    """Creates and registers a gauge."""
+    return registry.register(Gauge(name, help, function))
+
+
+def histogram(name, help, buckets=LATENCY_BUCKETS):
+    """Creates and registers a histogram."""
+    return registry.register(Histogram(name, help, buckets))
+
+
+class MetricsResource(resource.Resource):
+    """Serves the metrics of a registry to the Prometheus scraper."""
+
+    isLeaf = True
+
+    def __init__(self, metricsRegistry=registry):
+        resource.Resource.__init__(self)
+        self._registry = metricsRegistry
+
+    def render_GET(self, request):
+        request.setHeader('Content-Type',
+                          'text/plain; version=0.0.4; charset=utf-8')
+        return self._registry.render()
@@ -0,0 +1,63 @@
+# -------------------------------------
+# stats.py
+# The latency samples of the benchmarks and their percentiles.
+# -------------------------------------
+
+
+def percentile(samples, p):
+    """Returns a percentile of sorted samples (nearest rank).
+
+    Args:
+        samples (list[float]): The samples, sorted.
+        p (float): The percentile, in (0, 100].
+
+    Returns:
+        float: The smallest sample which is not below ``p`` percent of
+            the samples; None if there are no samples.
+
+    """
+    if not samples:
+        return None
+
+    rank = int(-(-p * len(samples) // 100))
+    return samples[min(max(rank, 1), len(samples)) - 1]
+
+
+class Latencies(object):
+    """The durations recorded per stage (createGame, makeMove, ...)."""
+
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self):
+        self._samples = {}
+
+    def add(self, stage, seconds):
+        """Records the duration of one occurrence of a stage."""
+        self._samples.setdefault(stage, []).append(seconds)
+
+    def count(self, stage):
+        return len(self._samples.get(stage, ()))
+
+    def summary(self):
+        """Summarizes the stages.
+
+        Returns:
+            dict: For each stage, the number of samples and the mean, the
+                percentiles and the maximum of the durations, in
+                milliseconds.
+
+        """
+        result = {}
+        for stage, samples in self._samples.iteritems():
+            samples = sorted(samples)
+            summary = {
+                'count': len(samples),
+                'mean': 1000.0 * sum(samples) / len(samples),
+                'max': 1000.0 * samples[-1],
+            }
+            for p in self.PERCENTILES:
+                summary['p%d' % (p)] = 1000.0 * percentile(samples, p)
+
+            result[stage] = summary
+
+        return result
@@ -0,0 +1,73 @@
+# -------------------------------------
+# test_wire.py
+# -------------------------------------
+
+from twisted.trial import unittest
+
+from common import wire
+from common.constants import Errors, Status, Symbol
+from common.ipc import GameStatus
+
+
+def roundTrip(status):
+    return wire.unpack(wire.pack(status), GameStatus())
+
+
+class WireTest(unittest.TestCase):
+
+    def assertSameStatus(self, status, other):
+        for name in ('data', 'turn', 'status', 'error', 'version',
+                     'changes'):
+            self.assertEqual(getattr(other, name), getattr(status, name),
+                             name)
+
+    def test_snapshot(self):
+        for size in (3, 5, 19):
+            data = [str(i % 3) for i in xrange(size * size)]
+            status = GameStatus(data, Symbol.O, Status.InProgress,
+                                Errors.NoError, 12)
+            self.assertSameStatus(status, roundTrip(status))
+
+    def test_delta(self):
+        status = GameStatus(None, Symbol.X, Status.O_Won, Errors.NoError,
+                            70000, [(0, Symbol.X), (360, Symbol.O),
+                                    (wire._CELL_MASK, Symbol.Empty)])
+        self.assertSameStatus(status, roundTrip(status))
+
+        status = GameStatus(None, Symbol.X, Status.Tie, Errors.IlegalMove,
+                            3, [])
+        self.assertSameStatus(status, roundTrip(status))
+
+    def test_absentFields(self):
+        status = roundTrip(GameStatus(error=Errors.NoSuchGame))
+        self.assertIsNone(status.turn)
+        self.assertIsNone(status.status)
+        self.assertIsNone(status.version)
+        self.assertEqual(status.error, Errors.NoSuchGame)
+        self.assertEqual(status.changes, [])
+
+        status = roundTrip(GameStatus(error=None, version=0))
+        self.assertIsNone(status.error)
+        self.assertEqual(status.version, 0)
+
+    def test_largestVersion(self):
+        status = GameStatus(None, Symbol.X, Status.InProgress,
+                            Errors.NoError, wire.NO_VERSION - 1, [])
+        self.assertEqual(roundTrip(status).version, wire.NO_VERSION - 1)
+
+    def test_outOfRange(self):
+        for status in (
+                GameStatus(version=wire.NO_VERSION),
+                GameStatus(version=-1),
+                GameStatus(version=0, changes=[(20000, Symbol.X)]),
+                GameStatus(version=0, changes=[(-1, Symbol.X)]),
+                GameStatus(version=0, changes=[(1, 4)]),
+                GameStatus(version=0,
+                           changes=[(1, Symbol.X)] * (0xFFFF + 1)),
+                GameStatus(['0'] * (0xFFFF + 1), version=0)):
+            self.assertRaises(ValueError, wire.pack, status)
+
+    def test_unknownFormat(self):
+        packed = wire.pack(GameStatus(version=1, changes=[]))
+        self.assertRaises(ValueError, wire.unpack,
+                          chr(wire.FORMAT + 1) + packed[1:], GameStatus())
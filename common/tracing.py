@@ -0,0 +1,157 @@
+# -------------------------------------
+# tracing.py
+# The spans of the moves, from the client to the AI process and back.
+#
+# A breakdown of a trace file:
+#   python -m common.tracing trace.jsonl
+# -------------------------------------
+
+import binascii
+import json
+import os
+import re
+import time
+
+
+# the stages of a move: (name, first hop, last hop)
+STAGES = (
+    ('pb request', 'client.sent', 'server.received'),
+    ('makeMove', 'server.received', 'server.dispatched'),
+    ('pb response', 'server.replied', 'client.replied'),
+    ('pipe to AI', 'server.dispatched', 'ai.received'),
+    ('search', 'ai.received', 'ai.replied'),
+    ('pipe from AI', 'ai.replied', 'server.aiReplied'),
+    ('AI move', 'server.aiReplied', 'server.notify'),
+    ('onAiMoved push', 'server.notify', 'client.aiMoved'),
+    ('onAiMoved ack', 'server.notify', 'server.notified'),
+)
+
+
+# the trace ids accepted from the clients: they are sent on the command
+# lines of the AI processes
+_TRACE_ID = re.compile(r'[0-9A-Za-z]{1,32}\Z')
+
+
+def newTraceId():
+    """Returns a new trace id (16 hex digits)."""
+    return binascii.hexlify(os.urandom(8))
+
+
+def isTraceId(traceId):
+    """Checks a trace id: 1 to 32 letters and digits."""
+    return isinstance(traceId, basestring) and \
+        _TRACE_ID.match(traceId) is not None
+
+
+class Tracer(object):
+    """Appends timestamped spans to a trace file, one JSON object a line.
+
+    The processes of the server (the game server and the AI processes)
+    and the clients may share one file: every span is written with a
+    single append. A tracer without a file does nothing.
+    """
+
+    def __init__(self):
+        self._fd = None
+
+    @property
+    def enabled(self):
+        return self._fd is not None
+
+    def open(self, path):
+        """Starts writing the spans to a file.
+
+        Args:
+            path (str): The path of the trace file.
+
+        """
+        self.close()
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                           0644)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def span(self, traceId, hop, **fields):
+        """Records that a move has reached a hop.
+
+        Args:
+            traceId (str): The trace id of the move; nothing is recorded
+                if it is None.
+            hop (str): The name of the hop (see STAGES).
+            **fields: The extra fields of the span.
+
+        """
+        if self._fd is None or traceId is None:
+            return
+
+        fields.update(trace=traceId, hop=hop, t=time.time(), pid=os.getpid())
+        os.write(self._fd, json.dumps(fields, sort_keys=True) + '\n')
+
+
+tracer = Tracer()
+
+
+def traceOption(traceId):
+    """Formats the 'trace=' option of a command ('' if there is no id).
+
+    Raises:
+        ValueError: If the trace id is not one of ``isTraceId``.
+
+    """
+    if traceId is None:
+        return ''
+
+    if not isTraceId(traceId):
+        raise ValueError('Bad trace id: %r' % (traceId,))
+
+    return ' trace={0:s}'.format(traceId)
+
+
+def breakdown(spans):
+    """Sums up the latencies of the traced moves.
+
+    Args:
+        spans (iterable[dict]): The spans of a trace file.
+
+    Returns:
+        dict: The count/mean/max/p50/p95/p99 (in ms) of every stage (see
+            STAGES) and of the whole move ('total').
+
+    """
+    from common.stats import Latencies
+
+    traces = {}
+    for span in spans:
+        hops = traces.setdefault(span['trace'], {})
+        # the first time a move reaches a hop
+        hops.setdefault(span['hop'], span['t'])
+
+    latencies = Latencies()
+    for hops in traces.itervalues():
+        for name, first, last in STAGES:
+            if first in hops and last in hops:
+                latencies.add(name, hops[last] - hops[first])
+
+        latencies.add('total', max(hops.itervalues()) -
+                      min(hops.itervalues()))
+
+    return {'moves': len(traces), 'latency': latencies.summary()}
+
+
+def main():
+    import sys
+
+    if len(sys.argv) != 2:
+        sys.exit('usage: python -m common.tracing <trace file>')
+
+    with open(sys.argv[1]) as f:
+        report = breakdown(json.loads(line) for line in f if line.strip())
+
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+# -------------------------------------
+# wire.py
+# The packed encoding of a game status.
+# -------------------------------------
+
+import struct
+
+# the header: format, flags, turn, status, error, version
+HEADER = struct.Struct('<BBBBBI')
+
+FORMAT = 2
+
+# the flags
+SNAPSHOT = 0x01
+
+# the turn, status or error of a status which has none
+NONE = 0xFF
+
+# the version of a status which has none
+NO_VERSION = 0xFFFFFFFF
+
+# a snapshot: the number of cells, then 4 cells (2 bits each) per byte
+_CELLS = struct.Struct('<H')
+
+# a delta: the number of changes, then (symbol << 14 | cell) per change
+_COUNT = struct.Struct('<H')
+
+_CELL_BITS = 14
+_CELL_MASK = (1 << _CELL_BITS) - 1
+
+# the most cells of a snapshot, or changes of a delta
+_MAX_COUNT = 0xFFFF
+
+# the 4 cells of a byte, the first one in the low bits
+_DIGITS = '0123'
+_DECODE = [''.join(_DIGITS[(b >> shift) & 0x03] for shift in (0, 2, 4, 6))
+           for b in xrange(256)]
+_ENCODE = dict((cells, chr(b)) for b, cells in enumerate(_DECODE))
+
+
+def pack(status):
+    """Packs a game status.
+
+    The fixed header holds the turn, the status, the error and the
+    version; it is followed by the board, 2 bits per cell, when the
+    status is a snapshot, or by the changed cells, 2 bytes each, when it
+    is a delta.
+
+    Args:
+        status (common.ipc.GameStatus): The status (or any object with
+            the same attributes).
+
+    Returns:
+        str: The packed status.
+
+    Raises:
+        ValueError: If a field does not fit: a version above 32 bits, a
+            board or a delta of more than 0xFFFF cells, or a changed cell
+            above 14 bits.
+
+    """
+    version = status.version
+    if version is None:
+        version = NO_VERSION
+    elif not 0 <= version < NO_VERSION:
+        raise ValueError('Version out of range: %r' % (version,))
+
+    header = HEADER.pack(FORMAT,
+                         SNAPSHOT if status.data is not None else 0,
+                         _byte(status.turn),
+                         _byte(status.status),
+                         _byte(status.error),
+                         version)
+
+    if status.data is not None:
+        if len(status.data) > _MAX_COUNT:
+            raise ValueError('Board too large: %d cells' %
+                             (len(status.data)))
+
+        cells = ''.join(status.data)
+        cells += '0' * (-len(cells) % 4)
+        return header + _CELLS.pack(len(status.data)) + \
+            ''.join([_ENCODE[cells[i:i + 4]]
+                     for i in xrange(0, len(cells), 4)])
+
+    changes = status.changes or []
+    if len(changes) > _MAX_COUNT:
+        raise ValueError('Delta too large: %d changes' % (len(changes)))
+
+    for cell, symbol in changes:
+        if not 0 <= cell <= _CELL_MASK or not 0 <= symbol <= 3:
+            raise ValueError('Change out of range: %r' % ((cell, symbol),))
+
+    return header + _COUNT.pack(len(changes)) + \
+        struct.pack('<%dH' % (len(changes)),
+                    *[(symbol << _CELL_BITS) | cell
+                      for cell, symbol in changes])
+
+
+def unpack(packed, status):
+    """Unpacks a game status.
+
+    Args:
+        packed (str): The output of ``pack``.
+        status (common.ipc.GameStatus): The object whose attributes
+            (data, changes, turn, status, error, version) are set.
+
+    Returns:
+        The ``status`` argument.
+
+    Raises:
+        ValueError: If the format is unknown.
+
+    """
+    fmt, flags, turn, result, error, version = \
+        HEADER.unpack_from(packed)
+    if fmt != FORMAT:
+        raise ValueError('Unknown status format: %d' % (fmt))
+
+    status.turn = None if turn == NONE else turn
+    status.status = None if result == NONE else result
+    status.error = None if error == NONE else error
+    status.version = None if version == NO_VERSION else version
+
+    offset = HEADER.size
+    if flags & SNAPSHOT:
+        count = _CELLS.unpack_from(packed, offset)[0]
+        offset += _CELLS.size
+        cells = ''.join([_DECODE[ord(b)] for b in packed[offset:]])
+        status.data = list(cells[:count])
+        status.changes = None
+    else:
+        count = _COUNT.unpack_from(packed, offset)[0]
+        offset += _COUNT.size
+        codes = struct.unpack_from('<%dH' % (count), packed, offset)
+        status.data = None
+        status.changes = [(code & _CELL_MASK, code >> _CELL_BITS)
+                          for code in codes]
+
+    return status
+
+
+def _byte(value):
+    return NONE if value is None else value
+
+
+def _measure():
+    """Compares the jelly encoding of the statuses with the packed one."""
+    import timeit
+
+    from twisted.spread import banana, jelly, pb
+
+    from common.ipc import CopyGameStatus, GameStatus
+
+    class JellyGameStatus(pb.Copyable, pb.RemoteCopy):
+        """CopyGameStatus as it was: every attribute is jellied."""
+
+        def __init__(self, game_status):
+            self.__dict__.update(vars(game_status))
+
+    pb.setUnjellyableForClass(JellyGameStatus, JellyGameStatus)
+
+    # the copyables are jellied for a peer only
+    broker = pb.Broker()
+    broker.serializingPerspective = broker.unserializingPerspective = None
+
+    def send(obj):
+        return banana.encode(jelly.jelly(obj, invoker=broker))
+
+    def receive(data):
+        return jelly.unjelly(banana.decode(data), invoker=broker)
+
+    def perCall(f):
+        return min(timeit.repeat(f, number=1000, repeat=3)) / 1000
+
+    board = ['1', '0', '2', '0'] * 90 + ['1']
+    for name, status in (
+            ('3x3 snapshot', GameStatus(board[:9], 1, 3, 0, 4)),
+            ('19x19 snapshot', GameStatus(board, 2, 3, 0, 120)),
+            ('19x19 delta', GameStatus(None, 2, 3, 0, 120, [(180, 1)]))):
+        print(name)
+        for label, cls in (('jelly', JellyGameStatus),
+                           ('packed', CopyGameStatus)):
+            data = send(cls(status))
+            print('  {0:6s} {1:5d} bytes, send {2:6.1f} us, '
+                  'receive {3:6.1f} us'.format(
+                      label, len(data),
+                      perCall(lambda: send(cls(status))) * 1e6,
+                      perCall(lambda: receive(data)) * 1e6))
+
+
+if __name__ == '__main__':
+    _measure()
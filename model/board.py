@@ -2,34 +2,430 @@
 # board.py
 # -------------------------------------
 
-from twisted.logger import Logger
+import random
+
+from common import logs
 from common.constants import Symbol
 
 
+class Geometry(object):
+    """The precomputed lines of a board with a given size and win length.
+
+    A line is any run of ``winLength`` consecutive cells along a row, a
+    column or one of the two diagonal directions. The instances are
+    immutable and shared by all the boards with the same dimensions
+    (see ``Geometry.get``).
+
+    Attributes:
+        size (int): The number of rows (and columns) of the board.
+        winLength (int): The number of symbols in a row needed to win.
+        cells (int): The number of cells of the board.
+        lines (list[int]): The bit mask of every line.
+        cellLines (list[list[int]]): The indexes (into ``lines``) of the
+            lines passing through each cell.
+        cellNeighbours (list[int]): The mask of the cells next to each
+            cell (diagonals included).
+        full (int): The mask with a bit set for every cell.
+        notFirstColumn (int): The mask of the cells not on column 0.
+        notLastColumn (int): The mask of the cells not on the last column.
+        zobrist (list[list[int]]): The 64-bit Zobrist keys, indexed by
+            symbol and then by cell (the Symbol.Empty slot is None).
+        zobristTurn (list[int]): The keys of the side to move, indexed by
+            symbol, for the callers which hash the turn in as well.
+        symmetries (list[list[int]]): For each of the eight symmetries of
+            the square, the cell each cell is mapped to.
+        inverseSymmetries (list[list[int]]): The inverse mappings.
+        cellImages (list[tuple]): For each cell, its images under the
+            eight symmetries (the transposed ``symmetries``).
+    """
+
+    DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+    # the rotations and reflections of the square, as functions of
+    # (row, col, size - 1); the identity comes first
+    SYMMETRIES = (
+        lambda r, c, n: (r, c),
+        lambda r, c, n: (c, n - r),
+        lambda r, c, n: (n - r, n - c),
+        lambda r, c, n: (n - c, r),
+        lambda r, c, n: (r, n - c),
+        lambda r, c, n: (n - r, c),
+        lambda r, c, n: (c, r),
+        lambda r, c, n: (n - c, n - r),
+    )
+
+    # the largest board (Gomoku is played on 15 x 15 or 19 x 19): the
+    # tables of a geometry are built in the reactor and cached for good
+    MAX_SIZE = 19
+
+    _cache = {}
+
+    def __init__(self, size, winLength):
+        self.size = size
+        self.winLength = winLength
+        self.cells = size * size
+        self.full = (1 << self.cells) - 1
+
+        firstColumn = sum(1 << (row * size) for row in xrange(size))
+        self.notFirstColumn = self.full & ~firstColumn
+        self.notLastColumn = self.full & ~(firstColumn << (size - 1))
+
+        self.lines = []
+        self.cellLines = [[] for _ in xrange(self.cells)]
+
+        for row in xrange(size):
+            for col in xrange(size):
+                for dirI, dirJ in Geometry.DIRECTIONS:
+                    lastRow = row + dirI * (winLength - 1)
+                    lastCol = col + dirJ * (winLength - 1)
+                    if not (0 <= lastRow < size and 0 <= lastCol < size):
+                        continue
+
+                    index = len(self.lines)
+                    mask = 0
+                    for n in xrange(winLength):
+                        cell = (row + dirI * n) * size + (col + dirJ * n)
+                        mask |= 1 << cell
+                        self.cellLines[cell].append(index)
+
+                    self.lines.append(mask)
+
+        self.cellNeighbours = [
+            sum(1 << (r * size + c)
+                for r in xrange(max(0, row - 1), min(size, row + 2))
+                for c in xrange(max(0, col - 1), min(size, col + 2))
+                if (r, c) != (row, col))
+            for row in xrange(size) for col in xrange(size)]
+
+        # the seed depends only on the dimensions, so every process
+        # derives the same keys
+        rng = random.Random(size * 1000 + winLength)
+        self.zobrist = [None] + [[rng.getrandbits(64)
+                                  for _ in xrange(self.cells)]
+                                 for _ in (Symbol.X, Symbol.O)]
+        self.zobristTurn = [0, rng.getrandbits(64), rng.getrandbits(64)]
+
+        self.symmetries = []
+        self.inverseSymmetries = []
+        for transform in Geometry.SYMMETRIES:
+            mapping = [0] * self.cells
+            inverse = [0] * self.cells
+            for cell in xrange(self.cells):
+                r, c = transform(cell // size, cell % size, size - 1)
+                mapping[cell] = r * size + c
+                inverse[r * size + c] = cell
+            self.symmetries.append(mapping)
+            self.inverseSymmetries.append(inverse)
+
+        self.cellImages = zip(*self.symmetries)
+
+    @staticmethod
+    def get(size, winLength):
+        """Returns the (cached) geometry for the given dimensions.
+
+        Raises:
+            ValueError: If the dimensions are out of range.
+
+        """
+        key = (size, winLength)
+        geometry = Geometry._cache.get(key)
+        if geometry is None:
+            if size < 1 or size > Geometry.MAX_SIZE:
+                raise ValueError('Illegal board size: {0:d}'.format(size))
+
+            if winLength < 1 or winLength > size:
+                raise ValueError('Illegal win length: {0:d}'.
+                                 format(winLength))
+
+            geometry = Geometry._cache[key] = Geometry(size, winLength)
+
+        return geometry
+
+
 class Board(object):
     """Keeps the board status.
+
+    The position is kept as a bitboard: one integer mask per side where
+    the bit ``row * size + col`` is set if the side owns that cell. The
+    list of one-character strings used by the PB messages is built only
+    on demand (see the ``data`` property).
+
+    Every line keeps a running counter of the symbols each side has on
+    it, so placing a symbol updates at most ``4 * winLength`` counters
+    and the win and tie checks are O(1) whatever the board size.
+
+    The searches play their moves with ``makeMove`` and take them back
+    with ``unmakeMove``: the moves are pushed on a stack allocated with
+    the board, with the mask of the cells next to the symbols before the
+    move (see ``neighbours``). Taking a move back restores the counters,
+    the hashes and that mask exactly; a move only adds its neighbours to
+    the mask.
+
+    Attributes:
+        size (int): The number of rows (and columns).
+        winLength (int): The number of symbols in a row needed to win.
+        geometry (model.board.Geometry): The shared line tables.
+        occupied (int): The number of non-empty cells.
+        ply (int): The number of moves on the stack (see ``makeMove``).
+        hash (int): The Zobrist hash of the position, updated on every
+            change.
+
+    The board also keeps the hashes of its eight symmetric images (the
+    first one is ``hash``); the smallest of them is the canonical key
+    shared by all the symmetric positions (see ``canonical``).
     """
     SIZE = 3
-    log = Logger()
+    MAX_WIN_LENGTH = 5
+
+    log = logs.Logger('model')
 
-    def __init__(self):
-        self.data = ['0'] * (Board.SIZE ** 2)
-        self.log.debug('Board: %s' % (repr(self.data)))
+    def __init__(self, size=SIZE, winLength=None):
+        """Inits an empty board.
+
+        Args:
+            size (Optional[int]): The number of rows and columns
+                (default is 3).
+            winLength (Optional[int]): The number of symbols in a row
+                needed to win (default is the board size, at most 5).
+
+        Raises:
+            ValueError: If the dimensions are out of range.
+
+        """
+        if winLength is None:
+            winLength = min(size, Board.MAX_WIN_LENGTH)
+
+        self.geometry = Geometry.get(size, winLength)
+        self.size = size
+        self.winLength = winLength
+        self.occupied = 0
+        self.hash = 0
+        self._hashes = [0] * len(Geometry.SYMMETRIES)
+
+        # indexed by symbol; the slots of Symbol.Empty are never used
+        nLines = len(self.geometry.lines)
+        self._masks = [0, 0, 0]
+        self._counts = [None, [0] * nLines, [0] * nLines]
+        self._wins = [0, 0, 0]
+
+        # the cells next to the symbols (None when it is to be computed)
+        self._near = 0
+
+        # the moves made with makeMove, the last one at ply - 1, and the
+        # masks of the cells next to the symbols before them
+        self._stack = [0] * self.geometry.cells
+        self._nearStack = [0] * self.geometry.cells
+        self.ply = 0
 
     def set(self, row, col, symbol):
+        """Places a symbol on the board (Symbol.Empty clears the cell)."""
+        self.setCell(row * self.size + col, symbol)
+
+    def get(self, row, col):
+        """Returns the symbol found at a given position."""
+        return self.getCell(row * self.size + col)
+
+    def setCell(self, index, symbol):
+        """Places a symbol on the cell ``row * size + col``.
+
+        Symbol.Empty clears the cell.
+        """
+        bit = 1 << index
+
+        previous = Symbol.X if self._masks[Symbol.X] & bit else \
+            Symbol.O if self._masks[Symbol.O] & bit else Symbol.Empty
+
+        if previous == symbol:
+            return
+
+        cellLines = self.geometry.cellLines[index]
+        images = self.geometry.cellImages[index]
+        hashes = self._hashes
+        k = self.winLength
+
+        if previous != Symbol.Empty:
+            self._masks[previous] &= ~bit
+            self.occupied -= 1
+            keys = self.geometry.zobrist[previous]
+            for t, image in enumerate(images):
+                hashes[t] ^= keys[image]
+            counts = self._counts[previous]
+            for line in cellLines:
+                if counts[line] == k:
+                    self._wins[previous] -= 1
+                counts[line] -= 1
+
+        if symbol != Symbol.Empty:
+            self._masks[symbol] |= bit
+            self.occupied += 1
+            keys = self.geometry.zobrist[symbol]
+            for t, image in enumerate(images):
+                hashes[t] ^= keys[image]
+            counts = self._counts[symbol]
+            for line in cellLines:
+                counts[line] += 1
+                if counts[line] == k:
+                    self._wins[symbol] += 1
+
+        self.hash = hashes[0]
+        self._near = None
+
+    def makeMove(self, index, symbol):
+        """Plays a symbol on an empty cell and pushes it on the stack."""
+        near = self._near
+        if near is None:
+            near = self._near = self._grow(1)
+
+        self.setCell(index, symbol)
+        self._stack[self.ply] = index
+        self._nearStack[self.ply] = near
+        self._near = near | self.geometry.cellNeighbours[index]
+        self.ply += 1
+
+    def unmakeMove(self):
+        """Takes back the last move pushed by ``makeMove``.
+
+        Returns:
+            int: The cell of the move.
+
+        Raises:
+            IndexError: If the stack is empty.
+
         """
+        if not self.ply:
+            raise IndexError('No move to take back')
+
+        self.ply -= 1
+        index = self._stack[self.ply]
+        self.setCell(index, Symbol.Empty)
+        self._near = self._nearStack[self.ply]
+        return index
+
+    def getCell(self, index):
+        """Returns the symbol found on the cell ``row * size + col``."""
+        bit = 1 << index
+        if self._masks[Symbol.X] & bit:
+            return Symbol.X
+
+        if self._masks[Symbol.O] & bit:
+            return Symbol.O
+
+        return Symbol.Empty
+
+    def canonical(self):
+        """Returns the key shared by the position and its symmetric images.
+
+        Returns:
+            tuple(int, int): The canonical key (the smallest hash of the
+                eight images) and the symmetry which maps this board onto
+                the canonical image (see ``toCanonical`` and
+                ``fromCanonical``).
+
         """
-        self.data[row * Board.SIZE + col] = str(symbol)
+        key = min(self._hashes)
+        return key, self._hashes.index(key)
 
-    def get(self, row, col):
+    def toCanonical(self, index, transform):
+        """Maps a cell of this board onto the canonical image."""
+        return self.geometry.symmetries[transform][index]
+
+    def fromCanonical(self, index, transform):
+        """Maps a cell of the canonical image back onto this board."""
+        return self.geometry.inverseSymmetries[transform][index]
+
+    def mask(self, symbol):
+        """Returns the bit mask of the cells owned by a symbol."""
+        return self._masks[symbol]
+
+    def empty(self):
+        """Returns the bit mask of the empty cells."""
+        return self.geometry.full & \
+            ~(self._masks[Symbol.X] | self._masks[Symbol.O])
+
+    def neighbours(self, radius=1):
+        """Returns the mask of the empty cells close to the occupied ones.
+
+        Args:
+            radius (Optional[int]): The maximum (Chebyshev) distance to an
+                occupied cell (default is 1).
+
+        Returns:
+            int: The bit mask of the empty cells at most ``radius`` cells
+                away from a symbol; 0 if the board is empty.
+
+        """
+        if radius == 1:
+            near = self._near
+            if near is None:
+                near = self._near = self._grow(1)
+        else:
+            near = self._grow(radius)
+
+        return near & self.empty()
+
+    def _grow(self, radius):
+        """Returns the mask of the cells close to the occupied ones."""
+        geometry = self.geometry
+        mask = self._masks[Symbol.X] | self._masks[Symbol.O]
+        for _ in xrange(radius):
+            # grow the mask one cell left and right, then one row up and down
+            horizontal = mask | ((mask << 1) & geometry.notFirstColumn) | \
+                ((mask >> 1) & geometry.notLastColumn)
+            mask = horizontal | (horizontal << self.size) | \
+                (horizontal >> self.size)
+            mask &= geometry.full
+
+        return mask
+
+    def lineCounts(self, symbol):
+        """Returns the running counters of a symbol, indexed by line.
+
+        The list is owned by the board and must not be modified.
         """
+        return self._counts[symbol]
+
+    def isWinningMove(self, row, col, symbol):
+        """Checks if the symbol placed at (row, col) completes a line.
+
+        Only the lines passing through the given cell are tested.
+
+        Returns:
+            bool: True if the symbol owns a full line through the cell.
+
         """
-        return int(self.data[row * Board.SIZE + col])
+        counts = self._counts[symbol]
+        k = self.winLength
+        for line in self.geometry.cellLines[row * self.size + col]:
+            if counts[line] == k:
+                return True
+
+        return False
+
+    def isWinner(self, symbol):
+        """Checks if the symbol owns any full line of the board."""
+        return self._wins[symbol] > 0
+
+    def isFull(self):
+        """Returns True if there are no empty cells left."""
+        return self.occupied == self.geometry.cells
+
+    @property
+    def data(self):
+        """The board as a list of one-character strings (row major)."""
+        x, o = self._masks[Symbol.X], self._masks[Symbol.O]
+        data = []
+        for i in xrange(self.geometry.cells):
+            bit = 1 << i
+            symbol = Symbol.X if x & bit else \
+                Symbol.O if o & bit else Symbol.Empty
+            data.append(str(symbol))
+
+        return data
 
     def __str__(self):
         s = ""
-        for i in xrange(0, Board.SIZE):
-            for j in xrange(0, Board.SIZE):
+        for i in xrange(0, self.size):
+            for j in xrange(0, self.size):
                 if self.get(i, j) == Symbol.Empty:
                     s += ' _ '
                 elif self.get(i, j) == Symbol.X:
@@ -3,4 +3,73 @@ class Events(object):
     humanMove = 'human-move'
     aiMove = 'ai-move'
     aiResponse = 'ai-response'
+    takeback = 'takeback'
+    aiFailed = 'ai-failed'
     quit = 'quit'
+
+
+class EventRouter(object):
+    """Delivers the events of a game to the subscribers of that game only.
+
+    The subscribers are kept in a table keyed by the game UUID, so sending
+    an event costs the same whatever the number of games in progress.
+    ``close`` sends Events.quit and forgets every subscriber of the game.
+    """
+
+    def __init__(self):
+        self._routes = {}
+
+    def connect(self, handler, signal, uuid):
+        """Subscribes a handler to a signal of one game.
+
+        Args:
+            handler (callable): Called with the keyword arguments of the
+                event, including ``uuid``.
+            signal (str): One of the Events.
+            uuid: The UUID of the game.
+
+        """
+        signals = self._routes.setdefault(str(uuid), {})
+        signals.setdefault(signal, []).append(handler)
+
+    def disconnect(self, handler, signal, uuid):
+        """Removes a subscription made by ``connect``."""
+        handlers = self._routes.get(str(uuid), {}).get(signal, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def send(self, signal, uuid, **kwargs):
+        """Calls the handlers of a signal of one game.
+
+        Returns:
+            int: The number of handlers called.
+
+        """
+        handlers = self._routes.get(str(uuid), {}).get(signal)
+        if not handlers:
+            return 0
+
+        # a handler may end the game, and change the table
+        handlers = list(handlers)
+        for handler in handlers:
+            handler(uuid=uuid, **kwargs)
+
+        return len(handlers)
+
+    def release(self, uuid):
+        """Unsubscribes every handler of a game."""
+        self._routes.pop(str(uuid), None)
+
+    def close(self, uuid):
+        """Sends Events.quit to the subscribers of a game, then releases
+        them."""
+        self.send(Events.quit, uuid)
+        self.release(uuid)
+
+    def __len__(self):
+        """The number of games with subscribers."""
+        return len(self._routes)
+
+
+# the router shared by the games and the AI processes of the server
+router = EventRouter()
@@ -2,18 +2,28 @@
 # game.py
 # -------------------------------------
 
-import os
 import sys
+import time
 import uuid
 
-from pydispatch import dispatcher
-from twisted.logger import Logger
+from twisted.internet import defer, reactor
 
 import ai.protocols.aiprotocol as aiprotocol
+from common import logs, metrics
 from common.constants import Symbol, Status, Errors
-from common.ipc import GameStatus, CopyGameStatus
+from common.ipc import GameStatus, CopyGameStatus, CopyTurnStatus
+from common.tracing import tracer
 from model.board import Board
-from model.events import Events
+from model.events import Events, router
+
+
+GAMES_FINISHED = metrics.counter('tictactoe_games_finished_total',
+                                 'The games played to their end.')
+AI_RESPONSE = metrics.histogram('tictactoe_ai_response_seconds',
+                                'The time from asking the AI player for '
+                                'a move to its reply.')
+NOTIFY_ERRORS = metrics.counter('tictactoe_pb_notify_errors_total',
+                                'The onAiMoved pushes which failed.')
 
 
 class Game(object):
@@ -27,9 +37,20 @@ class Game(object):
             The game events listeners.
     """
 
-    log = Logger()
+    log = logs.Logger('model')
+
+    # the longest delta sent instead of a snapshot
+    MAX_DELTA = 16
+
+    # the seconds a turn waits for the AI reply beyond the time budget
+    # of the AI move
+    TURN_GRACE = 30.0
 
-    def __init__(self, playerOne=None, playerTwo=None):
+    # the clock of the turn deadlines
+    clock = reactor
+
+    def __init__(self, playerOne=None, playerTwo=None,
+                 size=Board.SIZE, winLength=None):
         """Inits an instance of the Game class.
 
         PlayerOne is always the human side of the game.
@@ -39,26 +60,40 @@ class Game(object):
                 The human player (default is None).
             playerTwo (Optional[model.player.Player]):
                 The AI player (default is None).
+            size (Optional[int]):
+                The number of rows and columns of the board (default is 3).
+            winLength (Optional[int]):
+                The number of symbols in a row needed to win
+                (default is the board size, at most 5).
 
         """
 
         self.playerOne = playerOne
         self.playerTwo = playerTwo
         self.listeners = list()
+        # the AI move made before any listener was added
+        self._unnotified = None
+        # when the AI player was asked for its move
+        self._aiAsked = None
+        # the turns waiting for the AI reply:
+        # (Deferred, human move, version before the move)
+        self._turns = list()
 
         self.aiPlayer = self.playerOne if self.playerOne.isAi \
             else self.playerTwo
 
-        self._board = Board()
+        self._board = Board(size, winLength)
         self._uuid = None
+        # the moves on the board: (row, col, symbol)
         self._moves = list()
+        # the changes of the board, one per version: (cell, symbol); a
+        # move taken back clears its cell
+        self._history = list()
         self.status = Status.InProgress
         self.nextPlayer = self.playerOne
 
-        dispatcher.connect(self._onAiMoveResponse, signal=Events.aiResponse)
-
     @staticmethod
-    def create(playerOne, playerTwo):
+    def create(playerOne, playerTwo, size=Board.SIZE, winLength=None):
         """Creates an instance of the Game class.
 
         Sets the UUID of the new game.
@@ -66,6 +101,9 @@ class Game(object):
         Args:
             playerOne (model.player.Player)
             playerTwo (model.player.Player)
+            size (Optional[int]): The board size.
+            winLength (Optional[int]): The number of symbols in a row
+                needed to win.
 
         Returns:
             An instance of the Game class where the attribute _uuid
@@ -78,34 +116,101 @@ class Game(object):
         if playerTwo is None:
             raise ValueError('playerTwo')
 
-        p = Game(playerOne, playerTwo)
+        p = Game(playerOne, playerTwo, size, winLength)
         p.uuid = uuid.uuid4()
         return p
 
-    def start(self):
-        self.log.info('Starting the game {0}'.format(self.uuid))
+    def start(self, aiPool=None):
+        """Starts the AI player of the game.
+
+        Args:
+            aiPool (Optional[ai.protocols.aipool.AiWorkerPool]):
+                The pool of AI processes serving the game; if None a new
+                AI process is spawned for the game.
+
+        """
+        self.log.info('Starting the game {uuid!s}', uuid=self.uuid)
+
+        router.connect(self._onAiMoveResponse, Events.aiResponse, self.uuid)
+        router.connect(self._onAiFailed, Events.aiFailed, self.uuid)
+
+        kwargs = dict(size=self._board.size,
+                      winLength=self._board.winLength,
+                      timeLimit=self.aiPlayer.timeLimit,
+                      engine=self.aiPlayer.engine,
+                      playouts=self.aiPlayer.playouts)
+
+        if aiPool is not None:
+            aiPool.attach(bytes(self.uuid),
+                          self.aiPlayer.symbol,
+                          self.aiPlayer.depth,
+                          **kwargs)
+        else:
+            # prepares to launch the AI script
+            aiScriptPath = aiprotocol.scriptPath()
+            self.log.debug('AI script path is {path!s}', path=aiScriptPath)
 
-        # prepares to launch the AI script
-        aiScriptPath = os.getcwd() + "/../ai/aiprocess.py"
-        self.log.debug('AI script path is {0!s}'.format(aiScriptPath))
+            aiprotocol.makePipe(bytes(self.uuid),
+                                self.aiPlayer.symbol,
+                                self.aiPlayer.depth,
+                                sys.executable, aiScriptPath,
+                                **kwargs)
 
-        kwargs = dict()
-        aiprotocol.makePipe(bytes(self.uuid),
-                            self.aiPlayer.symbol,
-                            self.aiPlayer.depth,
-                            sys.executable, aiScriptPath,
-                            **kwargs)
+        # the AI process is asked for the opening move if it plays first
+        if self.nextPlayer == self.aiPlayer:
+            self._aiMove(-1, -1)
 
     def stop(self):
-        pass
+        """Stops the AI player of the game.
+
+        Sends Events.quit (the AI process leaves the game) and releases
+        every event subscriber of the game.
+        """
+        router.close(self.uuid)
 
     def close(self):
-        pass
+        """Stops the game and drops its listeners."""
+        self.stop()
+        self.listeners = list()
+        self._unnotified = None
+
+        turns, self._turns = self._turns, list()
+        for d, _, _ in turns:
+            d.errback(RuntimeError('The game {0!s} was closed.'.
+                                   format(self.uuid)))
+
+    def addListener(self, listener):
+        """Adds a listener of the game events.
+
+        The AI player may have moved before the client had a chance to
+        add its listener: the move is sent to the first listener added.
+
+        Args:
+            listener (twisted.spread.pb.RemoteReference):
+                The remote object notified by 'onAiMoved'.
+
+        """
+        self.listeners.append(listener)
+
+        if self._unnotified is not None:
+            row, col, gameStatus, traceId = self._unnotified
+            self._unnotified = None
+            self._notifyAiMoved(listener, row, col, gameStatus, traceId)
 
     @property
     def boardData(self):
         return self._board.data
 
+    @property
+    def size(self):
+        """Gets the number of rows (and columns) of the board."""
+        return self._board.size
+
+    @property
+    def winLength(self):
+        """Gets the number of symbols in a row needed to win."""
+        return self._board.winLength
+
     @property
     def uuid(self):
         """Gets the UUID of the game."""
@@ -119,7 +224,7 @@ class Game(object):
 
         self._uuid = uuid
 
-    def makeMove(self, row, col, symbol):
+    def makeMove(self, row, col, symbol, traceId=None):
         """Handles the player's turn.
 
         Places a piece/symbol on the board at a given position.
@@ -131,26 +236,33 @@ class Game(object):
                 The column.
             symbol (int):
                 The symbol.
+            traceId (Optional[str]):
+                The trace id of the move, carried to the AI player and
+                back to the listeners (see common.tracing).
 
         Returns:
-            The updated status of the game (common.ipc.GameStatus).
+            The updated status of the game (common.ipc.GameStatus), with
+            the cells changed by the move.
 
         Raises:
             IndexError.
 
         """
-        self.log.debug('Invoke makeMove with %d, %d, %d' % (row, col, symbol))
+        self.log.debug('Invoke makeMove with {row}, {col}, {symbol}',
+                       row=row, col=col, symbol=symbol)
 
-        if (row < 0) or (row >= Board.SIZE):
+        if (row < 0) or (row >= self._board.size):
             raise IndexError('Wrong value for the row index: %d' % (row))
 
-        if (col < 0) or (col >= Board.SIZE):
+        if (col < 0) or (col >= self._board.size):
             raise IndexError('Wrong value for the column index: %d' % (col))
 
-        gameStatus = GameStatus(data=self.boardData,
-                                turn=self.nextPlayer.symbol,
+        version = self.version
+        gameStatus = GameStatus(turn=self.nextPlayer.symbol,
                                 status=self.status,
-                                error=Errors.NoError)
+                                error=Errors.NoError,
+                                version=version,
+                                changes=[])
 
         #
         if self.isGameOver():
@@ -159,41 +271,188 @@ class Game(object):
 
         #
         if symbol != self.nextPlayer.symbol:
-            self.log.warn("It is not the {0:d} turn's".format(symbol))
+            self.log.warn("It is not the {symbol:d} turn's", symbol=symbol)
             gameStatus.error = Errors.WrongTurn
             return gameStatus
 
         #
         if self.isLegalMove(row, col):
-            self.log.debug('Place the symbol {0:d} at ({1:d}, {2:d})'.
-                           format(symbol, row, col))
+            self.log.debug('Place the symbol {symbol:d} at ({row:d}, '
+                           '{col:d})', symbol=symbol, row=row, col=col)
 
-            self._board.set(row, col, symbol)
+            cell = row * self._board.size + col
+            self._board.makeMove(cell, symbol)
             self._moves.append((row, col, symbol))
+            self._history.append((cell, symbol))
 
             self.status = self._computeGameStatus(row, col)
             if self.isGameOver():
-                self.log.info('The game is over : {0:d}'.format(self.status))
-                dispatcher.send(signal=Events.quit, uuid=self.uuid)
+                self.log.info('The game is over : {status:d}',
+                              status=self.status)
+                GAMES_FINISHED.inc()
+                # stops the AI player and drops the game's subscribers
+                router.close(self.uuid)
             else:
                 self._updateNextSymbol()
-                self.log.debug('Game.makeMove - next symbol is {0:d}'.
-                               format(self.nextPlayer.symbol))
+                self.log.debug('Game.makeMove - next symbol is {symbol:d}',
+                               symbol=self.nextPlayer.symbol)
 
                 gameStatus.turn = self.nextPlayer.symbol
 
                 #
                 if self.nextPlayer.symbol == self.aiPlayer.symbol:
-                    self._aiMove(row, col)
+                    self._aiMove(row, col, traceId)
         else:
             self.log.error('Illegal move')
             gameStatus.error = Errors.IlegalMove
 
-        gameStatus.data = self.boardData
+        gameStatus.version = self.version
+        gameStatus.changes = self._changes(version)
         gameStatus.status = self.status
 
         return gameStatus
 
+    def statusSince(self, version=None):
+        """Gets the status of the game for a client.
+
+        Args:
+            version (Optional[int]): The version of the client's copy of
+                the board; None asks for a snapshot.
+
+        Returns:
+            common.ipc.GameStatus: The cells changed since ``version``,
+                or the whole board if the version is unknown or so old
+                that a snapshot is smaller.
+
+        """
+        gameStatus = GameStatus(turn=self.nextPlayer.symbol,
+                                status=self.status,
+                                error=Errors.NoError,
+                                version=self.version)
+
+        if version is None or not \
+                0 <= self.version - version <= self.MAX_DELTA:
+            gameStatus.data = self.boardData
+        else:
+            gameStatus.changes = self._changes(version)
+
+        return gameStatus
+
+    def takeback(self, symbol):
+        """Takes back the last move of the human player.
+
+        The AI reply to that move is taken back as well, so the human
+        player is to move again; the AI player is told to take the moves
+        back from its board (Events.takeback). A move can be taken back
+        only while the game is in progress and the AI player is not
+        searching its move.
+
+        Args:
+            symbol (int): The symbol of the human player.
+
+        Returns:
+            common.ipc.GameStatus: The status of the game, with the cells
+                cleared.
+
+        """
+        version = self.version
+        gameStatus = GameStatus(turn=self.nextPlayer.symbol,
+                                status=self.status,
+                                error=Errors.NoError,
+                                version=version,
+                                changes=[])
+
+        if self.isGameOver():
+            self.log.info('The game was over !')
+            return gameStatus
+
+        if symbol != self.nextPlayer.symbol or \
+                symbol == self.aiPlayer.symbol:
+            self.log.warn("It is not the {symbol:d} turn's", symbol=symbol)
+            gameStatus.error = Errors.WrongTurn
+            return gameStatus
+
+        if not any(s == symbol for _, _, s in self._moves):
+            gameStatus.error = Errors.NoMoveToTakeBack
+            return gameStatus
+
+        count = 0
+        while True:
+            _, _, s = self._moves.pop()
+            cell = self._board.unmakeMove()
+            self._history.append((cell, Symbol.Empty))
+            count += 1
+            if s == symbol:
+                break
+
+        self.log.debug('Took back {count} moves', count=count)
+
+        # the AI move taken back is not to be notified anymore
+        self._unnotified = None
+        router.send(Events.takeback, self.uuid, count=count)
+
+        gameStatus.version = self.version
+        gameStatus.changes = self._changes(version)
+        return gameStatus
+
+    @property
+    def version(self):
+        """Gets the version of the board (the number of changes made)."""
+        return len(self._history)
+
+    def makeTurn(self, row, col, symbol):
+        """Handles the player's move and waits for the AI reply.
+
+        The combined version of makeMove: the returned Deferred fires
+        once the AI player has answered, and the listeners are not called
+        for that AI move. It fires at once if the move is refused or if
+        it ends the game. It fails with defer.TimeoutError if the AI
+        player has not answered within its time budget and TURN_GRACE,
+        or with a RuntimeError if the AI player fails.
+
+        Args:
+            row (int): The row.
+            col (int): The column.
+            symbol (int): The symbol.
+
+        Returns:
+            Deferred: Fires with a common.ipc.CopyTurnStatus.
+
+        Raises:
+            IndexError.
+
+        """
+        d = defer.Deferred()
+        turn = (d, (row, col), self.version)
+
+        # the AI player may answer before makeMove returns
+        self._turns.append(turn)
+        try:
+            gameStatus = self.makeMove(row, col, symbol)
+        except Exception:
+            self._turns.remove(turn)
+            raise
+
+        if not d.called and (gameStatus.error != Errors.NoError or
+                             self.nextPlayer != self.aiPlayer or
+                             self.isGameOver()):
+            self._turns.remove(turn)
+            d.callback(CopyTurnStatus(gameStatus, (row, col)))
+
+        if not d.called:
+            d.addTimeout(self.TURN_GRACE + (self.aiPlayer.timeLimit or 0),
+                         self.clock)
+            d.addErrback(self._onTurnFailed, turn)
+
+        return d
+
+    def _onTurnFailed(self, failure, turn):
+        """Forgets a turn which has timed out."""
+        if turn in self._turns:
+            self._turns.remove(turn)
+
+        return failure
+
     def isLegalMove(self, row, col):
         """Checks if a piece can be placed on the board at a given position.
 
@@ -206,10 +465,9 @@ class Game(object):
                     False otherwise.
 
         """
-        self.log.debug('Invoke isLegalMove with (%d, %d)' % (row, col))
-
         symbol = self._board.get(row, col)
-        self.log.debug('symbol = {0!s}'.format(symbol))
+        self.log.debug('isLegalMove ({row}, {col}): symbol = {symbol}',
+                       row=row, col=col, symbol=symbol)
 
         return (not self.isGameOver()) and (symbol == Symbol.Empty)
 
@@ -220,11 +478,9 @@ class Game(object):
             bool: True if the game is over, False otherwise.
 
         """
-        self.log.debug('invoking isGameOver: status is {status:d}',
-                       status=self.status)
         return (self.status != Status.InProgress)
 
-    def _aiMove(self, row, col):
+    def _aiMove(self, row, col, traceId=None):
         """Signals that AI player is to make the next move.
 
         Args
@@ -232,24 +488,23 @@ class Game(object):
                 The last row coordinate of the human move.
             col (int):
                 The last column coordinate of the human move.
+            traceId (Optional[str]):
+                The trace id of the human move.
 
         """
-        dispatcher.send(signal=Events.aiMove, uuid=self.uuid,
-                        row=row, col=col)
+        self._aiAsked = time.time()
+        router.send(Events.aiMove, self.uuid, row=row, col=col,
+                    traceId=traceId)
 
-    def _onAiMoveResponse(self, uuid, row, col):
+    def _onAiMoveResponse(self, uuid, row, col, traceId=None):
         """Handles the Events.AiResponse signal."""
+        if self._aiAsked is not None:
+            AI_RESPONSE.observe(time.time() - self._aiAsked)
+            self._aiAsked = None
 
         self.log.debug('_onAiMoveResponse: {uuid}, {row}, {col}',
                        uuid=uuid, row=row, col=col)
 
-        self.log.debug('_onAiMoveResponse: self.uuid = {uuid}',
-                       uuid=self.uuid)
-
-        if str(uuid) != str(self.uuid):
-            # it's not for this game: ignore the signal
-            return
-
         self.log.debug('AI process responded with: row {row} and col {col}',
                        row=row, col=col)
 
@@ -257,72 +512,88 @@ class Game(object):
         gameStatus = None
         if (row == -1) or (col == -1):
             self.log.debug('_onAiMoveResponse: no moves available')
-            gameStatus = CopyGameStatus(GameStatus(status=Status.Tie))
+            gameStatus = GameStatus(status=Status.Tie,
+                                    version=self.version, changes=[])
+            gameStatus = CopyGameStatus(gameStatus)
         else:
             gameStatus = CopyGameStatus(self.makeMove(row,
                                                       col,
                                                       self.aiPlayer.symbol))
 
+        # the combined turns get the AI move in their response
+        if self._turns:
+            turns, self._turns = self._turns, list()
+            for d, move, version in turns:
+                # the changes of both moves
+                d.callback(CopyTurnStatus(self.statusSince(version),
+                                          move, (row, col)))
+            return
+
         # try to notify the client that the AI's turn has completed
-        if self.listeners:
-            for cbk in self.listeners:
-                self.log.debug('calling onAiMoved on the remote object')
+        if not self.listeners:
+            self._unnotified = (row, col, gameStatus, traceId)
 
-                d = cbk.callRemote('onAiMoved',
-                                   row=row, col=col,
-                                   results=gameStatus)
+        for cbk in self.listeners:
+            self._notifyAiMoved(cbk, row, col, gameStatus, traceId)
 
-                d.addCallback(lambda _:
-                              self.log.debug('remote_onAiMoved succeeded'))
+    def _onAiFailed(self, uuid, reason):
+        """Handles the Events.aiFailed signal: the game is aborted.
 
-                d.addErrback(lambda reason:
-                             self.log.error('remote_onAiMoved failed: {reason}',
-                                            reason=reason))
+        The listeners get an 'onAiMoved' with no move, the status
+        Status.Aborted and the error Errors.AiFailed.
+        """
+        if self.isGameOver():
+            return
 
-    def _count(self, symbol, row, col, dirI, dirJ):
-        """Counts the occurrences of a symbol along a given direction.
+        self.log.error('The AI player of the game {uuid} has failed: '
+                       '{reason}', uuid=uuid, reason=reason)
 
-        While inside the bounds of the board go in forward and backward
-        directions of the direction vector and increment the counter
-        while still on the 'side' symbol.
+        self._aiAsked = None
+        self.status = Status.Aborted
 
-        Args:
-            symbol (int): The symbol.
-            row (int): The row where the piece/symbol was placed on.
-            col (int): The column where the piece/symbol was placed on.
-            dirI (int): The row component of the direction vector.
-            dirJ (int): The column component of the direction vector.
+        turns, self._turns = self._turns, list()
+        for d, _, _ in turns:
+            d.errback(RuntimeError('The AI player has failed: {0}'.
+                                   format(reason)))
+        gameStatus = CopyGameStatus(GameStatus(turn=self.nextPlayer.symbol,
+                                               status=self.status,
+                                               error=Errors.AiFailed,
+                                               version=self.version,
+                                               changes=[]))
 
-        Returns:
-            int: The number of occurrences of the given symbol.
+        if not self.listeners:
+            self._unnotified = (-1, -1, gameStatus, None)
 
-        """
-        count = 0
-        i = row
-        j = col
+        for cbk in self.listeners:
+            self._notifyAiMoved(cbk, -1, -1, gameStatus)
 
-        # forward direction
-        while (i > -1) and (i < Board.SIZE) and \
-                (j > -1) and (j < Board.SIZE) and \
-                (self._board.get(i, j) == symbol):
-            count += 1
-            i += dirI
-            j += dirJ
+        # drops the game's subscribers; the reaper evicts the game
+        router.close(self.uuid)
 
-        # backward direction
-        i = row - dirI
-        j = col - dirJ
+    def _notifyAiMoved(self, cbk, row, col, gameStatus, traceId=None):
+        """Calls 'onAiMoved' on a listener."""
+        self.log.debug('calling onAiMoved on the remote object')
 
-        while (i > -1) and (i < Board.SIZE) and \
-                (j > -1) and (j < Board.SIZE) and \
-                (self._board.get(i, j) == symbol):
-            count += 1
-            i -= dirI
-            j -= dirJ
+        tracer.span(traceId, 'server.notify', game=str(self.uuid))
+        d = cbk.callRemote('onAiMoved',
+                           row=row, col=col,
+                           results=gameStatus,
+                           traceId=traceId)
+
+        d.addCallback(lambda _:
+                      tracer.span(traceId, 'server.notified'))
+        d.addCallback(lambda _:
+                      self.log.debug('remote_onAiMoved succeeded'))
 
-        self.log.debug('_count: count = {0:d}'.format(count))
+        d.addErrback(self._onNotifyFailed)
 
-        return count
+    def _onNotifyFailed(self, reason):
+        NOTIFY_ERRORS.inc()
+        self.log.error('remote_onAiMoved failed: {reason}', reason=reason)
+
+    def _changes(self, version):
+        """Gets the (cell, symbol) pairs set since a version."""
+        return self._history[version:]
 
     def _computeGameStatus(self, row, col):
         """Checks if we have a winner or it's a tie.
@@ -335,26 +606,16 @@ class Game(object):
             The status of the game: Status.Tie, Status.X_Won or Status.O_Won.
 
         """
-        self.log.debug('_computeGameStatus: (%d, %d)' % (row, col))
-
-        if self._moves.count == (Board.SIZE ** 2):
-            return Status.Tie
-
         symbol = self._board.get(row, col)
 
-        self.log.debug('_computeGameStatus: symbol is %d' % (symbol))
-
-        if (self._count(symbol, row, col, 1, 0) == Board.SIZE):
-            return self._winner(symbol)
+        self.log.debug('_computeGameStatus: ({row}, {col}), symbol is '
+                       '{symbol}', row=row, col=col, symbol=symbol)
 
-        if (self._count(symbol, row, col, 0, 1) == Board.SIZE):
+        if self._board.isWinner(symbol):
             return self._winner(symbol)
 
-        if (self._count(symbol, row, col, 1, -1) == Board.SIZE):
-            return self._winner(symbol)
-
-        if (self._count(symbol, row, col, 1, 1) == Board.SIZE):
-            return self._winner(symbol)
+        if self._board.isFull():
+            return Status.Tie
 
         return Status.InProgress
 
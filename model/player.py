@@ -8,25 +8,42 @@ from common.constants import PlayerType, Symbol
 class Player(object):
     """
 
-    Encapsulates the player's attributes (type, symbol and the search depth).
+    Encapsulates the player's attributes (type, symbol, the search depth,
+    the time budget of a move and the search engine).
     Provides a factory function to create instances of the class Player.
 
+    The search of the AI player deepens until the depth limit (0 means no
+    limit) or until the time budget of the move runs out, whichever comes
+    first. The Monte Carlo tree search (Engine.Mcts) runs playouts until
+    their limit or until the time budget runs out.
+
     """
 
-    def __init__(self, type=PlayerType.Human, symbol=Symbol.X, depth=0):
+    def __init__(self, type=PlayerType.Human, symbol=Symbol.X, depth=0,
+                 timeLimit=None, engine=None, playouts=None):
         """Inits an instance of the class Player.
 
         Args:
             type (Optional[int]): The player type (Human or AI).
             symbol (Optional[int]): The player's symbol (X or O).
             depth (Optional[int]): The search depth for the AI player.
+            timeLimit (Optional[float]): The time budget of a move of the
+                AI player, in seconds (None for the AI process default).
+            engine (Optional[str]): The search engine of the AI player
+                (None for the AI process default, the alpha-beta search).
+            playouts (Optional[int]): The playouts of a move of the MCTS
+                engine (None for no limit but the time budget).
         """
         self._type = type
         self._symbol = symbol
 
         self.searchDepth = None
         if self._type == PlayerType.Ai:
-            self.searchDepth = depth if depth <= 4 else 4
+            self.searchDepth = depth
+
+        self.timeLimit = timeLimit
+        self.engine = engine
+        self.playouts = playouts
 
     @property
     def symbol(self):
@@ -89,8 +106,16 @@ class Player(object):
         p.symbol = symbol
 
         if kwargs['depth'] is not None:
-            depth = int(kwargs['depth'])
-            p.depth = depth if depth <= 4 else 4
+            p.depth = int(kwargs['depth'])
+
+        if kwargs.get('timeLimit') is not None:
+            p.timeLimit = float(kwargs['timeLimit'])
+
+        if kwargs.get('engine') is not None:
+            p.engine = kwargs['engine']
+
+        if kwargs.get('playouts') is not None:
+            p.playouts = int(kwargs['playouts'])
 
         return p
 
@@ -116,6 +141,21 @@ class PlayerBuilder(object):
         self._player.depth = depth
         return self
 
+    def timeLimit(self, seconds):
+        """Sets the time budget of a move."""
+        self._player.timeLimit = seconds
+        return self
+
+    def engine(self, engine):
+        """Sets the search engine."""
+        self._player.engine = engine
+        return self
+
+    def playouts(self, playouts):
+        """Sets the playouts of a move of the MCTS engine."""
+        self._player.playouts = playouts
+        return self
+
     def build(self):
         """Returns the player."""
         return self._player
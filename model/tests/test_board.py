@@ -0,0 +1,275 @@
+# -------------------------------------
+# test_board.py
+# -------------------------------------
+
+import random
+
+from twisted.trial import unittest
+
+from common.constants import Symbol
+from model.board import Board, Geometry
+
+
+def hasLine(board, symbol):
+    """Looks for winLength symbols in a row, cell by cell."""
+    n, k = board.size, board.winLength
+    for row in xrange(n):
+        for col in xrange(n):
+            for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                cells = [(row + i * dr, col + i * dc) for i in xrange(k)]
+                if all(0 <= r < n and 0 <= c < n and
+                       board.get(r, c) == symbol for r, c in cells):
+                    return True
+
+    return False
+
+
+def fill(board, data):
+    """Places the symbols of a list of one-character strings."""
+    for index, symbol in enumerate(data):
+        if symbol != str(Symbol.Empty):
+            board.setCell(index, int(symbol))
+
+
+class BitboardTest(unittest.TestCase):
+
+    def test_dataRoundTrip(self):
+        rand = random.Random(1)
+        for _ in xrange(50):
+            data = [str(rand.choice((Symbol.Empty, Symbol.X, Symbol.O)))
+                    for _ in xrange(9)]
+            board = Board()
+            fill(board, data)
+
+            self.assertEqual(board.data, data)
+            self.assertEqual(board.occupied,
+                             sum(1 for s in data if s != str(Symbol.Empty)))
+            for index, symbol in enumerate(data):
+                self.assertEqual(board.getCell(index), int(symbol))
+
+    def test_isFull(self):
+        board = Board()
+        for index in xrange(9):
+            self.assertFalse(board.isFull())
+            board.setCell(index, Symbol.X if index % 2 else Symbol.O)
+
+        self.assertTrue(board.isFull())
+
+        board.setCell(4, Symbol.Empty)
+        self.assertFalse(board.isFull())
+        self.assertEqual(board.data[4], str(Symbol.Empty))
+
+    def test_winner(self):
+        board = Board()
+        for col in xrange(2):
+            board.set(1, col, Symbol.X)
+        self.assertFalse(board.isWinner(Symbol.X))
+
+        board.set(1, 2, Symbol.X)
+        self.assertTrue(board.isWinner(Symbol.X))
+        self.assertTrue(board.isWinningMove(1, 2, Symbol.X))
+        self.assertFalse(board.isWinner(Symbol.O))
+
+        # clearing a cell takes the win back
+        board.set(1, 0, Symbol.Empty)
+        self.assertFalse(board.isWinner(Symbol.X))
+
+    def test_emptyBoard(self):
+        board = Board()
+        self.assertEqual(board.data, [str(Symbol.Empty)] * 9)
+        self.assertEqual(board.empty(), (1 << 9) - 1)
+        self.assertEqual(board.mask(Symbol.X), 0)
+        self.assertEqual(board.hash, 0)
+
+
+class DimensionsTest(unittest.TestCase):
+
+    def test_winLengthShorterThanSize(self):
+        # the four directions, away from the corners
+        for cells in ([(2, 1), (2, 2), (2, 3), (2, 4)],
+                      [(0, 5), (1, 5), (2, 5), (3, 5)],
+                      [(2, 2), (3, 3), (4, 4), (5, 5)],
+                      [(0, 5), (1, 4), (2, 3), (3, 2)]):
+            board = Board(6, 4)
+            for row, col in cells[:-1]:
+                board.set(row, col, Symbol.O)
+            self.assertFalse(board.isWinner(Symbol.O))
+
+            row, col = cells[-1]
+            board.set(row, col, Symbol.O)
+            self.assertTrue(board.isWinner(Symbol.O))
+            self.assertTrue(board.isWinningMove(row, col, Symbol.O))
+
+    def test_brokenLine(self):
+        board = Board(7, 5)
+        for col in (0, 1, 2, 4, 5, 6):
+            board.set(3, col, Symbol.X)
+        board.set(3, 3, Symbol.O)
+        self.assertFalse(board.isWinner(Symbol.X))
+
+    def test_randomBoards(self):
+        rand = random.Random(2)
+        for size, winLength in ((4, 3), (5, 4), (7, 5), (9, 5)):
+            for _ in xrange(40):
+                board = Board(size, winLength)
+                for index in xrange(size * size):
+                    board.setCell(index, rand.choice(
+                        (Symbol.Empty, Symbol.Empty, Symbol.X, Symbol.O)))
+
+                for symbol in (Symbol.X, Symbol.O):
+                    self.assertEqual(board.isWinner(symbol),
+                                     hasLine(board, symbol))
+
+                data = board.data
+                copy = Board(size, winLength)
+                fill(copy, data)
+                self.assertEqual(copy.data, data)
+                self.assertEqual(copy.hash, board.hash)
+
+    def test_defaultWinLength(self):
+        self.assertEqual(Board(4).winLength, 4)
+        self.assertEqual(Board(15).winLength, Board.MAX_WIN_LENGTH)
+
+    def test_badDimensions(self):
+        self.assertRaises(ValueError, Board, 0)
+        self.assertRaises(ValueError, Board, 3, 4)
+        self.assertRaises(ValueError, Board, 5, 0)
+
+    def test_maxSize(self):
+        board = Board(Geometry.MAX_SIZE, 5)
+        board.set(Geometry.MAX_SIZE - 1, Geometry.MAX_SIZE - 1, Symbol.X)
+        self.assertEqual(board.occupied, 1)
+
+        self.assertRaises(ValueError, Board, Geometry.MAX_SIZE + 1, 5)
+        self.assertRaises(ValueError, Geometry.get, 150, 5)
+        self.assertNotIn((Geometry.MAX_SIZE + 1, 5), Geometry._cache)
+
+
+class CanonicalTest(unittest.TestCase):
+
+    def images(self, size, cells):
+        """The boards of the eight symmetric images of a position."""
+        for transform in Geometry.SYMMETRIES:
+            board = Board(size, 3)
+            for (row, col), symbol in cells:
+                r, c = transform(row, col, size - 1)
+                board.set(r, c, symbol)
+            yield board
+
+    def test_symmetricImages(self):
+        rand = random.Random(3)
+        for size in (3, 4, 5):
+            for _ in xrange(20):
+                cells = {}
+                for _ in xrange(rand.randint(1, size * size - 1)):
+                    cells[(rand.randrange(size), rand.randrange(size))] = \
+                        rand.choice((Symbol.X, Symbol.O))
+
+                boards = list(self.images(size, cells.items()))
+                keys = set(board.canonical()[0] for board in boards)
+                self.assertEqual(len(keys), 1)
+
+                # the transform maps every board onto the same image
+                image = None
+                for board in boards:
+                    _, transform = board.canonical()
+                    cellsOfImage = sorted(
+                        (board.toCanonical(index, transform),
+                         board.getCell(index))
+                        for index in xrange(size * size))
+                    if image is None:
+                        image = cellsOfImage
+                    self.assertEqual(cellsOfImage, image)
+
+    def test_toAndFromCanonical(self):
+        board = Board(4, 3)
+        board.set(0, 1, Symbol.X)
+        board.set(2, 3, Symbol.O)
+        _, transform = board.canonical()
+        for index in xrange(16):
+            self.assertEqual(board.fromCanonical(
+                board.toCanonical(index, transform), transform), index)
+
+    def test_differentPositions(self):
+        one, other = Board(), Board()
+        one.set(0, 0, Symbol.X)
+        other.set(1, 1, Symbol.X)
+        self.assertNotEqual(one.canonical()[0], other.canonical()[0])
+
+        # the same cells, the sides swapped
+        other = Board()
+        other.set(0, 0, Symbol.O)
+        self.assertNotEqual(one.canonical()[0], other.canonical()[0])
+
+
+class MakeMoveTest(unittest.TestCase):
+
+    def state(self, board):
+        """Everything a move changes, and takes back."""
+        return (board.data, board.occupied, board.hash, board.canonical(),
+                list(board.lineCounts(Symbol.X)),
+                list(board.lineCounts(Symbol.O)),
+                board.isWinner(Symbol.X), board.isWinner(Symbol.O),
+                board.neighbours())
+
+    def test_unmakeRestores(self):
+        rand = random.Random(4)
+        for size, winLength in ((3, 3), (6, 4), (9, 5)):
+            board = Board(size, winLength)
+            states = [self.state(board)]
+            symbol = Symbol.X
+            for _ in xrange(2000):
+                empty = [index for index in xrange(size * size)
+                         if board.getCell(index) == Symbol.Empty]
+                if board.ply and (not empty or rand.random() < 0.4):
+                    board.unmakeMove()
+                    states.pop()
+                    symbol = Symbol.O if symbol == Symbol.X else Symbol.X
+                else:
+                    board.makeMove(rand.choice(empty), symbol)
+                    states.append(self.state(board))
+                    symbol = Symbol.O if symbol == Symbol.X else Symbol.X
+
+                self.assertEqual(board.ply, len(states) - 1)
+                self.assertEqual(self.state(board), states[-1])
+
+            while board.ply:
+                board.unmakeMove()
+            self.assertEqual(self.state(board), states[0])
+
+    def test_neighbours(self):
+        board = Board(7, 5)
+        board.makeMove(0, Symbol.X)
+        board.makeMove(24, Symbol.O)
+        board.makeMove(48, Symbol.X)
+
+        # the same position, set cell by cell: the mask is computed
+        other = Board(7, 5)
+        for index, symbol in ((0, Symbol.X), (24, Symbol.O), (48, Symbol.X)):
+            other.setCell(index, symbol)
+        self.assertEqual(board.neighbours(), other.neighbours())
+        self.assertEqual(board.neighbours(2), other.neighbours(2))
+
+        self.assertEqual(board.unmakeMove(), 48)
+        other.setCell(48, Symbol.Empty)
+        self.assertEqual(board.neighbours(), other.neighbours())
+
+    def test_setCellBetweenMoves(self):
+        board = Board(5, 4)
+        board.makeMove(12, Symbol.X)
+        board.setCell(0, Symbol.O)
+        board.makeMove(6, Symbol.X)
+        board.unmakeMove()
+
+        other = Board(5, 4)
+        other.setCell(12, Symbol.X)
+        other.setCell(0, Symbol.O)
+        self.assertEqual(self.state(board), self.state(other))
+
+    def test_emptyStack(self):
+        board = Board()
+        self.assertRaises(IndexError, board.unmakeMove)
+
+        board.makeMove(4, Symbol.X)
+        self.assertEqual(board.unmakeMove(), 4)
+        self.assertRaises(IndexError, board.unmakeMove)
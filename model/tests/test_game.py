@@ -0,0 +1,260 @@
+# -------------------------------------
+# test_game.py
+# -------------------------------------
+
+from twisted.internet import defer, task
+from twisted.trial import unittest
+
+from common.constants import Errors, PlayerType, Status, Symbol
+from common.ipc import applyStatus
+from model.events import Events, router
+from model.game import Game
+from model.player import Player
+
+
+class TakebackTest(unittest.TestCase):
+
+    def setUp(self):
+        # the game is not started: the AI moves are made by the test
+        self.game = Game.create(Player(PlayerType.Human, Symbol.X),
+                                Player(PlayerType.Ai, Symbol.O), 5, 4)
+        self.takebacks = []
+        router.connect(self._onTakeback, Events.takeback, self.game.uuid)
+
+    def tearDown(self):
+        router.release(self.game.uuid)
+
+    def _onTakeback(self, uuid, count):
+        self.takebacks.append(count)
+
+    def play(self, *moves):
+        """Plays moves for both sides, the human side first."""
+        symbol = Symbol.X
+        for row, col in moves:
+            status = self.game.makeMove(row, col, symbol)
+            self.assertEqual(status.error, Errors.NoError)
+            symbol = Symbol.O if symbol == Symbol.X else Symbol.X
+
+    def test_versionIsMonotonic(self):
+        game = self.game
+        self.play((2, 2), (1, 1), (2, 3), (1, 2))
+        self.assertEqual(game.version, 4)
+
+        status = game.takeback(Symbol.X)
+        self.assertEqual(status.error, Errors.NoError)
+        self.assertEqual(status.version, 6)
+        self.assertEqual(status.changes, [(7, Symbol.Empty),
+                                          (13, Symbol.Empty)])
+        self.assertEqual(status.turn, Symbol.X)
+        self.assertEqual(self.takebacks, [2])
+
+        # the same cell played again is a new version
+        self.play((2, 3))
+        self.assertEqual(game.version, 7)
+        self.assertEqual(game.statusSince(6).changes, [(13, Symbol.X)])
+
+    def test_statusSince(self):
+        game = self.game
+        self.play((2, 2), (1, 1))
+        data = game.statusSince().data
+        version = game.version
+
+        self.play((0, 0), (4, 4))
+        game.takeback(Symbol.X)
+        game.takeback(Symbol.X)
+        self.play((3, 3))
+
+        # a client copy of any version catches up with the deltas
+        delta = game.statusSince(version)
+        self.assertEqual(delta.changes, [(0, Symbol.X), (24, Symbol.O),
+                                         (24, Symbol.Empty),
+                                         (0, Symbol.Empty),
+                                         (6, Symbol.Empty),
+                                         (12, Symbol.Empty),
+                                         (18, Symbol.X)])
+        self.assertEqual(applyStatus(data, version, delta), game.version)
+        self.assertEqual(data, game.boardData)
+        self.assertEqual(data, game.statusSince().data)
+
+        empty = [str(Symbol.Empty)] * 25
+        self.assertEqual(applyStatus(empty, 0, game.statusSince(0)),
+                         game.version)
+        self.assertEqual(empty, game.boardData)
+
+    def test_noMoveToTakeBack(self):
+        status = self.game.takeback(Symbol.X)
+        self.assertEqual(status.error, Errors.NoMoveToTakeBack)
+        self.assertEqual(status.version, 0)
+        self.assertEqual(status.changes, [])
+
+        self.play((2, 2), (1, 1))
+        self.game.takeback(Symbol.X)
+        status = self.game.takeback(Symbol.X)
+        self.assertEqual(status.error, Errors.NoMoveToTakeBack)
+        self.assertEqual(status.version, 4)
+        self.assertEqual(self.takebacks, [2])
+
+    def test_wrongTurn(self):
+        self.play((2, 2))
+
+        # the AI player is to move
+        status = self.game.takeback(Symbol.X)
+        self.assertEqual(status.error, Errors.WrongTurn)
+        self.assertEqual(status.version, 1)
+
+        # the AI player takes nothing back
+        self.game.makeMove(1, 1, Symbol.O)
+        status = self.game.takeback(Symbol.O)
+        self.assertEqual(status.error, Errors.WrongTurn)
+        self.assertEqual(self.game.version, 2)
+        self.assertEqual(self.takebacks, [])
+
+    def test_gameOver(self):
+        self.play((0, 0), (1, 0), (0, 1), (1, 1), (0, 2), (1, 2), (0, 3))
+        self.assertEqual(self.game.status, Status.X_Won)
+
+        status = self.game.takeback(Symbol.X)
+        self.assertEqual(status.error, Errors.NoError)
+        self.assertEqual(status.changes, [])
+        self.assertEqual(self.game.version, 7)
+        self.assertEqual(self.takebacks, [])
+
+
+class Listener(object):
+    """Records the calls of the game to a remote listener."""
+
+    def __init__(self):
+        self.calls = []
+
+    def callRemote(self, name, **kwargs):
+        self.calls.append((name, kwargs))
+        return defer.succeed(None)
+
+
+class AttachingPool(object):
+    """An AI pool which records the games attached to it."""
+
+    def __init__(self):
+        self.games = []
+
+    def attach(self, gameUuid, symbol, depth, **kwargs):
+        self.games.append(gameUuid)
+
+
+class AiFailedTest(unittest.TestCase):
+
+    def setUp(self):
+        aiPlayer = Player(PlayerType.Ai, Symbol.O)
+        # set by the game server
+        aiPlayer.depth = 0
+        self.game = Game.create(Player(PlayerType.Human, Symbol.X), aiPlayer)
+        self.game.start(AttachingPool())
+        self.listener = Listener()
+        self.game.addListener(self.listener)
+
+    def tearDown(self):
+        router.release(self.game.uuid)
+
+    def test_aborted(self):
+        self.game.makeMove(1, 1, Symbol.X)
+        router.send(Events.aiFailed, self.game.uuid, reason='ended')
+
+        self.assertEqual(self.game.status, Status.Aborted)
+        self.assertTrue(self.game.isGameOver())
+
+        [(name, kwargs)] = self.listener.calls
+        self.assertEqual(name, 'onAiMoved')
+        self.assertEqual((kwargs['row'], kwargs['col']), (-1, -1))
+        self.assertEqual(kwargs['results'].error, Errors.AiFailed)
+        self.assertEqual(kwargs['results'].status, Status.Aborted)
+        self.assertEqual(kwargs['results'].version, 1)
+
+        # the subscribers of the game are gone
+        self.assertEqual(router.send(Events.aiResponse, self.game.uuid,
+                                     row=0, col=0), 0)
+
+    def test_gameOver(self):
+        self.game.status = Status.X_Won
+        router.send(Events.aiFailed, self.game.uuid, reason='ended')
+        self.assertEqual(self.game.status, Status.X_Won)
+        self.assertEqual(self.listener.calls, [])
+
+
+class MakeTurnTest(unittest.TestCase):
+
+    def setUp(self):
+        aiPlayer = Player(PlayerType.Ai, Symbol.O, timeLimit=1.0)
+        aiPlayer.depth = 0
+        self.game = Game.create(Player(PlayerType.Human, Symbol.X), aiPlayer)
+        self.clock = task.Clock()
+        self.game.clock = self.clock
+        self.game.start(AttachingPool())
+
+    def tearDown(self):
+        router.release(self.game.uuid)
+
+    def test_reply(self):
+        d = self.game.makeTurn(1, 1, Symbol.X)
+        self.assertNoResult(d)
+
+        router.send(Events.aiResponse, self.game.uuid, row=0, col=0)
+        turn = self.successResultOf(d)
+        self.assertEqual(turn.aiMove, (0, 0))
+        self.assertEqual(turn.changes, [(4, Symbol.X), (0, Symbol.O)])
+
+        # the deadline was cancelled
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_deadline(self):
+        d = self.game.makeTurn(1, 1, Symbol.X)
+        self.clock.advance(Game.TURN_GRACE + 0.5)
+        self.assertNoResult(d)
+
+        self.clock.advance(1.0)
+        self.failureResultOf(d, defer.TimeoutError)
+        self.assertEqual(self.game._turns, [])
+
+        # a late reply goes to the listeners
+        router.send(Events.aiResponse, self.game.uuid, row=0, col=0)
+        self.assertEqual(self.game.version, 2)
+
+    def test_aiFailed(self):
+        d = self.game.makeTurn(1, 1, Symbol.X)
+        router.send(Events.aiFailed, self.game.uuid, reason='Error: x')
+        self.failureResultOf(d, RuntimeError)
+        self.assertEqual(self.game.status, Status.Aborted)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+class NotifyTest(unittest.TestCase):
+
+    def setUp(self):
+        aiPlayer = Player(PlayerType.Ai, Symbol.O)
+        aiPlayer.depth = 0
+        self.game = Game.create(Player(PlayerType.Human, Symbol.X), aiPlayer)
+        self.game.start(AttachingPool())
+
+    def tearDown(self):
+        router.release(self.game.uuid)
+
+    def test_traceId(self):
+        listener = Listener()
+        self.game.addListener(listener)
+        self.game.makeMove(1, 1, Symbol.X, 'abc123')
+        router.send(Events.aiResponse, self.game.uuid, row=0, col=0,
+                    traceId='abc123')
+
+        [(name, kwargs)] = listener.calls
+        self.assertEqual(kwargs['traceId'], 'abc123')
+        self.assertEqual((kwargs['row'], kwargs['col']), (0, 0))
+
+    def test_traceIdOfUnnotifiedMove(self):
+        self.game.makeMove(1, 1, Symbol.X, 'abc123')
+        router.send(Events.aiResponse, self.game.uuid, row=0, col=0,
+                    traceId='abc123')
+
+        # the listener added after the AI move gets it
+        listener = Listener()
+        self.game.addListener(listener)
+        [(name, kwargs)] = listener.calls
+        self.assertEqual(kwargs['traceId'], 'abc123')
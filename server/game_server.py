@@ -4,33 +4,90 @@
 
 import os
 import sys
+import time
 import uuid
 
-from pydispatch import dispatcher
-from twisted.logger import Logger
+from twisted.internet import defer
 from twisted.spread import pb
 
 # configures the python source path for this module
 sys.path.append(os.getcwd() + '/..')
 
+from model.board import Board
 from model.game import Game
 from model.player import Player
-from model.events import Events
-from common.ipc import CopyGameStatus
+from model.events import router
+from reaper import GameReaper
+from common import logs, metrics
+from common.constants import Engine, Errors
+from common.ipc import CopyGameStatus, GameStatus
+from common.tracing import isTraceId, newTraceId, tracer
+
+
+GAMES_CREATED = metrics.counter('tictactoe_games_created_total',
+                                'The games created.')
+MAKE_MOVE = metrics.histogram('tictactoe_make_move_seconds',
+                              'The time spent in Game.makeMove.')
+PB_ERRORS = metrics.counter('tictactoe_pb_errors_total',
+                            'The remote calls which failed.')
 
 
 class GameServer(pb.Root):
     """The games server."""
 
-    log = Logger()
+    log = logs.Logger('server')
 
-    def __init__(self):
+    def __init__(self, aiPool=None, finishedGrace=60, idleTtl=1800,
+                 maxTimeLimit=10.0, maxPlayouts=100000):
+        """
+        Args:
+            aiPool (Optional[ai.protocols.aipool.AiWorkerPool]):
+                The AI processes shared by the games; if None every game
+                spawns its own AI process.
+            finishedGrace (Optional[float]): The seconds a finished game
+                is kept before it is evicted.
+            idleTtl (Optional[float]): The seconds a game may stay without
+                moves before it is evicted.
+            maxTimeLimit (Optional[float]): The longest time budget of an
+                AI move a client may ask for, in seconds.
+            maxPlayouts (Optional[int]): The most playouts of an AI move a
+                client may ask for.
+        """
         self._games = {}
+        self._aiPool = aiPool
+        self.maxTimeLimit = maxTimeLimit
+        self.maxPlayouts = maxPlayouts
+        self.reaper = GameReaper(self._games, finishedGrace, idleTtl)
+        metrics.gauge('tictactoe_games_active', 'The games in memory.',
+                      lambda: len(self._games))
+
+    def remoteMessageReceived(self, broker, message, args, kw):
+        """Counts the remote calls which fail (see PB_ERRORS)."""
+        try:
+            result = pb.Root.remoteMessageReceived(self, broker, message,
+                                                   args, kw)
+        except Exception:
+            PB_ERRORS.inc()
+            raise
+
+        if isinstance(result, defer.Deferred):
+            result.addErrback(self._onRemoteError)
+
+        return result
+
+    def _onRemoteError(self, failure):
+        PB_ERRORS.inc()
+        return failure
 
     def remote_createGame(self, playerOneSymbol, playerOneType,
                           playerTwoSymbol, playerTwoType,
                           searchDepth=0,
-                          cbk=None):
+                          cbk=None,
+                          boardSize=Board.SIZE,
+                          winLength=None,
+                          timeLimit=None,
+                          engine=None,
+                          playouts=None):
         """Creates a new Game object.
 
         Args:
@@ -39,6 +96,20 @@ class GameServer(pb.Root):
             playerTwoSymbol (int)
             playerTwoType (int)
             searchDepth (Optional[int])
+            boardSize (Optional[int]): The number of rows and columns (at
+                most model.board.Geometry.MAX_SIZE).
+            winLength (Optional[int]): The number of symbols in a row
+                needed to win (default is the board size, at most 5).
+            timeLimit (Optional[float]): The time budget of an AI move,
+                in seconds (default is the AI process default); the AI
+                search deepens until it runs out. It is cut down to the
+                server's maxTimeLimit.
+            engine (Optional[str]): The search engine of the AI player
+                (common.constants.Engine; default is the alpha-beta
+                search).
+            playouts (Optional[int]): The playouts of an AI move of the
+                MCTS engine (default is no limit but the time budget);
+                cut down to the server's maxPlayouts.
 
         Returns:
             UUID: The UUID of the newly created game.
@@ -54,24 +125,52 @@ class GameServer(pb.Root):
         playerTwo = Player.playerBuilder().symbol(playerTwoSymbol). \
             type(playerTwoType).build()
 
+        if timeLimit is not None and timeLimit <= 0:
+            raise ValueError('Bad time limit: %r' % (timeLimit))
+
+        if engine is not None and \
+                engine not in (Engine.AlphaBeta, Engine.Mcts):
+            raise ValueError('Unknown engine: %s' % (engine))
+
+        if playouts is not None and playouts <= 0:
+            raise ValueError('Bad playouts: %r' % (playouts))
+
+        # a long search holds the AI process shared with other games
+        if timeLimit is not None and timeLimit > self.maxTimeLimit:
+            self.log.info('Time limit {asked} cut down to {limit}',
+                          asked=timeLimit, limit=self.maxTimeLimit)
+            timeLimit = self.maxTimeLimit
+
+        if playouts is not None and playouts > self.maxPlayouts:
+            self.log.info('Playouts {asked} cut down to {limit}',
+                          asked=playouts, limit=self.maxPlayouts)
+            playouts = self.maxPlayouts
+
         if playerOne.isAi:
-            playerOne.depth = searchDepth
+            aiPlayer = playerOne
         elif playerTwo.isAi:
-            playerTwo.depth = searchDepth
+            aiPlayer = playerTwo
         else:
             raise ValueError('No AI player')
 
-        game = Game.create(playerOne, playerTwo)
+        aiPlayer.depth = searchDepth
+        aiPlayer.timeLimit = timeLimit
+        aiPlayer.engine = engine
+        aiPlayer.playouts = playouts
+
+        game = Game.create(playerOne, playerTwo, boardSize, winLength)
 
         # stores the game in our map
         self._games[game.uuid] = game
+        self.reaper.add(game)
+        GAMES_CREATED.inc()
 
         # returns the GUID back to the caller
         self.log.info('A new game ({uuid}) was created', uuid=game.uuid)
 
         # starts the game
         try:
-            game.start()
+            game.start(self._aiPool)
         except Exception, e:
             self.log.failure('Failed to start the game {0}. Reason: {1}'.
                              format(game.uuid, str(e)))
@@ -79,19 +178,28 @@ class GameServer(pb.Root):
         return bytes(game.uuid)
 
     def remote_closeGame(self, gameGuid):
+        """Closes a game and forgets it.
+
+        Args:
+            gameGuid (str): The GUID of the game.
+
+        Raises:
+            LookupError
+
         """
-        """
-        g = self._games[gameGuid]
+        guid = uuid.UUID(gameGuid)
+
+        # removes the game instance from our map
+        g = self._games.pop(guid, None)
         if g is None:
-            raise Exception('remote_closeGame : \
+            raise LookupError('remote_closeGame : \
                 no such game with guid: %s' % (repr(gameGuid)))
 
+        self.reaper.forget(guid)
+
         # 'closes' the game
         g.close()
 
-        # removes the game instance from our map
-        self._games.keys().remove(gameGuid)
-
     def remote_addListener(self, game_uuid, obj):
         """Adds an events listener for a game instance.
         """
@@ -101,9 +209,9 @@ class GameServer(pb.Root):
         game = self._games.get(guid)
         if game:
             self.log.debug('listener for game {guid!s} added', guid=guid)
-            game.listeners.append(obj)
+            game.addListener(obj)
         else:
-            self.log.error('No game with the uiid={guid!s}', uuid=guid)
+            self.log.error('No game with the uiid={guid!s}', guid=guid)
 
     def remote_removeListener(self, game_uuid, obj):
         """Removes an event listeners for a game instance.
@@ -111,13 +219,13 @@ class GameServer(pb.Root):
         guid = uuid.UUID('{%s}' % game_uuid)
         game = self._games.get(guid)
         if game:
-            dispatcher.send(signal=Events.quit, uuid=game_uuid)
+            router.close(game_uuid)
             game.listeners.remove(obj)
             self.log.debug('listener for game {guid!s} removed', guid=guid)
         else:
             self.log.error('No game with the uiid={uuid}', uuid=guid)
 
-    def remote_makeMove(self, gameGuid, player, row, col):
+    def remote_makeMove(self, gameGuid, player, row, col, traceId=None):
         """Handles a human player move.
 
         Args:
@@ -125,6 +233,10 @@ class GameServer(pb.Root):
             player: The symbol (X or O).
             row: The row.
             col: The column.
+            traceId (Optional[str]): The trace id of the move, given by
+                a client which traces its moves; it is ignored unless the
+                server traces the moves, and replaced with a new one if
+                missing or not 1 to 32 letters and digits.
 
         Returns:
             The status of the game board.
@@ -138,19 +250,30 @@ class GameServer(pb.Root):
 
         guid = uuid.UUID(gameGuid)
 
-        self.log.info("Invoking remote_makeMove with:\
-            %s, %s, %d, %d" % (guid, player, row, col))
+        if not tracer.enabled:
+            traceId = None
+        elif not isTraceId(traceId):
+            traceId = newTraceId()
+        tracer.span(traceId, 'server.received', game=gameGuid)
+
+        self.log.info('Invoking remote_makeMove with: {guid!s}, {player}, '
+                      '{row}, {col}', guid=guid, player=player, row=row,
+                      col=col)
 
-        g = self._games[guid]
+        g = self._games.get(guid)
         if g is None:
             raise LookupError('remote_makeMove: \
                 no such game with guid: %s' % (bytes(gameGuid)))
 
-        self.log.debug('remote_makeMove:\
-            place a \'%s\' at (%d, %d)' % (player, row, col))
+        self.reaper.touch(g)
+
+        self.log.debug('remote_makeMove: place a {player} at ({row}, '
+                       '{col})', player=player, row=row, col=col)
 
         try:
-            gameStatus = g.makeMove(row, col, player)
+            t0 = time.time()
+            gameStatus = g.makeMove(row, col, player, traceId)
+            MAKE_MOVE.observe(time.time() - t0)
 
             self.log.debug('gameStatus: {status!s}',
                            status=gameStatus)
@@ -158,8 +281,9 @@ class GameServer(pb.Root):
             # convert to the sender game protocol
             copyGameStatus = CopyGameStatus(gameStatus)
 
-            self.log.debug('remote_makeMove returns: {data!s}',
-                           data=copyGameStatus.data)
+            self.log.debug('remote_makeMove returns: {changes!r}',
+                           changes=copyGameStatus.changes)
+            tracer.span(traceId, 'server.replied')
 
             return copyGameStatus
 
@@ -167,6 +291,149 @@ class GameServer(pb.Root):
             self.log.failure('Exception caught: {msg}', msg=e.message)
             raise e
 
+    def remote_makeMoves(self, moves):
+        """Handles a batch of human player moves, of one or many games.
+
+        Each GUID is parsed once per batch. A move which fails does not
+        fail the batch: its status carries an error code, with the turn,
+        the status and the version of its game (None if the game is not
+        known).
+
+        Args:
+            moves (list[tuple]): The (gameGuid, player, row, col) moves.
+
+        Returns:
+            list[common.ipc.CopyGameStatus]: The status of each move, in
+                the order of the moves; the error is Errors.NoSuchGame
+                for an unknown game and Errors.InvalidMove for a
+                malformed move.
+
+        """
+        self.log.debug('remote_makeMoves: {count} moves', count=len(moves))
+
+        games = {}
+        results = []
+        for move in moves:
+            g = None
+            try:
+                gameGuid, player, row, col = move
+
+                if gameGuid not in games:
+                    games[gameGuid] = self._games.get(uuid.UUID(gameGuid))
+
+                g = games[gameGuid]
+                if g is None:
+                    gameStatus = GameStatus(error=Errors.NoSuchGame)
+                else:
+                    self.reaper.touch(g)
+                    t0 = time.time()
+                    gameStatus = g.makeMove(row, col, player)
+                    MAKE_MOVE.observe(time.time() - t0)
+
+            except (AttributeError, IndexError, TypeError, ValueError), e:
+                self.log.warn('remote_makeMoves: invalid move {move!r} '
+                              '({e})', move=move, e=e)
+                if g is None:
+                    gameStatus = GameStatus(error=Errors.InvalidMove)
+                else:
+                    gameStatus = g.statusSince(g.version)
+                    gameStatus.error = Errors.InvalidMove
+
+            results.append(CopyGameStatus(gameStatus))
+
+        return results
+
+    def remote_makeTurn(self, gameGuid, player, row, col):
+        """Handles a human player move and replies with the AI move.
+
+        The opt-in, combined version of remote_makeMove: the response
+        carries both moves and the status of the game after the AI reply,
+        which is then not pushed to the listeners.
+
+        Args:
+            gameGuid: The GUID of the game.
+            player: The symbol (X or O).
+            row: The row.
+            col: The column.
+
+        Returns:
+            Deferred: Fires with a common.ipc.CopyTurnStatus.
+
+        Raises:
+            ValueError, LookupError.
+
+        """
+        if gameGuid is None:
+            raise ValueError('remote_makeTurn: gameGuid is None')
+
+        guid = uuid.UUID(gameGuid)
+
+        g = self._games.get(guid)
+        if g is None:
+            raise LookupError('remote_makeTurn: \
+                no such game with guid: %s' % (bytes(gameGuid)))
+
+        self.reaper.touch(g)
+
+        self.log.debug('remote_makeTurn: place a {player} at ({row}, '
+                       '{col})', player=player, row=row, col=col)
+
+        return g.makeTurn(row, col, player)
+
+    def remote_takeback(self, gameGuid, player):
+        """Takes back the last move of the human player of a game.
+
+        The AI reply to that move is taken back as well (see
+        model.game.Game.takeback).
+
+        Args:
+            gameGuid: The GUID of the game.
+            player (int): The symbol of the human player.
+
+        Returns:
+            common.ipc.CopyGameStatus: The status of the game, with the
+                cells cleared; its error is Errors.NoMoveToTakeBack if the
+                player has no move on the board.
+
+        Raises:
+            LookupError.
+
+        """
+        g = self._games.get(uuid.UUID(gameGuid))
+        if g is None:
+            raise LookupError('remote_takeback: \
+                no such game with guid: %s' % (bytes(gameGuid)))
+
+        self.reaper.touch(g)
+
+        return CopyGameStatus(g.takeback(player))
+
+    def remote_getStatus(self, gameGuid, version=None):
+        """Gets the status of a game.
+
+        A client which missed a status (see common.ipc.applyStatus) asks
+        for the changes since the version of its copy of the board.
+
+        Args:
+            gameGuid: The GUID of the game.
+            version (Optional[int]): The version of the client's copy of
+                the board; None asks for a snapshot of the board.
+
+        Returns:
+            common.ipc.CopyGameStatus: The changes since ``version``, or
+                the whole board.
+
+        Raises:
+            LookupError.
+
+        """
+        g = self._games.get(uuid.UUID(gameGuid))
+        if g is None:
+            raise LookupError('remote_getStatus: \
+                no such game with guid: %s' % (bytes(gameGuid)))
+
+        return CopyGameStatus(g.statusSince(version))
+
     def remote_isLegalMove(self, gameGuid, player, row, col):
         """
         """
@@ -0,0 +1,191 @@
+# -------------------------------------
+# reaper.py
+# Evicts the finished and the idle games.
+# -------------------------------------
+
+import math
+import uuid
+
+from twisted.internet import reactor, task
+from twisted.logger import Logger
+
+from model.events import Events, router
+
+
+class TimerWheel(object):
+    """A hashed timer wheel.
+
+    The time is cut in ticks and a key is due at a tick number; the keys
+    are kept in a fixed ring of slots (tick modulo the number of slots),
+    so scheduling and advancing cost the same whatever the number of
+    timers. A key scheduled again is simply due at its new tick: the
+    entry left in the old slot is dropped when that slot is visited.
+
+    Attributes:
+        tick (float): The duration of a tick, in seconds.
+    """
+
+    def __init__(self, tick=1.0, slots=64):
+        """
+        Args:
+            tick (Optional[float]): The duration of a tick, in seconds.
+            slots (Optional[int]): The number of slots of the ring.
+        """
+        self.tick = tick
+        self._slots = [set() for _ in xrange(slots)]
+        self._due = {}
+        self._now = 0
+
+    def __len__(self):
+        """The number of scheduled keys."""
+        return len(self._due)
+
+    def schedule(self, key, delay):
+        """Makes a key due after a delay (at least one tick).
+
+        Args:
+            key: A hashable key.
+            delay (float): The delay, in seconds.
+
+        """
+        due = self._now + max(1, int(math.ceil(delay / self.tick)))
+        self._due[key] = due
+        self._slots[due % len(self._slots)].add(key)
+
+    def cancel(self, key):
+        """Unschedules a key."""
+        self._due.pop(key, None)
+
+    def advance(self):
+        """Moves the wheel one tick forward.
+
+        Returns:
+            list: The keys which are due.
+
+        """
+        self._now += 1
+        index = self._now % len(self._slots)
+        slot = self._slots[index]
+
+        expired = []
+        for key in list(slot):
+            due = self._due.get(key)
+            if due == self._now:
+                expired.append(key)
+                del self._due[key]
+                slot.discard(key)
+            elif due is None or due % len(self._slots) != index:
+                # cancelled or scheduled again in another slot
+                slot.discard(key)
+
+        return expired
+
+
+class GameReaper(object):
+    """Evicts the games which are over or which nobody plays any more.
+
+    A finished game is kept for a grace period, so the client can still
+    read its final status, and a game in progress is evicted when no move
+    was made during the idle TTL. An evicted game is removed from the map
+    of the server and closed, which stops its AI player and releases its
+    event subscribers.
+
+    Attributes:
+        finishedGrace (float): The seconds a finished game is kept.
+        idleTtl (float): The seconds a game may stay without moves.
+        evicted (int): The number of games evicted so far.
+    """
+
+    log = Logger()
+
+    # the clock of the timers and of the moves
+    clock = reactor
+
+    def __init__(self, games, finishedGrace=60, idleTtl=1800, tick=1.0):
+        """
+        Args:
+            games (dict): The games of the server, by UUID.
+            finishedGrace (Optional[float]): The seconds a finished game
+                is kept.
+            idleTtl (Optional[float]): The seconds a game may stay
+                without moves.
+            tick (Optional[float]): The resolution of the timers, in
+                seconds.
+        """
+        self.finishedGrace = finishedGrace
+        self.idleTtl = idleTtl
+        self.evicted = 0
+
+        self._games = games
+        self._wheel = TimerWheel(tick)
+        self._lastSeen = {}
+        self._loop = task.LoopingCall(self._tick)
+
+    def start(self):
+        """Starts the timers."""
+        self._loop.clock = self.clock
+        self._loop.start(self._wheel.tick, now=False)
+
+    def stop(self):
+        """Stops the timers."""
+        if self._loop.running:
+            self._loop.stop()
+
+    def add(self, game):
+        """Starts watching a new game."""
+        self._lastSeen[game.uuid] = self.clock.seconds()
+        self._wheel.schedule(game.uuid, self.idleTtl)
+        router.connect(self._onQuit, Events.quit, game.uuid)
+
+    def touch(self, game):
+        """Records a move of a game.
+
+        Only the time is recorded: the timer is moved forward when it
+        expires.
+        """
+        if game.uuid in self._lastSeen:
+            self._lastSeen[game.uuid] = self.clock.seconds()
+
+    def forget(self, gameUuid):
+        """Stops watching a game removed by the server itself."""
+        self._lastSeen.pop(gameUuid, None)
+        self._wheel.cancel(gameUuid)
+
+    def _onQuit(self, uuid):
+        """Handler for the signal Events.quit: the game is over."""
+        gameUuid = _toUuid(uuid)
+        if gameUuid in self._lastSeen:
+            self._wheel.schedule(gameUuid, self.finishedGrace)
+
+    def _tick(self):
+        now = self.clock.seconds()
+        for gameUuid in self._wheel.advance():
+            game = self._games.get(gameUuid)
+            if game is None:
+                self.forget(gameUuid)
+                continue
+
+            if not game.isGameOver():
+                idle = now - self._lastSeen.get(gameUuid, now)
+                if idle < self.idleTtl:
+                    # moves were made since the timer was set
+                    self._wheel.schedule(gameUuid, self.idleTtl - idle)
+                    continue
+
+            self._evict(gameUuid, game)
+
+    def _evict(self, gameUuid, game):
+        self.log.info('Evicting the game {uuid} ({reason})', uuid=gameUuid,
+                      reason='over' if game.isGameOver() else 'idle')
+
+        del self._games[gameUuid]
+        self.forget(gameUuid)
+        self.evicted += 1
+        game.close()
+
+
+def _toUuid(value):
+    if isinstance(value, uuid.UUID):
+        return value
+
+    return uuid.UUID(str(value))
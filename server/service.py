@@ -1,16 +1,139 @@
+import os
 import sys
 from twisted.spread import pb
 from twisted.internet import reactor
-from twisted.python import log
+from twisted.python import log, usage
+from twisted.web import resource, server
 from game_server import GameServer
+from ai import logsink, tablebase
+from ai.protocols import aiprotocol
+from ai.protocols.aipool import AiWorkerPool
+from ai.protocols.aiprotocol import AiSpareProcesses
+from common import logs
+from common.metrics import MetricsResource
+from common.tracing import tracer
+
+
+class Options(usage.Options):
+    """The command line options of the game service."""
+
+    optParameters = [
+        ['ai-workers', None, 4,
+         'The number of AI processes shared by the games '
+         '(0 gives every game an AI process of its own).', int],
+        ['ai-spares', None, 2,
+         'The number of AI processes started ahead of the games, when '
+         'every game has an AI process of its own.', int],
+        ['tt-size', None, 16,
+         'The memory budget of the transposition table of each AI '
+         'process, in MB.', int],
+        ['search-workers', None, 1,
+         'The processes each AI process splits its searches across (1 '
+         'searches in the AI process).', int],
+        ['finished-grace', None, 60,
+         'The seconds a finished game is kept before it is evicted.',
+         float],
+        ['idle-ttl', None, 1800,
+         'The seconds a game may stay without moves before it is evicted.',
+         float],
+        ['max-time-limit', None, 10.0,
+         'The longest time budget of an AI move a client may ask for, in '
+         'seconds.', float],
+        ['max-playouts', None, 100000,
+         'The most MCTS playouts of an AI move a client may ask for.',
+         int],
+        ['metrics-port', None, 8790,
+         'The local HTTP port of the Prometheus metrics (0 disables '
+         'them).', int],
+        ['log-levels', None, '',
+         'The log levels of the subsystems, e.g. model=debug/100,ai=warn '
+         '(debug/N emits one debug event in N); they may be changed at '
+         'runtime on http://127.0.0.1:<metrics-port>/logs.'],
+        ['ai-log-file', None,
+         os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                      'logs', 'aiprocesses.log'),
+         'The rotating file the logs of the AI processes are written to.'],
+        ['ai-log-level', None, 'info',
+         'The least level of the log events of the AI processes.'],
+        ['trace-file', None, None,
+         'Traces the moves: the spans of the game server and of the AI '
+         'processes are appended to this file (see common/tracing.py).'],
+    ]
+
+    def postOptions(self):
+        if self['max-time-limit'] <= 0:
+            raise usage.UsageError('Bad maximum time limit: %r' %
+                                   (self['max-time-limit']))
+
+        if self['max-playouts'] <= 0:
+            raise usage.UsageError('Bad maximum playouts: %r' %
+                                   (self['max-playouts']))
+
+        try:
+            logs.configure(self['log-levels'])
+        except ValueError, e:
+            raise usage.UsageError(str(e))
 
 
 if __name__ == '__main__':
+    options = Options()
+    options.parseOptions()
+
     log.startLogging(sys.stdout)
 
+    # the AI processes map the 3x3 tablebase: build it once, up front
+    tablebase.ensure()
+
+    log.msg('Writing the AI process logs to {0}'.format(
+        os.path.abspath(options['ai-log-file'])))
+    logsink.sink.open(options['ai-log-file'])
+    reactor.addSystemEventTrigger('before', 'shutdown', logsink.sink.close)
+
+    aiArgs = ['--tt-size', str(options['tt-size']),
+              '--log-level', options['ai-log-level'],
+              '--search-workers', str(options['search-workers'])]
+    if options['trace-file']:
+        traceFile = os.path.abspath(options['trace-file'])
+        log.msg('Tracing the moves to {0}'.format(traceFile))
+        tracer.open(traceFile)
+        aiArgs += ['--trace-file', traceFile]
+
+    aiPool = None
+    if options['ai-workers'] > 0:
+        log.msg('Starting {0:d} AI processes'.format(options['ai-workers']))
+        aiPool = AiWorkerPool(options['ai-workers'],
+                              aiprotocol.scriptPath(), *aiArgs)
+    elif options['ai-spares'] > 0:
+        log.msg('Keeping {0:d} spare AI processes'.format(
+            options['ai-spares']))
+        aiPool = AiSpareProcesses(options['ai-spares'],
+                                  aiprotocol.scriptPath(), *aiArgs)
+
+    if aiPool is not None:
+        aiPool.start()
+        reactor.addSystemEventTrigger('before', 'shutdown', aiPool.stop)
+
     log.msg('Initializing the server factory')
-    server_factory = pb.PBServerFactory(GameServer())
+    gameServer = GameServer(aiPool,
+                            finishedGrace=options['finished-grace'],
+                            idleTtl=options['idle-ttl'],
+                            maxTimeLimit=options['max-time-limit'],
+                            maxPlayouts=options['max-playouts'])
+    gameServer.reaper.start()
+    reactor.addSystemEventTrigger('before', 'shutdown',
+                                  gameServer.reaper.stop)
+
+    server_factory = pb.PBServerFactory(gameServer)
     reactor.listenTCP(8789, server_factory)
 
+    if options['metrics-port'] > 0:
+        log.msg('Serving the metrics on port {0:d}'.format(
+            options['metrics-port']))
+        root = resource.Resource()
+        root.putChild('metrics', MetricsResource())
+        root.putChild('logs', logs.LogsResource())
+        reactor.listenTCP(options['metrics-port'], server.Site(root),
+                          interface='127.0.0.1')
+
     log.msg('The game service is listening for requests')
     reactor.run()
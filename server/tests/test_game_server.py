@@ -0,0 +1,114 @@
+# -------------------------------------
+# test_game_server.py
+# -------------------------------------
+
+import uuid
+
+from twisted.trial import unittest
+
+from common.constants import Engine, Errors, PlayerType, Status, Symbol
+from common.ipc import CopyGameStatus, GameStatus
+from model.game import Game
+from model.player import Player
+from server.game_server import GameServer
+
+
+def received(copyGameStatus):
+    """Returns a status as a client receives it (through common.wire)."""
+    status = CopyGameStatus(GameStatus())
+    status.setCopyableState(copyGameStatus.getStateToCopy())
+    return status
+
+
+class MakeMovesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = GameServer()
+        # the game is not started: no AI player answers its moves
+        self.game = Game.create(Player(PlayerType.Human, Symbol.X),
+                                Player(PlayerType.Ai, Symbol.O))
+        self.server._games[self.game.uuid] = self.game
+        self.server.reaper.add(self.game)
+        self.guid = bytes(self.game.uuid)
+
+    def test_mixedBatch(self):
+        statuses = self.server.remote_makeMoves([
+            (self.guid, Symbol.X, 1, 1),
+            (bytes(uuid.uuid4()), Symbol.X, 0, 0),
+            (self.guid, Symbol.X, 7, 0),
+            (self.guid, Symbol.X),
+            (self.guid, Symbol.X, 0, 0),
+        ])
+        results = [received(status) for status in statuses]
+
+        move, noSuchGame, outOfRange, malformed, wrongTurn = results
+
+        self.assertEqual(move.error, Errors.NoError)
+        self.assertEqual(move.changes, [(4, Symbol.X)])
+        self.assertEqual(move.version, 1)
+        self.assertEqual(move.turn, Symbol.O)
+        self.assertEqual(move.status, Status.InProgress)
+
+        # no game: no turn nor status, not a finished tie
+        self.assertEqual(noSuchGame.error, Errors.NoSuchGame)
+        self.assertIsNone(noSuchGame.turn)
+        self.assertIsNone(noSuchGame.status)
+        self.assertIsNone(noSuchGame.version)
+
+        # a malformed move of a known game carries the game's state
+        self.assertEqual(outOfRange.error, Errors.InvalidMove)
+        self.assertEqual(outOfRange.turn, Symbol.O)
+        self.assertEqual(outOfRange.status, Status.InProgress)
+        self.assertEqual(outOfRange.version, 1)
+        self.assertEqual(outOfRange.changes, [])
+
+        # a move which cannot be read has no game
+        self.assertEqual(malformed.error, Errors.InvalidMove)
+        self.assertIsNone(malformed.turn)
+        self.assertIsNone(malformed.status)
+
+        self.assertEqual(wrongTurn.error, Errors.WrongTurn)
+        self.assertEqual(wrongTurn.turn, Symbol.O)
+        self.assertEqual(wrongTurn.status, Status.InProgress)
+
+
+class RecordingPool(object):
+    """An AI pool which records the games attached to it."""
+
+    def __init__(self):
+        self.games = []
+
+    def attach(self, gameUuid, symbol, depth, **kwargs):
+        self.games.append(kwargs)
+
+
+class CreateGameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = RecordingPool()
+        self.server = GameServer(self.pool, maxTimeLimit=5.0,
+                                 maxPlayouts=1000)
+
+    def createGame(self, **kwargs):
+        self.server.remote_createGame(Symbol.X, PlayerType.Human,
+                                      Symbol.O, PlayerType.Ai, **kwargs)
+        return self.pool.games[-1]
+
+    def test_budgetsCutDown(self):
+        game = self.createGame(timeLimit=3600.0, engine=Engine.Mcts,
+                               playouts=10 ** 9)
+        self.assertEqual(game['timeLimit'], 5.0)
+        self.assertEqual(game['playouts'], 1000)
+
+    def test_budgetsKept(self):
+        game = self.createGame(timeLimit=1.5, engine=Engine.Mcts, playouts=500)
+        self.assertEqual(game['timeLimit'], 1.5)
+        self.assertEqual(game['playouts'], 500)
+
+    def test_badTimeLimit(self):
+        self.assertRaises(ValueError, self.createGame, timeLimit=0)
+
+    def test_boardTooLarge(self):
+        self.assertRaises(ValueError, self.createGame, boardSize=150)
+        self.assertEqual(self.pool.games, [])
+        self.assertEqual(len(self.server._games), 0)
@@ -0,0 +1,161 @@
+# -------------------------------------
+# test_reaper.py
+# -------------------------------------
+
+import uuid
+
+from twisted.internet import task
+from twisted.trial import unittest
+
+from model.events import Events, router
+from server.reaper import GameReaper, TimerWheel
+
+
+class FakeGame(object):
+
+    def __init__(self):
+        self.uuid = uuid.uuid4()
+        self.over = False
+        self.closed = False
+
+    def isGameOver(self):
+        return self.over
+
+    def close(self):
+        self.closed = True
+        router.release(self.uuid)
+
+
+class TimerWheelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wheel = TimerWheel(tick=0.5, slots=4)
+
+    def advance(self, ticks):
+        """The keys due at each of the next ticks."""
+        return [self.wheel.advance() for _ in xrange(ticks)]
+
+    def test_delayInTicks(self):
+        # 1.2 s is 2.4 ticks: due at the third tick
+        self.wheel.schedule('a', 1.2)
+        self.assertEqual(self.advance(3), [[], [], ['a']])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_atLeastOneTick(self):
+        self.wheel.schedule('a', 0)
+        self.assertEqual(self.advance(1), [['a']])
+
+    def test_wrapAround(self):
+        # due at tick 6, in the slot visited at tick 2 already
+        self.wheel.schedule('a', 3.0)
+        self.assertEqual(self.advance(6), [[], [], [], [], [], ['a']])
+
+    def test_scheduleAgain(self):
+        self.wheel.schedule('a', 0.5)
+        self.wheel.schedule('a', 1.5)
+        self.assertEqual(len(self.wheel), 1)
+
+        self.assertEqual(self.advance(1), [[]])
+        # the entry of the first tick is dropped from its slot
+        self.assertEqual(self.wheel._slots[1], set())
+        self.assertEqual(self.advance(2), [[], ['a']])
+
+    def test_cancel(self):
+        self.wheel.schedule('a', 0.5)
+        self.wheel.schedule('b', 0.5)
+        self.wheel.cancel('a')
+        self.wheel.cancel('c')
+
+        self.assertEqual(len(self.wheel), 1)
+        self.assertEqual(self.advance(1), [['b']])
+        self.assertEqual(self.wheel._slots[1], set())
+
+
+class GameReaperTest(unittest.TestCase):
+
+    def setUp(self):
+        self.games = {}
+        self.reaper = GameReaper(self.games, finishedGrace=5, idleTtl=30)
+        self.reaper.clock = self.clock = task.Clock()
+        self.reaper.start()
+        self.addCleanup(self.reaper.stop)
+
+        self.game = FakeGame()
+        self.games[self.game.uuid] = self.game
+        self.reaper.add(self.game)
+        self.addCleanup(router.release, self.game.uuid)
+
+    def wait(self, seconds):
+        self.clock.pump([1] * seconds)
+
+    def assertKept(self):
+        self.assertIn(self.game.uuid, self.games)
+        self.assertFalse(self.game.closed)
+        self.assertEqual(self.reaper.evicted, 0)
+
+    def assertEvicted(self):
+        self.assertNotIn(self.game.uuid, self.games)
+        self.assertTrue(self.game.closed)
+        self.assertEqual(self.reaper.evicted, 1)
+        self.assertEqual(len(self.reaper._wheel), 0)
+
+    def test_idle(self):
+        self.wait(29)
+        self.assertKept()
+
+        self.wait(1)
+        self.assertEvicted()
+
+    def test_touch(self):
+        self.wait(20)
+        self.reaper.touch(self.game)
+
+        # the timer expires, and is moved to 30 s after the move
+        self.wait(10)
+        self.assertKept()
+        self.wait(19)
+        self.assertKept()
+
+        self.wait(1)
+        self.assertEvicted()
+
+    def test_finished(self):
+        self.wait(10)
+        self.game.over = True
+        router.send(Events.quit, str(self.game.uuid))
+
+        # the grace period, not the idle TTL
+        self.wait(4)
+        self.assertKept()
+        self.wait(1)
+        self.assertEvicted()
+
+    def test_finishedWithoutQuit(self):
+        # the idle timer finds the game over: no moves are waited for
+        self.wait(10)
+        self.game.over = True
+        self.reaper.touch(self.game)
+
+        self.wait(19)
+        self.assertKept()
+        self.wait(1)
+        self.assertEvicted()
+
+    def test_quitInProgress(self):
+        # a game in progress is kept until it is idle, quit or not
+        router.send(Events.quit, self.game.uuid)
+        self.wait(5)
+        self.assertKept()
+
+        self.wait(25)
+        self.assertEvicted()
+
+    def test_forget(self):
+        del self.games[self.game.uuid]
+        self.reaper.forget(self.game.uuid)
+        router.send(Events.quit, self.game.uuid)
+
+        self.wait(60)
+        self.assertFalse(self.game.closed)
+        self.assertEqual(self.reaper.evicted, 0)
+        self.assertEqual(len(self.reaper._wheel), 0)